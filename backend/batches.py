@@ -0,0 +1,179 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone
+
+import stats
+from d1 import fetch_one, fetch_all, batch
+from jobs import dispatch_job, dispatch_group
+from probe import get_probes, check_limits
+
+MAX_BATCH_ENTRIES = 500
+MAX_PROJECT_NAME_LEN = 200
+DISPATCH_CONCURRENCY = 16  # Concurrent Modal spawn calls per batch submission
+PIPELINE_STEPS = 5
+
+
+async def validate_manifest(user_id: str, entries: list[dict]) -> list[str]:
+    """Validate every manifest entry in one pass. Returns a list of errors (empty if valid)."""
+    errors = []
+    if not entries:
+        return ["Manifest is empty"]
+    if len(entries) > MAX_BATCH_ENTRIES:
+        return [f"Manifest has {len(entries)} entries; the limit is {MAX_BATCH_ENTRIES}"]
+
+    upload_prefix = f"uploads/{user_id}/"
+    for i, entry in enumerate(entries):
+        if not entry["file_key"].startswith(upload_prefix):
+            errors.append(f"entries[{i}]: file_key does not belong to this account")
+        if not entry["target_languages"]:
+            errors.append(f"entries[{i}]: at least one target language is required")
+        if len(entry.get("project_name") or "") > MAX_PROJECT_NAME_LEN:
+            errors.append(f"entries[{i}]: project_name is longer than {MAX_PROJECT_NAME_LEN} characters")
+
+    # Reject over-limit media up front using the probes stored at upload time
+    probes = await get_probes([e["file_key"] for e in entries], user_id)
+    for i, entry in enumerate(entries):
+        probe = probes.get(entry["file_key"])
+        reason = check_limits(probe)
+        if reason:
+            errors.append(f"entries[{i}]: {reason}")
+        entry["duration_sec"] = probe.get("duration_sec") if probe else None
+
+    # One query for every referenced preset instead of one per entry
+    preset_ids = sorted({e["voice_preset_id"] for e in entries if e.get("voice_preset_id")})
+    if preset_ids:
+        placeholders = ", ".join("?" for _ in preset_ids)
+        rows = await fetch_all(
+            f"SELECT voice_preset_id, status FROM voice_presets "
+            f"WHERE user_id = ? AND voice_preset_id IN ({placeholders})",
+            [user_id, *preset_ids],
+        )
+        ready = {r["voice_preset_id"] for r in rows if r["status"] == "READY"}
+        for i, entry in enumerate(entries):
+            if entry.get("voice_preset_id") and entry["voice_preset_id"] not in ready:
+                errors.append(f"entries[{i}]: voice preset {entry['voice_preset_id']} is missing or not READY")
+
+    return errors
+
+
+async def create_batch(user_id: str, entries: list[dict]) -> dict:
+    """Insert every job of a validated manifest in a single D1 batch, then dispatch them.
+
+    Entries with several target languages become a job group so their source
+    is downloaded and transcribed once.
+    """
+    batch_id = f"b{uuid.uuid4().hex[:12]}"
+    now = datetime.now(timezone.utc).isoformat()
+
+    # Checkpoint paths for the presets referenced by the manifest (already validated as READY)
+    preset_ids = sorted({e["voice_preset_id"] for e in entries if e.get("voice_preset_id")})
+    checkpoints = {}
+    if preset_ids:
+        placeholders = ", ".join("?" for _ in preset_ids)
+        rows = await fetch_all(
+            f"SELECT voice_preset_id, checkpoint_volume_path FROM voice_presets "
+            f"WHERE user_id = ? AND voice_preset_id IN ({placeholders})",
+            [user_id, *preset_ids],
+        )
+        checkpoints = {r["voice_preset_id"]: r["checkpoint_volume_path"] for r in rows}
+
+    statements = []
+    dispatches = []
+    total_jobs = 0
+    for entry in entries:
+        file_key = entry["file_key"]
+        project_name = entry.get("project_name")
+        voice_preset_id = entry.get("voice_preset_id")
+        checkpoint_volume_path = checkpoints.get(voice_preset_id)
+
+        group_id = None
+        if len(entry["target_languages"]) > 1:
+            group_id = f"{batch_id}-g{uuid.uuid4().hex[:8]}"
+            statements.append((
+                "INSERT INTO job_groups (group_id, user_id, source_key, created_at) VALUES (?, ?, ?, ?)",
+                [group_id, user_id, file_key, now],
+            ))
+
+        children = []
+        for target_language in entry["target_languages"]:
+            job_id = f"{batch_id}-{uuid.uuid4().hex[:8]}"
+            statements.append((
+                "INSERT INTO jobs (job_id, user_id, status, source_key, output_key, target_language,"
+                " project_name, group_id, batch_id, duration_sec, created_at)"
+                " VALUES (?, ?, 'PENDING', ?, NULL, ?, ?, ?, ?, ?, ?)",
+                [job_id, user_id, file_key, target_language, project_name, group_id, batch_id,
+                 entry.get("duration_sec"), now],
+            ))
+            children.append({"job_id": job_id, "target_language": target_language})
+        total_jobs += len(children)
+
+        if group_id:
+            dispatches.append(("job_groups", "group_id", group_id, dispatch_group,
+                               (group_id, file_key, children, voice_preset_id, checkpoint_volume_path)))
+        else:
+            child = children[0]
+            dispatches.append(("jobs", "job_id", child["job_id"], dispatch_job,
+                               (child["job_id"], file_key, child["target_language"], voice_preset_id, checkpoint_volume_path)))
+
+    statements.insert(0, (
+        "INSERT INTO job_batches (batch_id, user_id, total_jobs, created_at) VALUES (?, ?, ?, ?)",
+        [batch_id, user_id, total_jobs, now],
+    ))
+    await batch(statements)
+    await stats.record(stats.transition(None, "PENDING", count=total_jobs))
+
+    # Hand everything to the pipeline dispatcher without serializing 500 Modal round trips
+    semaphore = asyncio.Semaphore(DISPATCH_CONCURRENCY)
+
+    async def _bounded(func, args):
+        async with semaphore:
+            return await func(*args)
+
+    call_ids = await asyncio.gather(*(_bounded(func, args) for _, _, _, func, args in dispatches))
+
+    # Persist the FunctionCall ids (needed for cancellation) in one more batch
+    updates = [
+        (f"UPDATE {table} SET modal_call_id = ? WHERE {id_column} = ?", [call_id, row_id])
+        for (table, id_column, row_id, _, _), call_id in zip(dispatches, call_ids)
+        if call_id
+    ]
+    if updates:
+        await batch(updates)
+
+    return {"batch_id": batch_id, "total_jobs": total_jobs, "created_at": now}
+
+
+async def get_batch(batch_id: str, user_id: str) -> dict | None:
+    return await fetch_one(
+        "SELECT * FROM job_batches WHERE batch_id = ? AND user_id = ?",
+        [batch_id, user_id],
+    )
+
+
+async def list_batch_jobs(batch_id: str, user_id: str) -> list[dict]:
+    return await fetch_all(
+        "SELECT job_id, status, step, target_language, project_name, group_id, output_key, error"
+        " FROM jobs WHERE batch_id = ? AND user_id = ? ORDER BY job_id",
+        [batch_id, user_id],
+    )
+
+
+def summarize_batch(jobs: list[dict]) -> dict:
+    """Aggregate per-status counts and an overall 0-1 progress figure for a batch."""
+    counts = {"PENDING": 0, "PROCESSING": 0, "COMPLETED": 0, "FAILED": 0, "CANCELLED": 0}
+    progress = 0.0
+    for job in jobs:
+        counts[job["status"]] = counts.get(job["status"], 0) + 1
+        if job["status"] in ("COMPLETED", "FAILED", "CANCELLED"):
+            progress += 1.0
+        elif job.get("step"):
+            # Step N is active, so N-1 steps are done
+            progress += (job["step"] - 1) / PIPELINE_STEPS
+    total = len(jobs)
+    finished = counts["COMPLETED"] + counts["FAILED"] + counts["CANCELLED"]
+    return {
+        "total": total,
+        "counts": counts,
+        "progress": round(progress / total, 4) if total else 0.0,
+        "done": total > 0 and finished == total,
+    }
@@ -25,6 +25,18 @@ async def _query(sql: str, params: list = None) -> list[dict]:
     return data["result"][0]["results"]
 
 
+async def batch(statements: list[tuple[str, list]]) -> list[list[dict]]:
+    """Run several statements in one D1 request, atomically. Returns each statement's rows."""
+    body = {"batch": [{"sql": sql, "params": params or []} for sql, params in statements]}
+    async with httpx.AsyncClient(timeout=60) as client:
+        resp = await client.post(_URL, headers=_HEADERS, json=body)
+    resp.raise_for_status()
+    data = resp.json()
+    if not data.get("success"):
+        raise RuntimeError(f"D1 error: {data.get('errors')}")
+    return [r["results"] for r in data["result"]]
+
+
 async def fetch_one(sql: str, params: list = None) -> dict | None:
     rows = await _query(sql, params)
     return rows[0] if rows else None
@@ -0,0 +1,99 @@
+from d1 import fetch_all, execute
+from state import get_state
+
+# Pipeline steps as reported by the orchestrator's step webhook
+STAGES = {1: "prepare", 2: "transcribe", 3: "translate", 4: "tts", 5: "lipsync"}
+GPU_STAGES = {2, 4, 5}
+SHARED_STAGES = {1, 2}  # Run once per job group, not once per language
+
+# Priors used until a stage has MIN_SAMPLES of history:
+# seconds = fixed overhead (cold start, model load) + per-second-of-video cost
+DEFAULT_FIT = {
+    1: (5.0, 0.05),
+    2: (30.0, 0.15),
+    3: (3.0, 0.02),
+    4: (40.0, 0.8),
+    5: (60.0, 3.0),
+}
+MIN_SAMPLES = 5
+FIT_CACHE_TTL = 300
+
+
+async def record_stage_timing(stage: int, video_seconds: float, seconds: float):
+    """Fold one observed stage duration into that stage's running least-squares sums."""
+    if stage not in STAGES or not video_seconds or seconds < 0:
+        return
+    await execute(
+        "INSERT INTO stage_timing_fits (stage, n, sum_x, sum_y, sum_xx, sum_xy) VALUES (?, 1, ?, ?, ?, ?)"
+        " ON CONFLICT(stage) DO UPDATE SET n = n + 1, sum_x = sum_x + excluded.sum_x,"
+        " sum_y = sum_y + excluded.sum_y, sum_xx = sum_xx + excluded.sum_xx, sum_xy = sum_xy + excluded.sum_xy",
+        [stage, video_seconds, seconds, video_seconds * video_seconds, video_seconds * seconds],
+    )
+
+
+async def _stage_fits() -> dict[int, tuple[float, float]]:
+    """(fixed, per_video_second) per stage from history, falling back to DEFAULT_FIT."""
+    state = get_state()
+    cached = await state.cache_get("estimates:fits")
+    if cached is not None:
+        return {int(k): tuple(v) for k, v in cached.items()}
+
+    fits = dict(DEFAULT_FIT)
+    for row in await fetch_all("SELECT * FROM stage_timing_fits"):
+        n = row["n"]
+        if n < MIN_SAMPLES:
+            continue
+        denom = n * row["sum_xx"] - row["sum_x"] ** 2
+        if denom <= 0:
+            continue
+        slope = (n * row["sum_xy"] - row["sum_x"] * row["sum_y"]) / denom
+        intercept = (row["sum_y"] - slope * row["sum_x"]) / n
+        fits[row["stage"]] = (max(intercept, 0.0), max(slope, 0.0))
+
+    await state.cache_set("estimates:fits", fits, ttl=FIT_CACHE_TTL)
+    return fits
+
+
+def _stage_seconds(fits: dict, stage: int, video_seconds: float) -> float:
+    fixed, rate = fits[stage]
+    return fixed + rate * video_seconds
+
+
+async def estimate_job(video_seconds: float | None, num_languages: int = 1) -> dict | None:
+    """Predicted GPU-seconds and wall-clock ETA for dubbing a video.
+
+    For a job group the shared stages are counted once and the per-language
+    stages run in parallel, so they add GPU time but not wall-clock time.
+    """
+    if not video_seconds:
+        return None
+    fits = await _stage_fits()
+    stages = {STAGES[s]: round(_stage_seconds(fits, s, video_seconds), 1) for s in STAGES}
+    gpu_seconds = 0.0
+    eta_seconds = 0.0
+    for s in STAGES:
+        seconds = _stage_seconds(fits, s, video_seconds)
+        copies = 1 if s in SHARED_STAGES else num_languages
+        if s in GPU_STAGES:
+            gpu_seconds += seconds * copies
+        eta_seconds += seconds
+    return {
+        "video_seconds": round(video_seconds, 2),
+        "gpu_seconds": round(gpu_seconds, 1),
+        "eta_seconds": round(eta_seconds, 1),
+        "stages": stages,
+    }
+
+
+async def estimate_remaining(job: dict, elapsed_in_step: float) -> float | None:
+    """Seconds left for a running job: the rest of the current step plus every later step."""
+    video_seconds = job.get("duration_sec")
+    if not video_seconds:
+        return None
+    fits = await _stage_fits()
+    step = job.get("step") or 0
+    if step == 0:
+        return round(sum(_stage_seconds(fits, s, video_seconds) for s in STAGES), 1)
+    remaining = max(_stage_seconds(fits, step, video_seconds) - elapsed_in_step, 0.0)
+    remaining += sum(_stage_seconds(fits, s, video_seconds) for s in STAGES if s > step)
+    return round(remaining, 1)
@@ -3,36 +3,55 @@ from datetime import datetime, timezone
 
 import modal
 
+import stats
 from d1 import fetch_one, fetch_all, execute
-from r2 import generate_download_url
+from estimates import STAGES, GPU_STAGES, record_stage_timing
+from r2 import generate_download_url, object_exists
+from state import get_state
 
 
-async def create_job(user_id: str, file_key: str, project_id: str, target_language: str, voice_preset_id: str = None) -> str:
-    job_id = f"{project_id}-{uuid.uuid4().hex[:8]}"
-    now = datetime.now(timezone.utc).isoformat()
+async def _publish(job_id: str, event: dict):
+    """Fan a job event out to every worker; SSE clients may be connected to any of them."""
+    try:
+        await get_state().publish(f"job:{job_id}", {"job_id": job_id, **event})
+    except Exception as e:
+        print(f"[warn] Could not publish event for job {job_id}: {e}")
 
-    await execute(
-        "INSERT INTO jobs (job_id, user_id, status, source_key, output_key, target_language, created_at)"
-        " VALUES (?, ?, 'PENDING', ?, NULL, ?, ?)",
-        [job_id, user_id, file_key, target_language, now],
+
+# Modal Dict shared with the orchestrator: "cancel:{job_id}" flags and
+# "calls:{job_id}" lists of child FunctionCall ids spawned for that job.
+JOB_CONTROL_DICT = "redub-job-control"
+
+
+async def _resolve_checkpoint(user_id: str, voice_preset_id: str | None) -> str | None:
+    """Return the checkpoint volume path for a READY preset, or None."""
+    if not voice_preset_id:
+        return None
+    preset = await fetch_one(
+        "SELECT checkpoint_volume_path, status FROM voice_presets "
+        "WHERE voice_preset_id = ? AND user_id = ?",
+        [voice_preset_id, user_id],
     )
+    if preset and preset.get("status") == "READY":
+        return preset["checkpoint_volume_path"]
+    return None
 
-    video_url = generate_download_url(file_key, expires=7200)
 
-    # Look up the checkpoint volume path if a preset was selected
-    checkpoint_volume_path = None
-    if voice_preset_id:
-        preset = await fetch_one(
-            "SELECT checkpoint_volume_path, status FROM voice_presets "
-            "WHERE voice_preset_id = ? AND user_id = ?",
-            [voice_preset_id, user_id],
-        )
-        if preset and preset.get("status") == "READY":
-            checkpoint_volume_path = preset["checkpoint_volume_path"]
+async def dispatch_job(
+    job_id: str,
+    file_key: str,
+    target_language: str,
+    voice_preset_id: str = None,
+    checkpoint_volume_path: str = None,
+):
+    """Spawn the Modal orchestrator for a job row that already exists in D1.
 
+    Returns the orchestrator FunctionCall id, or None if the spawn failed.
+    """
+    video_url = generate_download_url(file_key, expires=7200)
     try:
         orchestrator_func = modal.Function.from_name("redub-orchestrator", "process_video")
-        await orchestrator_func.spawn.aio(
+        call = await orchestrator_func.spawn.aio(
             job_id=job_id,
             video_url=video_url,
             target_language=target_language,
@@ -42,10 +61,115 @@ async def create_job(user_id: str, file_key: str, project_id: str, target_langua
     except Exception as e:
         # Modal app not deployed yet — job is created in DB but pipeline won't run.
         print(f"[warn] Could not spawn orchestrator for job {job_id}: {e}")
+        return None
+    return call.object_id
+
+
+async def dispatch_group(
+    group_id: str,
+    file_key: str,
+    children: list[dict],
+    voice_preset_id: str = None,
+    checkpoint_volume_path: str = None,
+):
+    """Spawn the fan-out orchestrator for a job group whose rows already exist in D1.
+
+    Returns the orchestrator FunctionCall id, or None if the spawn failed.
+    """
+    video_url = generate_download_url(file_key, expires=7200)
+    try:
+        group_func = modal.Function.from_name("redub-orchestrator", "process_video_group")
+        call = await group_func.spawn.aio(
+            group_id=group_id,
+            video_url=video_url,
+            jobs=children,
+            voice_preset_id=voice_preset_id,
+            checkpoint_volume_path=checkpoint_volume_path,
+        )
+    except Exception as e:
+        print(f"[warn] Could not spawn orchestrator for group {group_id}: {e}")
+        return None
+    return call.object_id
+
+
+async def create_job(
+    user_id: str,
+    file_key: str,
+    project_id: str,
+    target_language: str,
+    voice_preset_id: str = None,
+    duration_sec: float = None,
+) -> str:
+    job_id = f"{project_id}-{uuid.uuid4().hex[:8]}"
+    now = datetime.now(timezone.utc).isoformat()
+
+    await execute(
+        "INSERT INTO jobs (job_id, user_id, status, source_key, output_key, target_language, duration_sec, created_at)"
+        " VALUES (?, ?, 'PENDING', ?, NULL, ?, ?, ?)",
+        [job_id, user_id, file_key, target_language, duration_sec, now],
+    )
+
+    # Look up the checkpoint volume path if a preset was selected
+    checkpoint_volume_path = await _resolve_checkpoint(user_id, voice_preset_id)
+    call_id = await dispatch_job(job_id, file_key, target_language, voice_preset_id, checkpoint_volume_path)
+    if call_id:
+        await execute("UPDATE jobs SET modal_call_id = ? WHERE job_id = ?", [call_id, job_id])
+    await stats.record(stats.transition(None, "PENDING"))
 
     return job_id
 
 
+async def create_job_group(
+    user_id: str,
+    file_key: str,
+    project_id: str,
+    target_languages: list[str],
+    voice_preset_id: str = None,
+    duration_sec: float = None,
+) -> dict:
+    """Create one child job per language that share a single download/prep/transcription run."""
+    group_id = f"{project_id}-g{uuid.uuid4().hex[:8]}"
+    now = datetime.now(timezone.utc).isoformat()
+
+    await execute(
+        "INSERT INTO job_groups (group_id, user_id, source_key, created_at) VALUES (?, ?, ?, ?)",
+        [group_id, user_id, file_key, now],
+    )
+
+    children = []
+    for target_language in target_languages:
+        job_id = f"{project_id}-{uuid.uuid4().hex[:8]}"
+        await execute(
+            "INSERT INTO jobs (job_id, user_id, status, source_key, output_key, target_language, group_id,"
+            " duration_sec, created_at)"
+            " VALUES (?, ?, 'PENDING', ?, NULL, ?, ?, ?, ?)",
+            [job_id, user_id, file_key, target_language, group_id, duration_sec, now],
+        )
+        children.append({"job_id": job_id, "target_language": target_language})
+
+    checkpoint_volume_path = await _resolve_checkpoint(user_id, voice_preset_id)
+    call_id = await dispatch_group(group_id, file_key, children, voice_preset_id, checkpoint_volume_path)
+    if call_id:
+        await execute("UPDATE job_groups SET modal_call_id = ? WHERE group_id = ?", [call_id, group_id])
+    await stats.record(stats.transition(None, "PENDING", count=len(children)))
+
+    return {"group_id": group_id, "jobs": children}
+
+
+async def get_job_group(group_id: str, user_id: str) -> dict | None:
+    group = await fetch_one(
+        "SELECT * FROM job_groups WHERE group_id = ? AND user_id = ?",
+        [group_id, user_id],
+    )
+    if group is None:
+        return None
+    group["jobs"] = await fetch_all(
+        "SELECT * FROM jobs WHERE group_id = ? AND user_id = ? ORDER BY target_language",
+        [group_id, user_id],
+    )
+    return group
+
+
 async def get_job(job_id: str, user_id: str) -> dict | None:
     return await fetch_one(
         "SELECT * FROM jobs WHERE job_id = ? AND user_id = ?",
@@ -60,31 +184,223 @@ async def list_jobs(user_id: str) -> list[dict]:
     )
 
 
-async def update_job_step(job_id: str, step: int):
+def _step_seconds(row: dict | None, ended_at: datetime) -> float | None:
+    if row is None or not row.get("step") or not row.get("step_started_at"):
+        return None
+    return (ended_at - datetime.fromisoformat(row["step_started_at"])).total_seconds()
+
+
+def _step_gpu_seconds(row: dict | None, seconds: float | None) -> float:
+    return seconds if seconds and row["step"] in GPU_STAGES else 0.0
+
+
+async def _record_step_end(row: dict, seconds: float | None) -> list:
+    """Feed the duration of the step that just finished into the ETA estimator.
+
+    Returns the rollup statements for the stage, for the caller to record.
+    """
+    if seconds is None:
+        return []
+    try:
+        await record_stage_timing(row["step"], row.get("duration_sec"), seconds)
+    except Exception as e:
+        print(f"[warn] Could not record stage timing for job {row['job_id']}: {e}")
+    if row["step"] not in STAGES:
+        return []
+    return stats.observe(f"stage_{STAGES[row['step']]}_sec", seconds)
+
+
+async def update_job_step(job_id: str, step: int, metrics: dict = None):
+    """Advance a job to `step`; metrics from the step that just ended go into the rollups."""
+    now = datetime.now(timezone.utc)
+    prev = await fetch_one(
+        "SELECT job_id, status, step, step_started_at, duration_sec, created_at FROM jobs WHERE job_id = ?",
+        [job_id],
+    )
+    if prev is not None and prev["step"] == step:
+        return  # Duplicate webhook delivery
+    seconds = _step_seconds(prev, now)
     await execute(
-        "UPDATE jobs SET step = ?, status = 'PROCESSING' WHERE job_id = ?",
-        [step, job_id],
+        "UPDATE jobs SET step = ?, status = 'PROCESSING', step_started_at = ?,"
+        " gpu_seconds = COALESCE(gpu_seconds, 0) + ?"
+        " WHERE job_id = ? AND status IN ('PENDING', 'PROCESSING')",
+        [step, now.isoformat(), _step_gpu_seconds(prev, seconds), job_id],
     )
+    if prev is not None:
+        statements = await _record_step_end(prev, seconds)
+        if prev["status"] == "PENDING":
+            queue_wait = (now - datetime.fromisoformat(prev["created_at"])).total_seconds()
+            statements += stats.observe("queue_wait_sec", queue_wait, at=now)
+        if prev["status"] in ("PENDING", "PROCESSING"):
+            statements += stats.transition(prev["status"], "PROCESSING")
+        for name, value in (metrics or {}).items():
+            if value is not None:
+                statements += stats.observe(name, value, at=now)
+        await stats.record(statements)
+    await _publish(job_id, {"status": "PROCESSING", "step": step})
 
 
-async def complete_job(job_id: str, output_key: str):
-    now = datetime.now(timezone.utc).isoformat()
+RENDITION_FILES = {
+    "poster_key": "poster.jpg",
+    "thumbs_key": "thumbs.webp",
+    "proxy_key": "proxy_360p.mp4",
+}
+
+
+def find_renditions(job_id: str) -> dict:
+    """Preview rendition keys for a finished job, or {} for jobs that predate them.
+
+    The orchestrator uploads every rendition before the master, so a single
+    HEAD on the proxy is enough.
+    """
+    if not object_exists(f"projects/{job_id}/{RENDITION_FILES['proxy_key']}"):
+        return {}
+    return {column: f"projects/{job_id}/{name}" for column, name in RENDITION_FILES.items()}
+
+
+async def complete_job(job_id: str, output_key: str, renditions: dict = None):
+    if renditions is None:
+        renditions = find_renditions(job_id)
+    now = datetime.now(timezone.utc)
+    prev = await fetch_one(
+        "SELECT job_id, status, step, step_started_at, duration_sec, gpu_seconds, created_at FROM jobs WHERE job_id = ?",
+        [job_id],
+    )
+    seconds = _step_seconds(prev, now) if prev is not None and prev["status"] == "PROCESSING" else None
+    gpu_seconds = (prev or {}).get("gpu_seconds") or 0.0
+    gpu_seconds += _step_gpu_seconds(prev, seconds)
     await execute(
-        "UPDATE jobs SET status = 'COMPLETED', output_key = ?, completed_at = ? WHERE job_id = ?",
-        [output_key, now, job_id],
+        "UPDATE jobs SET status = 'COMPLETED', output_key = ?, completed_at = ?, gpu_seconds = ?,"
+        " poster_key = ?, thumbs_key = ?, proxy_key = ? WHERE job_id = ?",
+        [output_key, now.isoformat(), gpu_seconds, renditions.get("poster_key"), renditions.get("thumbs_key"),
+         renditions.get("proxy_key"), job_id],
     )
+    if prev is not None and prev["status"] in ("PENDING", "PROCESSING"):
+        statements = await _record_step_end(prev, seconds)
+        statements += stats.transition(prev["status"], "COMPLETED")
+        e2e = (now - datetime.fromisoformat(prev["created_at"])).total_seconds()
+        statements += stats.observe("e2e_sec", e2e, at=now)
+        video_minutes = (prev.get("duration_sec") or 0) / 60
+        if video_minutes:
+            statements += stats.observe("e2e_sec_per_video_min", e2e / video_minutes, at=now)
+            statements += stats.observe("gpu_sec_per_video_min", gpu_seconds / video_minutes, at=now)
+        await stats.record(statements)
+    await _publish(job_id, {"status": "COMPLETED", "output_key": output_key, **renditions})
 
 
 async def fail_job(job_id: str, error: str):
     now = datetime.now(timezone.utc).isoformat()
+    prev = await fetch_one("SELECT status FROM jobs WHERE job_id = ?", [job_id])
     await execute(
-        "UPDATE jobs SET status = 'FAILED', error = ?, completed_at = ? WHERE job_id = ?",
+        "UPDATE jobs SET status = 'FAILED', error = ?, completed_at = ? WHERE job_id = ? AND status != 'CANCELLED'",
         [error, now, job_id],
     )
+    if prev is not None and prev["status"] in ("PENDING", "PROCESSING"):
+        await stats.record(stats.transition(prev["status"], "FAILED"))
+    await _publish(job_id, {"status": "FAILED", "error": error})
+
+
+async def cancel_job(job: dict):
+    """Stop a running job and free its GPU containers.
+
+    Raises the cancel flag the orchestrator checks between stages, cancels
+    every child FunctionCall it registered, cancels the orchestrator call
+    itself (single-language jobs only; a group's call is shared by siblings)
+    and marks the row CANCELLED.
+    """
+    job_id = job["job_id"]
+    control = modal.Dict.from_name(JOB_CONTROL_DICT, create_if_missing=True)
+    try:
+        await control.put.aio(f"cancel:{job_id}", True)
+        call_ids = list(await control.get.aio(f"calls:{job_id}", []) or [])
+    except Exception as e:
+        print(f"[warn] Could not reach job control dict for {job_id}: {e}")
+        call_ids = []
+    if job.get("modal_call_id") and not job.get("group_id"):
+        call_ids.append(job["modal_call_id"])
+
+    for call_id in call_ids:
+        try:
+            await modal.FunctionCall.from_id(call_id).cancel.aio()
+        except Exception as e:
+            print(f"[warn] Could not cancel call {call_id} for job {job_id}: {e}")
+
+    now = datetime.now(timezone.utc).isoformat()
+    await execute(
+        "UPDATE jobs SET status = 'CANCELLED', completed_at = ? WHERE job_id = ? AND status IN ('PENDING', 'PROCESSING')",
+        [now, job_id],
+    )
+    if job.get("status") in ("PENDING", "PROCESSING"):
+        await stats.record(stats.transition(job["status"], "CANCELLED"))
+    await _publish(job_id, {"status": "CANCELLED"})
+
+
+async def retry_job(job: dict) -> str | None:
+    """Resume a failed or cancelled job from the stages its last run checkpointed.
+
+    Claims the row by resetting it to PENDING (only one concurrent retry
+    can), clears the job's cancel flag and registered calls and spawns the
+    orchestrator's resume_video. Returns the new FunctionCall id, or None
+    if the spawn failed, in which case the row is put back as it was.
+    Raises ValueError if the job is no longer failed or cancelled.
+    """
+    job_id = job["job_id"]
+    claimed = await fetch_one(
+        "UPDATE jobs SET status = 'PENDING', step = 0, step_started_at = NULL, error = NULL,"
+        " completed_at = NULL WHERE job_id = ? AND status IN ('FAILED', 'CANCELLED') RETURNING job_id",
+        [job_id],
+    )
+    if claimed is None:
+        raise ValueError("Job is already being retried")
+
+    control = modal.Dict.from_name(JOB_CONTROL_DICT, create_if_missing=True)
+    try:
+        await control.put.aio(f"cancel:{job_id}", False)
+        await control.put.aio(f"calls:{job_id}", [])
+    except Exception as e:
+        print(f"[warn] Could not reset job control dict for {job_id}: {e}")
+
+    video_url = generate_download_url(job["source_key"], expires=7200)
+    try:
+        resume_func = modal.Function.from_name("redub-orchestrator", "resume_video")
+        call = await resume_func.spawn.aio(
+            job_id=job_id,
+            video_url=video_url,
+            target_language=job["target_language"],
+        )
+    except Exception as e:
+        print(f"[warn] Could not spawn resume for job {job_id}: {e}")
+        await execute(
+            "UPDATE jobs SET status = ?, step = ?, step_started_at = ?, error = ?, completed_at = ?"
+            " WHERE job_id = ? AND status = 'PENDING'",
+            [job["status"], job.get("step") or 0, job.get("step_started_at"), job.get("error"),
+             job.get("completed_at"), job_id],
+        )
+        return None
+    await execute("UPDATE jobs SET modal_call_id = ? WHERE job_id = ?", [call.object_id, job_id])
+    await stats.record(stats.transition(job["status"], "PENDING"))
+    await _publish(job_id, {"status": "PENDING", "step": 0})
+    return call.object_id
 
 
 async def rename_job(job_id: str, project_name: str):
     await execute(
         "UPDATE jobs SET project_name = ? WHERE job_id = ?",
         [project_name, job_id],
-    )
\ No newline at end of file
+    )
+
+
+async def reconcile_finished_jobs(limit: int = 100):
+    """Complete jobs on their last step whose output already landed in R2.
+
+    Covers runs whose completion webhook never arrived. Run by one elected
+    worker rather than on every status poll.
+    """
+    rows = await fetch_all(
+        "SELECT job_id FROM jobs WHERE status = 'PROCESSING' AND step >= 5 LIMIT ?",
+        [limit],
+    )
+    for row in rows:
+        output_key = f"projects/{row['job_id']}/dubbed_output.mp4"
+        if object_exists(output_key):
+            await complete_job(row["job_id"], output_key)
@@ -1,9 +1,14 @@
+import asyncio
+import json
 import os
 import uuid
+from contextlib import aclosing
+from datetime import datetime, timezone
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, Depends, Header, HTTPException, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, EmailStr
 
 load_dotenv()
@@ -11,10 +16,18 @@ load_dotenv()
 from r2 import upload_file, generate_upload_url, generate_download_url, delete_file, list_files, object_exists, get_object_json
 from accounts import create_user, get_user_by_email, update_user
 
-from jobs import create_job, get_job, list_jobs, complete_job, fail_job, update_job_step, rename_job
+from jobs import create_job, create_job_group, get_job, get_job_group, list_jobs, complete_job, fail_job, update_job_step, rename_job, cancel_job, retry_job, reconcile_finished_jobs, find_renditions
+from estimates import estimate_job, estimate_remaining
+from probe import probe_upload, get_or_probe, check_limits
+from batches import validate_manifest, create_batch, get_batch, list_batch_jobs, summarize_batch
+from transcripts import store_transcript, get_transcript, search_transcripts
+from stage_metrics import store_stage_metrics, get_stage_timings, get_stage_estimates
 from presets import create_preset, get_preset, list_presets, complete_preset, fail_preset, delete_preset
 
-from auth import hash_password, verify_password, create_access_token, get_current_user
+from auth import hash_password, verify_password, create_access_token, get_current_user, get_admin_user
+from profiler import FORMATS as PROFILE_FORMATS, SamplingProfiler, RequestProfile, ProfilerMiddleware
+from state import get_state, run_as_leader
+from stats import GRANULARITIES, query_stats, get_gauges, get_cache_hit_rates, default_range
 
 app = FastAPI()
 
@@ -25,6 +38,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(ProfilerMiddleware)
 
 
 # ---------------------------------------------------------------------------
@@ -36,6 +50,54 @@ def _safe_user(user: dict) -> dict:
     return {k: v for k, v in user.items() if k != "password_hash"}
 
 
+DOWNLOAD_URL_TTL = 3600        # Lifetime of presigned GET URLs
+DOWNLOAD_URL_CACHE_TTL = 3000  # Reuse a signed URL until ~10 min before it expires
+
+
+async def _cached_download_url(key: str) -> str:
+    """Presigned GET URL for key, shared across workers so listings don't re-sign every poll."""
+    state = get_state()
+    url = await state.cache_get(f"dl:{key}")
+    if url is None:
+        url = generate_download_url(key, expires=DOWNLOAD_URL_TTL)
+        await state.cache_set(f"dl:{key}", url, ttl=DOWNLOAD_URL_CACHE_TTL)
+    return url
+
+
+def rate_limit(bucket: str, rate: float, capacity: float):
+    """Dependency enforcing a per-user token bucket shared by every worker."""
+    async def _check(current_user: dict = Depends(get_current_user)) -> dict:
+        allowed = await get_state().take_token(f"{bucket}:{current_user['user_id']}", rate, capacity)
+        if not allowed:
+            raise HTTPException(status_code=429, detail="Too many requests, slow down")
+        return current_user
+    return _check
+
+
+# Job submissions: sustained 1 per 6 s per user with bursts of 20
+dub_rate_limit = rate_limit("dub", rate=1 / 6, capacity=20)
+
+
+# ---------------------------------------------------------------------------
+# Leader-elected background tasks
+# ---------------------------------------------------------------------------
+
+_background_tasks: list[asyncio.Task] = []
+
+
+@app.on_event("startup")
+async def start_background_tasks():
+    _background_tasks.append(asyncio.create_task(
+        run_as_leader("reconcile-jobs", interval=30, task=reconcile_finished_jobs)
+    ))
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in _background_tasks:
+        task.cancel()
+
+
 # ---------------------------------------------------------------------------
 # Health
 # ---------------------------------------------------------------------------
@@ -143,6 +205,16 @@ async def get_presigned_upload_url(
     return {"upload_url": url, "file_key": key}
 
 
+async def _probe_or_reject(file_key: str, user_id: str) -> dict | None:
+    """Probe a fresh upload; delete it and raise 422 if it is outside our limits."""
+    probe = await probe_upload(file_key, user_id)
+    reason = check_limits(probe)
+    if reason:
+        delete_file(file_key)
+        raise HTTPException(status_code=422, detail=reason)
+    return probe
+
+
 @app.post("/api/upload")
 async def upload(
     file: UploadFile = File(...),
@@ -151,7 +223,26 @@ async def upload(
     """Upload a file through the backend to R2."""
     key = f"uploads/{current_user['user_id']}/{uuid.uuid4()}/{file.filename}"
     upload_file(file.file, key, file.content_type)
-    return {"file_key": key, "filename": file.filename}
+    probe = await _probe_or_reject(key, current_user["user_id"])
+    return {"file_key": key, "filename": file.filename, "probe": probe}
+
+
+class UploadCompleteRequest(BaseModel):
+    file_key: str
+
+
+@app.post("/api/upload/complete")
+async def upload_complete(
+    req: UploadCompleteRequest,
+    current_user: dict = Depends(get_current_user),
+):
+    """Called after a presigned direct-to-R2 upload finishes; probes the media."""
+    if not req.file_key.startswith(f"uploads/{current_user['user_id']}/"):
+        raise HTTPException(status_code=403, detail="File does not belong to this account")
+    if not object_exists(req.file_key):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    probe = await _probe_or_reject(req.file_key, current_user["user_id"])
+    return {"file_key": req.file_key, "probe": probe}
 
 
 @app.get("/api/files/{file_key:path}/download")
@@ -181,58 +272,286 @@ async def remove_file(
 class DubRequest(BaseModel):
     file_key: str        # R2 key of the uploaded source video
     project_id: str      # Used to namespace the job_id
-    target_language: str # e.g. "Spanish", "French"
+    target_language: str | None = None         # e.g. "Spanish", "French"
+    target_languages: list[str] | None = None  # Several languages → one job group
     voice_preset_id: str | None = None  # Optional fine-tuned voice preset
 
 
+def _requested_languages(req: DubRequest) -> list[str]:
+    """Merge target_language/target_languages into an ordered, de-duplicated list."""
+    languages = []
+    for lang in [req.target_language, *(req.target_languages or [])]:
+        lang = (lang or "").strip()
+        if lang and lang not in languages:
+            languages.append(lang)
+    return languages
+
+
 @app.post("/api/dub")
 async def start_dub(
     req: DubRequest,
-    current_user: dict = Depends(get_current_user),
+    current_user: dict = Depends(dub_rate_limit),
 ):
-    """Trigger the ML dubbing pipeline for a given video."""
-    job_id = await create_job(
+    """Trigger the ML dubbing pipeline for a given video.
+
+    With more than one target language a job group is created: the source is
+    downloaded, prepared and transcribed once, then fanned out per language.
+    """
+    languages = _requested_languages(req)
+    if not languages:
+        raise HTTPException(status_code=422, detail="target_language or target_languages is required")
+    if not req.file_key.startswith(f"uploads/{current_user['user_id']}/"):
+        raise HTTPException(status_code=403, detail="File does not belong to this account")
+
+    probe = await get_or_probe(req.file_key, current_user["user_id"])
+    reason = check_limits(probe)
+    if reason:
+        raise HTTPException(status_code=422, detail=reason)
+    duration_sec = probe.get("duration_sec") if probe else None
+    estimate = await estimate_job(duration_sec, num_languages=len(languages))
+
+    if len(languages) == 1:
+        job_id = await create_job(
+            user_id=current_user["user_id"],
+            file_key=req.file_key,
+            project_id=req.project_id,
+            target_language=languages[0],
+            voice_preset_id=req.voice_preset_id,
+            duration_sec=duration_sec,
+        )
+        return {"job_id": job_id, "status": "PENDING", "estimate": estimate}
+
+    group = await create_job_group(
         user_id=current_user["user_id"],
         file_key=req.file_key,
         project_id=req.project_id,
-        target_language=req.target_language,
+        target_languages=languages,
         voice_preset_id=req.voice_preset_id,
+        duration_sec=duration_sec,
     )
-    return {"job_id": job_id, "status": "PENDING"}
-
+    return {
+        "group_id": group["group_id"],
+        "job_id": group["jobs"][0]["job_id"],  # Lets single-job clients keep polling one child
+        "status": "PENDING",
+        "jobs": [{**child, "status": "PENDING"} for child in group["jobs"]],
+        "estimate": estimate,
+    }
 
-@app.get("/api/dub/{job_id}")
-async def get_dub_status(
-    job_id: str,
-    current_user: dict = Depends(get_current_user),
-):
-    """Poll the status of a dubbing job."""
-    job = await get_job(job_id, current_user["user_id"])
-    if job is None:
-        raise HTTPException(status_code=404, detail="Job not found")
 
-    # If the webhook never arrived (e.g. local dev), check R2 directly
+async def _refresh_job_status(job: dict) -> dict:
+    """If the webhook never arrived (e.g. local dev), check R2 directly."""
     if job["status"] in ("PENDING", "PROCESSING"):
-        output_key = f"projects/{job_id}/dubbed_output.mp4"
+        output_key = f"projects/{job['job_id']}/dubbed_output.mp4"
         if object_exists(output_key):
-            await complete_job(job_id, output_key)
-            job["status"] = "COMPLETED"
-            job["output_key"] = output_key
+            renditions = find_renditions(job["job_id"])
+            await complete_job(job["job_id"], output_key, renditions)
+            job.update(renditions, status="COMPLETED", output_key=output_key)
+    return job
+
+
+async def _preview_urls(job: dict) -> dict:
+    """Presigned URLs for the lightweight preview renditions, when the job has them."""
+    urls = {}
+    for column, field in (("poster_key", "poster_url"), ("thumbs_key", "thumbs_url"), ("proxy_key", "preview_url")):
+        if job.get(column):
+            urls[field] = await _cached_download_url(job[column])
+    return urls
 
+
+async def _job_status_response(job: dict) -> dict:
     response = {
-        "job_id": job_id,
+        "job_id": job["job_id"],
         "status": job["status"],
         "step": job.get("step", 0),
         "target_language": job.get("target_language", ""),
     }
+    if job.get("group_id"):
+        response["group_id"] = job["group_id"]
+    if job.get("duration_sec"):
+        response["estimate"] = await estimate_job(job["duration_sec"])
+    if job["status"] in ("PENDING", "PROCESSING") and job.get("duration_sec"):
+        elapsed = 0.0
+        if job.get("step_started_at"):
+            started = datetime.fromisoformat(job["step_started_at"])
+            elapsed = (datetime.now(timezone.utc) - started).total_seconds()
+        response["eta_seconds"] = await estimate_remaining(job, elapsed)
     if job["status"] == "COMPLETED":
         response["output_key"] = job["output_key"]
-        response["download_url"] = generate_download_url(job["output_key"])
+        response["download_url"] = await _cached_download_url(job["output_key"])
+        response.update(await _preview_urls(job))
     elif job["status"] == "FAILED":
         response["error"] = job["error"]
     return response
 
 
+class BatchEntry(BaseModel):
+    file_key: str
+    target_languages: list[str]
+    voice_preset_id: str | None = None
+    project_name: str | None = None
+
+
+class BatchRequest(BaseModel):
+    entries: list[BatchEntry]
+
+
+@app.post("/api/dub/batch")
+async def start_dub_batch(
+    req: BatchRequest,
+    current_user: dict = Depends(dub_rate_limit),
+):
+    """Submit a whole manifest of dubbing jobs in one call."""
+    entries = []
+    for e in req.entries:
+        languages = []
+        for lang in e.target_languages:
+            lang = lang.strip()
+            if lang and lang not in languages:
+                languages.append(lang)
+        entries.append({
+            "file_key": e.file_key,
+            "target_languages": languages,
+            "voice_preset_id": e.voice_preset_id,
+            "project_name": (e.project_name or "").strip() or None,
+        })
+
+    errors = await validate_manifest(current_user["user_id"], entries)
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+
+    result = await create_batch(current_user["user_id"], entries)
+    return {**result, "status": "PENDING"}
+
+
+async def _refresh_batch_jobs(jobs: list[dict]) -> list[dict]:
+    """Apply the R2 completion fallback only to jobs that reached the last step."""
+    for job in jobs:
+        if job["status"] == "PROCESSING" and (job.get("step") or 0) >= 5:
+            await _refresh_job_status(job)
+    return jobs
+
+
+@app.get("/api/dub/batches/{batch_id}")
+async def get_dub_batch_status(
+    batch_id: str,
+    current_user: dict = Depends(get_current_user),
+):
+    """Aggregate status and progress of every job in a batch."""
+    batch = await get_batch(batch_id, current_user["user_id"])
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    jobs = await _refresh_batch_jobs(await list_batch_jobs(batch_id, current_user["user_id"]))
+    return {"batch_id": batch_id, "created_at": batch["created_at"], **summarize_batch(jobs)}
+
+
+@app.get("/api/dub/batches/{batch_id}/jobs")
+async def list_dub_batch_jobs(
+    batch_id: str,
+    status: str | None = None,
+    current_user: dict = Depends(get_current_user),
+):
+    """Compact per-job status for a batch, optionally filtered by status."""
+    batch = await get_batch(batch_id, current_user["user_id"])
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    jobs = await _refresh_batch_jobs(await list_batch_jobs(batch_id, current_user["user_id"]))
+    if status:
+        jobs = [j for j in jobs if j["status"] == status]
+    return {"batch_id": batch_id, "jobs": jobs}
+
+
+@app.get("/api/dub/groups/{group_id}")
+async def get_dub_group_status(
+    group_id: str,
+    current_user: dict = Depends(get_current_user),
+):
+    """Poll every child job of a multi-language job group."""
+    group = await get_job_group(group_id, current_user["user_id"])
+    if group is None:
+        raise HTTPException(status_code=404, detail="Job group not found")
+    children = [await _job_status_response(await _refresh_job_status(job)) for job in group["jobs"]]
+    return {
+        "group_id": group_id,
+        "source_key": group["source_key"],
+        "created_at": group["created_at"],
+        "jobs": children,
+    }
+
+
+@app.get("/api/dub/{job_id}")
+async def get_dub_status(
+    job_id: str,
+    current_user: dict = Depends(get_current_user),
+):
+    """Poll the status of a dubbing job."""
+    job = await get_job(job_id, current_user["user_id"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    job = await _refresh_job_status(job)
+    return await _job_status_response(job)
+
+
+@app.get("/api/dub/{job_id}/events")
+async def stream_dub_events(
+    job_id: str,
+    current_user: dict = Depends(get_current_user),
+):
+    """Server-sent events for a job, pushed from whichever worker received the webhook."""
+    job = await get_job(job_id, current_user["user_id"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job = await _refresh_job_status(job)
+    initial = await _job_status_response(job)
+
+    async def events():
+        yield f"data: {json.dumps(initial)}\n\n"
+        if initial["status"] in ("COMPLETED", "FAILED", "CANCELLED"):
+            return
+        async with aclosing(get_state().subscribe(f"job:{job_id}")) as subscription:
+            async for event in subscription:
+                if event is None:
+                    yield ": keepalive\n\n"
+                    continue
+                if event.get("status") == "COMPLETED":
+                    event["download_url"] = await _cached_download_url(event["output_key"])
+                    event.update(await _preview_urls(event))
+                yield f"data: {json.dumps(event)}\n\n"
+                if event.get("status") in ("COMPLETED", "FAILED", "CANCELLED"):
+                    return
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/api/dub/{job_id}/cancel")
+async def cancel_dub(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Stop a pending or running job and release its GPU containers."""
+    job = await get_job(job_id, current_user["user_id"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] not in ("PENDING", "PROCESSING"):
+        raise HTTPException(status_code=409, detail=f"Job is already {job['status']}")
+    await cancel_job(job)
+    return {"job_id": job_id, "status": "CANCELLED"}
+
+
+@app.post("/api/dub/{job_id}/retry")
+async def retry_dub(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Rerun a failed or cancelled job, skipping the stages it already completed."""
+    job = await get_job(job_id, current_user["user_id"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] not in ("FAILED", "CANCELLED"):
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}; only failed or cancelled jobs can be retried")
+    try:
+        call_id = await retry_job(job)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if call_id is None:
+        raise HTTPException(status_code=503, detail="Could not restart the pipeline")
+    return {"job_id": job_id, "status": "PENDING"}
+
+
 @app.get("/api/dub/{job_id}/download")
 async def get_download_url(job_id: str, current_user: dict = Depends(get_current_user)):
     """Return a short-lived presigned download URL with Content-Disposition: attachment."""
@@ -256,6 +575,24 @@ async def rename_dub(job_id: str, body: dict, current_user: dict = Depends(get_c
     return {"project_name": name}
 
 
+@app.get("/api/dub/{job_id}/transcript")
+async def get_dub_transcript(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Timestamped source transcript and translation, segment by segment."""
+    job = await get_job(job_id, current_user["user_id"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"job_id": job_id, "segments": await get_transcript(job_id, current_user["user_id"])}
+
+
+@app.get("/api/dub/{job_id}/timings")
+async def get_dub_timings(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Per-stage wall, queue, model-load and size measurements reported by the pipeline."""
+    job = await get_job(job_id, current_user["user_id"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return await get_stage_timings(job_id)
+
+
 @app.get("/api/projects")
 async def list_projects(current_user: dict = Depends(get_current_user)):
     """Return all dubbing jobs for the current user (used by the Dashboard)."""
@@ -268,11 +605,24 @@ async def list_projects(current_user: dict = Depends(get_current_user)):
         if not object_exists(j["output_key"]):
             await fail_job(j["job_id"], "Output file was deleted")
             continue
-        j["download_url"] = generate_download_url(j["output_key"])
+        previews = await _preview_urls(j)
+        if previews:
+            # Cards only need the poster/thumbs/proxy; the master is fetched via /download
+            j.update(previews)
+        else:
+            j["download_url"] = await _cached_download_url(j["output_key"])
         result.append(j)
     return {"projects": result}
 
 
+@app.get("/api/projects/search")
+async def search_projects(q: str, limit: int = 50, current_user: dict = Depends(get_current_user)):
+    """Find which of the user's projects mention q, with timestamped hits."""
+    if not q.strip():
+        raise HTTPException(status_code=422, detail="q is required")
+    return {"query": q, "projects": await search_transcripts(current_user["user_id"], q, limit)}
+
+
 # ---------------------------------------------------------------------------
 # Voice Preset endpoints (all require auth)
 # ---------------------------------------------------------------------------
@@ -361,6 +711,143 @@ async def remove_voice_preset(
     return {"deleted": preset_id}
 
 
+# ---------------------------------------------------------------------------
+# Admin endpoints
+# ---------------------------------------------------------------------------
+
+PROFILE_RESULT_TTL = 3600
+MAX_PROFILE_SECONDS = 60
+MIN_PROFILE_INTERVAL_MS = 1     # Faster sampling would cost more than the code being profiled
+MAX_PROFILE_INTERVAL_MS = 1000
+
+
+class ProfileRequest(BaseModel):
+    seconds: float = 10
+    format: str = "speedscope"   # "speedscope" (JSON) or "collapsed" (flamegraph.pl input)
+    interval_ms: float = 5
+
+
+class RequestProfileRequest(BaseModel):
+    route_prefix: str            # e.g. "/api/projects"
+    count: int = 20
+    format: str = "speedscope"
+    interval_ms: float = 5
+
+
+def _check_profile_options(fmt: str, interval_ms: float):
+    if fmt not in PROFILE_FORMATS:
+        raise HTTPException(status_code=422, detail=f"format must be one of {', '.join(PROFILE_FORMATS)}")
+    if not MIN_PROFILE_INTERVAL_MS <= interval_ms <= MAX_PROFILE_INTERVAL_MS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"interval_ms must be between {MIN_PROFILE_INTERVAL_MS} and {MAX_PROFILE_INTERVAL_MS}",
+        )
+
+
+def _profile_response(result, fmt: str):
+    return PlainTextResponse(result) if fmt == "collapsed" else result
+
+
+async def _store_request_profile(session: RequestProfile):
+    # An expired profile keeps what it sampled; "profiled" says how many requests that covers
+    name = f"{session.profiled} requests to {session.route_prefix}*"
+    await get_state().cache_set(
+        f"profile:{session.profile_id}",
+        {"status": "COMPLETE", "format": session.fmt, "profiled": session.profiled, "count": session.count,
+         "result": session.profiler.render(session.fmt, name)},
+        ttl=PROFILE_RESULT_TTL,
+    )
+
+
+ProfilerMiddleware.on_complete = _store_request_profile
+
+
+@app.post("/api/admin/profile")
+async def profile_worker(req: ProfileRequest, admin: dict = Depends(get_admin_user)):
+    """Sample every thread of this worker for N seconds and return the profile."""
+    if not 0 < req.seconds <= MAX_PROFILE_SECONDS:
+        raise HTTPException(status_code=422, detail=f"seconds must be in (0, {MAX_PROFILE_SECONDS}]")
+    _check_profile_options(req.format, req.interval_ms)
+    profiler = SamplingProfiler(interval=req.interval_ms / 1000)
+    profiler.start()
+    try:
+        await asyncio.sleep(req.seconds)
+    finally:
+        profiler.stop()
+    return _profile_response(profiler.render(req.format, f"worker {os.getpid()} for {req.seconds:g}s"), req.format)
+
+
+@app.post("/api/admin/profile/requests", status_code=202)
+async def profile_next_requests(req: RequestProfileRequest, admin: dict = Depends(get_admin_user)):
+    """Arm the profiler on this worker for the next `count` requests matching a route prefix.
+
+    The profile expires after PROFILE_RESULT_TTL, along with its ARMED entry.
+    """
+    await ProfilerMiddleware.finish_expired()
+    if ProfilerMiddleware.armed is not None:
+        raise HTTPException(status_code=409, detail="A request profile is already armed on this worker")
+    if not 1 <= req.count <= 1000:
+        raise HTTPException(status_code=422, detail="count must be between 1 and 1000")
+    _check_profile_options(req.format, req.interval_ms)
+    session = RequestProfile(
+        req.route_prefix, req.count, req.format, interval=req.interval_ms / 1000, ttl=PROFILE_RESULT_TTL,
+    )
+    await get_state().cache_set(
+        f"profile:{session.profile_id}",
+        {"status": "ARMED", "route_prefix": req.route_prefix, "count": req.count, "pid": os.getpid()},
+        ttl=PROFILE_RESULT_TTL,
+    )
+    ProfilerMiddleware.armed = session
+    return {"profile_id": session.profile_id, "status": "ARMED"}
+
+
+@app.get("/api/admin/profile/{profile_id}")
+async def get_request_profile(profile_id: str, admin: dict = Depends(get_admin_user)):
+    """Fetch an armed or completed request profile (results are shared across workers)."""
+    await ProfilerMiddleware.finish_expired()
+    entry = await get_state().cache_get(f"profile:{profile_id}")
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if entry["status"] != "COMPLETE":
+        return entry
+    return _profile_response(entry["result"], entry["format"])
+
+
+@app.get("/api/admin/stats")
+async def admin_stats(
+    granularity: str = "hour",
+    start: datetime | None = None,
+    end: datetime | None = None,
+    metric: str | None = None,
+    admin: dict = Depends(get_admin_user),
+):
+    """Throughput, queue depth and latency rollups, read from stats tables rather than jobs.
+
+    Defaults to the last 24 hours by hour, or the last 30 days by day.
+    """
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=422, detail=f"granularity must be one of: {', '.join(GRANULARITIES)}")
+    default_start, default_end = default_range(granularity)
+    start = start or default_start
+    end = end or default_end
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    start, end = start.astimezone(timezone.utc), end.astimezone(timezone.utc)
+    if start > end:
+        raise HTTPException(status_code=422, detail="start must be before end")
+
+    return {
+        "granularity": granularity,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "gauges": await get_gauges(),
+        "cache": await get_cache_hit_rates(),
+        **await query_stats(granularity, start, end, metric),
+    }
+
+
 # ---------------------------------------------------------------------------
 # Webhook — called by the Modal orchestrator, not by the frontend
 # ---------------------------------------------------------------------------
@@ -368,6 +855,7 @@ async def remove_voice_preset(
 class StepPayload(BaseModel):
     job_id: str
     step: int            # 1=Preparing, 2=Transcribing, 3=Translating, 4=Cloning Voice, 5=Lip Syncing
+    metrics: dict[str, float | None] | None = None  # Measurements from the step that just ended
 
 
 @app.post("/api/webhook/job-step")
@@ -379,15 +867,75 @@ async def job_step_webhook(
     secret = os.getenv("WEBHOOK_SECRET")
     if secret and authorization != f"Bearer {secret}":
         raise HTTPException(status_code=401, detail="Unauthorized")
-    await update_job_step(payload.job_id, payload.step)
+    await update_job_step(payload.job_id, payload.step, payload.metrics)
     return {"received": True}
 
 
+class TranscriptPayload(BaseModel):
+    job_id: str
+    segments: list[dict]  # [{"start", "end", "original_text", "translated_text"}]
+
+
+@app.post("/api/webhook/job-transcript")
+async def job_transcript_webhook(
+    payload: TranscriptPayload,
+    authorization: str = Header(None),
+):
+    """Store a job's transcript and translation once the translation step is done."""
+    secret = os.getenv("WEBHOOK_SECRET")
+    if secret and authorization != f"Bearer {secret}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    try:
+        stored = await store_transcript(payload.job_id, payload.segments)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"received": True, "segments": stored}
+
+
+class StageMetricsPayload(BaseModel):
+    job_id: str
+    stages: list[dict]  # Stage records written by ml/telemetry.py, joined with queue/wall time
+
+
+@app.post("/api/webhook/job-stage-metrics")
+async def job_stage_metrics_webhook(
+    payload: StageMetricsPayload,
+    authorization: str = Header(None),
+):
+    """Store the per-stage timings and sizes the orchestrator collected for a job."""
+    secret = os.getenv("WEBHOOK_SECRET")
+    if secret and authorization != f"Bearer {secret}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    try:
+        stored = await store_stage_metrics(payload.job_id, payload.stages)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"received": True, "stages": stored}
+
+
+STAGE_ESTIMATES_CACHE_TTL = 600  # Every job start asks; history moves slowly
+
+
+@app.get("/api/webhook/stage-estimates")
+async def stage_estimates_webhook(authorization: str = Header(None)):
+    """Historical stage durations and cold starts the orchestrator times its warm-ups from."""
+    secret = os.getenv("WEBHOOK_SECRET")
+    if secret and authorization != f"Bearer {secret}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    state = get_state()
+    stages = await state.cache_get("stage-estimates")
+    if stages is None:
+        stages = await get_stage_estimates()
+        await state.cache_set("stage-estimates", stages, ttl=STAGE_ESTIMATES_CACHE_TTL)
+    return {"stages": stages}
+
+
 class WebhookPayload(BaseModel):
     job_id: str
     status: str          # "COMPLETED" or "FAILED"
     output_key: str | None = None
     error: str | None = None
+    renditions: dict | None = None  # {"poster_key", "thumbs_key", "proxy_key"}
 
 
 @app.post("/api/webhook/job-complete")
@@ -401,7 +949,7 @@ async def job_complete_webhook(
         raise HTTPException(status_code=401, detail="Unauthorized")
 
     if payload.status == "COMPLETED" and payload.output_key:
-        await complete_job(payload.job_id, payload.output_key)
+        await complete_job(payload.job_id, payload.output_key, payload.renditions)
     else:
         await fail_job(payload.job_id, payload.error or "Unknown error")
 
@@ -23,7 +23,7 @@ async def create_preset(user_id: str, name: str, audio_key: str, duration_sec: f
     audio_url = generate_download_url(audio_key, expires=7200)
 
     try:
-        fine_tune_func = modal.Function.from_name("redub-xtts", "fine_tune_speaker")
+        fine_tune_func = modal.Cls.from_name("redub-xtts", "XTTS")().fine_tune_speaker
         await fine_tune_func.spawn.aio(
             preset_id=preset_id,
             audio_url=audio_url,
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import os
+import subprocess
+from datetime import datetime, timezone
+
+from d1 import fetch_one, fetch_all, execute
+from r2 import generate_download_url
+
+# Uploads beyond these limits are rejected before any GPU work is scheduled
+MAX_SOURCE_DURATION_SEC = float(os.getenv("MAX_SOURCE_DURATION_SEC", 2 * 3600))
+MAX_SOURCE_HEIGHT = int(os.getenv("MAX_SOURCE_HEIGHT", 2160))
+
+FFPROBE_TIMEOUT = 60
+D1_MAX_PARAMS = 90  # D1 allows 100 bound parameters per statement
+
+
+def _parse_rate(rate: str | None) -> float | None:
+    """Turn ffprobe's "30000/1001" frame rates into floats."""
+    if not rate or rate == "0/0":
+        return None
+    num, _, den = rate.partition("/")
+    try:
+        return round(float(num) / float(den or 1), 3)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def _run_ffprobe(url: str) -> dict:
+    """ffprobe a presigned URL. Over HTTP it issues range requests for the
+    container header (and the moov atom wherever it lives), never the full file.
+    """
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-print_format", "json",
+         "-show_format", "-show_streams",
+         "-probesize", "5000000", "-rw_timeout", "15000000",
+         url],
+        capture_output=True, text=True, check=True, timeout=FFPROBE_TIMEOUT,
+    )
+    return json.loads(result.stdout)
+
+
+def _summarize(raw: dict) -> dict:
+    fmt = raw.get("format", {})
+    video = next((s for s in raw.get("streams", []) if s.get("codec_type") == "video"), {})
+    audio = next((s for s in raw.get("streams", []) if s.get("codec_type") == "audio"), {})
+    duration = fmt.get("duration") or video.get("duration")
+    return {
+        "duration_sec": float(duration) if duration else None,
+        "size_bytes": int(fmt["size"]) if fmt.get("size") else None,
+        "container": fmt.get("format_name"),
+        "video_codec": video.get("codec_name"),
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "fps": _parse_rate(video.get("avg_frame_rate")) or _parse_rate(video.get("r_frame_rate")),
+        "audio_codec": audio.get("codec_name"),
+        "audio_channels": audio.get("channels"),
+        "audio_layout": audio.get("channel_layout"),
+        "audio_sample_rate": int(audio["sample_rate"]) if audio.get("sample_rate") else None,
+    }
+
+
+async def probe_upload(file_key: str, user_id: str) -> dict | None:
+    """Probe an uploaded object in R2 and store the result. Returns None if ffprobe fails."""
+    url = generate_download_url(file_key, expires=600)
+    try:
+        raw = await asyncio.to_thread(_run_ffprobe, url)
+    except (subprocess.SubprocessError, FileNotFoundError, json.JSONDecodeError) as e:
+        print(f"[warn] ffprobe failed for {file_key}: {e}")
+        return None
+
+    probe = _summarize(raw)
+    now = datetime.now(timezone.utc).isoformat()
+    await execute(
+        "INSERT OR REPLACE INTO media_probes (file_key, user_id, duration_sec, size_bytes, container,"
+        " video_codec, width, height, fps, audio_codec, audio_channels, audio_layout, audio_sample_rate, probed_at)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [file_key, user_id, probe["duration_sec"], probe["size_bytes"], probe["container"],
+         probe["video_codec"], probe["width"], probe["height"], probe["fps"], probe["audio_codec"],
+         probe["audio_channels"], probe["audio_layout"], probe["audio_sample_rate"], now],
+    )
+    return {"file_key": file_key, **probe, "probed_at": now}
+
+
+async def get_probe(file_key: str, user_id: str) -> dict | None:
+    return await fetch_one(
+        "SELECT * FROM media_probes WHERE file_key = ? AND user_id = ?",
+        [file_key, user_id],
+    )
+
+
+async def get_probes(file_keys: list[str], user_id: str) -> dict[str, dict]:
+    """Look up many probes at once, chunked to stay under D1's bound-parameter limit."""
+    probes = {}
+    keys = sorted(set(file_keys))
+    for i in range(0, len(keys), D1_MAX_PARAMS):
+        chunk = keys[i:i + D1_MAX_PARAMS]
+        placeholders = ", ".join("?" for _ in chunk)
+        rows = await fetch_all(
+            f"SELECT * FROM media_probes WHERE user_id = ? AND file_key IN ({placeholders})",
+            [user_id, *chunk],
+        )
+        probes.update({r["file_key"]: r for r in rows})
+    return probes
+
+
+async def get_or_probe(file_key: str, user_id: str) -> dict | None:
+    return await get_probe(file_key, user_id) or await probe_upload(file_key, user_id)
+
+
+def check_limits(probe: dict | None) -> str | None:
+    """Return a rejection reason if the probed media is outside what we accept."""
+    if probe is None:
+        return None  # Unknown media is let through; the pipeline will find out
+    if probe.get("video_codec") is None:
+        return "File has no video stream"
+    if probe.get("audio_codec") is None:
+        return "File has no audio track to dub"
+    duration = probe.get("duration_sec")
+    if duration and duration > MAX_SOURCE_DURATION_SEC:
+        return f"Video is {duration / 60:.0f} min long; the limit is {MAX_SOURCE_DURATION_SEC / 60:.0f} min"
+    height = probe.get("height")
+    if height and height > MAX_SOURCE_HEIGHT:
+        return f"Video is {height}p; the limit is {MAX_SOURCE_HEIGHT}p"
+    return None
@@ -0,0 +1,188 @@
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+DEFAULT_INTERVAL = 0.005  # 200 Hz
+MAX_STACK_DEPTH = 128
+FORMATS = ("speedscope", "collapsed")
+
+
+class SamplingProfiler:
+    """Wall-clock sampler built on sys._current_frames().
+
+    A daemon thread wakes every `interval` seconds and records the stack of
+    every other thread, so the event loop, the threadpool and anything
+    blocking them (bcrypt, boto3 signing, JSON decoding) all show up. Nothing
+    is installed in the interpreter, so there is no cost outside start()/stop().
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self._started_at = 0.0
+        self.duration = 0.0
+
+    def start(self):
+        self._stop.clear()
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="redub-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.duration += time.perf_counter() - self._started_at
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                stack.reverse()
+                self.stacks[tuple(stack)] += 1
+            self.samples += 1
+
+    # ── Output formats ────────────────────────────────────────────
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's folded-stack format, ready for flamegraph.pl / inferno."""
+        lines = []
+        for stack, count in self.stacks.most_common():
+            names = ";".join(f"{name} ({filename.rsplit('/', 1)[-1]}:{line})" for name, filename, line in stack)
+            lines.append(f"{names} {count}")
+        return "\n".join(lines)
+
+    def speedscope(self, name: str) -> dict:
+        """A speedscope.app 'sampled' profile with one weighted sample per unique stack."""
+        frame_index: dict[tuple, int] = {}
+        frames = []
+        samples = []
+        weights = []
+        for stack, count in self.stacks.items():
+            indexed = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                indexed.append(frame_index[frame])
+            samples.append(indexed)
+            weights.append(count * self.interval)
+        total = sum(weights)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "redub-backend",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": total,
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+    def render(self, fmt: str, name: str):
+        return self.collapsed() if fmt == "collapsed" else self.speedscope(name)
+
+
+class RequestProfile:
+    """Profiles the next `count` requests whose path starts with `route_prefix`.
+
+    The sampler only runs while at least one matching request is in flight.
+    After `ttl` seconds the profile stops taking requests and finishes with
+    whatever it has sampled, so a route that never sees traffic can't keep
+    the worker armed.
+    """
+
+    def __init__(self, route_prefix: str, count: int, fmt: str, interval: float = DEFAULT_INTERVAL,
+                 ttl: float | None = None):
+        self.profile_id = uuid.uuid4().hex[:12]
+        self.route_prefix = route_prefix
+        self.remaining = count
+        self.count = count
+        self.fmt = fmt
+        self.profiler = SamplingProfiler(interval)
+        self.expires_at = None if ttl is None else time.monotonic() + ttl
+        self._in_flight = 0
+
+    @property
+    def profiled(self) -> int:
+        return self.count - self.remaining
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def matches(self, path: str) -> bool:
+        return self.remaining > 0 and path.startswith(self.route_prefix) and not self.expired()
+
+    def enter(self):
+        self.remaining -= 1
+        if self._in_flight == 0:
+            self.profiler.start()
+        self._in_flight += 1
+
+    def exit(self) -> bool:
+        """Returns True once the last profiled request has finished."""
+        self._in_flight -= 1
+        if self._in_flight == 0:
+            self.profiler.stop()
+        return self.done()
+
+    def done(self) -> bool:
+        return (self.remaining == 0 or self.expired()) and self._in_flight == 0
+
+
+class ProfilerMiddleware:
+    """Pure ASGI middleware: with no armed RequestProfile it is a single attribute check."""
+
+    armed: RequestProfile | None = None
+    on_complete = None  # async callable(RequestProfile) set by the app
+
+    def __init__(self, app):
+        self.app = app
+
+    @staticmethod
+    async def finish(session: RequestProfile):
+        if ProfilerMiddleware.armed is session:
+            ProfilerMiddleware.armed = None
+            if ProfilerMiddleware.on_complete is not None:
+                await ProfilerMiddleware.on_complete(session)
+
+    @staticmethod
+    async def finish_expired():
+        """Disarm the armed profile if it expired with no request in flight."""
+        session = ProfilerMiddleware.armed
+        if session is not None and session.done():
+            await ProfilerMiddleware.finish(session)
+
+    async def __call__(self, scope, receive, send):
+        session = ProfilerMiddleware.armed
+        if session is None or scope["type"] != "http" or not session.matches(scope["path"]):
+            if session is not None and session.expired():
+                await ProfilerMiddleware.finish_expired()
+            await self.app(scope, receive, send)
+            return
+
+        session.enter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if session.exit():
+                await ProfilerMiddleware.finish(session)
@@ -16,6 +16,15 @@ CREATE TABLE IF NOT EXISTS jobs (
     output_key      TEXT,
     target_language TEXT,
     project_name    TEXT,
+    group_id        TEXT,
+    batch_id        TEXT,
+    modal_call_id   TEXT,
+    duration_sec    REAL,
+    step_started_at TEXT,
+    poster_key      TEXT,
+    thumbs_key      TEXT,
+    proxy_key       TEXT,
+    gpu_seconds     REAL DEFAULT 0,
     created_at      TEXT NOT NULL,
     completed_at    TEXT,
     error           TEXT,
@@ -25,8 +34,44 @@ CREATE TABLE IF NOT EXISTS jobs (
 -- Migration for existing databases:
 -- ALTER TABLE jobs ADD COLUMN step INTEGER NOT NULL DEFAULT 0;
 -- ALTER TABLE jobs ADD COLUMN project_name TEXT;
+-- ALTER TABLE jobs ADD COLUMN group_id TEXT;
+-- ALTER TABLE jobs ADD COLUMN batch_id TEXT;
+-- ALTER TABLE jobs ADD COLUMN modal_call_id TEXT;
+-- ALTER TABLE job_groups ADD COLUMN modal_call_id TEXT;
+-- ALTER TABLE jobs ADD COLUMN duration_sec REAL;
+-- ALTER TABLE jobs ADD COLUMN step_started_at TEXT;
+-- ALTER TABLE jobs ADD COLUMN poster_key TEXT;
+-- ALTER TABLE jobs ADD COLUMN thumbs_key TEXT;
+-- ALTER TABLE jobs ADD COLUMN proxy_key TEXT;
+-- ALTER TABLE jobs ADD COLUMN gpu_seconds REAL DEFAULT 0;
 
 CREATE INDEX IF NOT EXISTS idx_jobs_user_id ON jobs(user_id);
+CREATE INDEX IF NOT EXISTS idx_jobs_group_id ON jobs(group_id);
+CREATE INDEX IF NOT EXISTS idx_jobs_batch_id ON jobs(batch_id);
+
+-- One source video dubbed into several languages: download, prep and
+-- transcription run once per group, then fan out to one child job per language.
+CREATE TABLE IF NOT EXISTS job_groups (
+    group_id    TEXT PRIMARY KEY,
+    user_id     TEXT NOT NULL,
+    source_key  TEXT NOT NULL,
+    modal_call_id TEXT,
+    created_at  TEXT NOT NULL,
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_job_groups_user_id ON job_groups(user_id);
+
+-- Manifest submissions from POST /api/dub/batch
+CREATE TABLE IF NOT EXISTS job_batches (
+    batch_id    TEXT PRIMARY KEY,
+    user_id     TEXT NOT NULL,
+    total_jobs  INTEGER NOT NULL,
+    created_at  TEXT NOT NULL,
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_job_batches_user_id ON job_batches(user_id);
 
 CREATE TABLE IF NOT EXISTS voice_presets (
     voice_preset_id TEXT PRIMARY KEY,
@@ -43,3 +88,138 @@ CREATE TABLE IF NOT EXISTS voice_presets (
 );
 
 CREATE INDEX IF NOT EXISTS idx_voice_presets_user_id ON voice_presets(user_id);
+
+-- ffprobe results for uploaded sources, captured when the upload completes.
+-- Keyed per user, so one account's probe can never replace another's.
+CREATE TABLE IF NOT EXISTS media_probes (
+    file_key          TEXT NOT NULL,
+    user_id           TEXT NOT NULL,
+    duration_sec      REAL,
+    size_bytes        INTEGER,
+    container         TEXT,
+    video_codec       TEXT,
+    width             INTEGER,
+    height            INTEGER,
+    fps               REAL,
+    audio_codec       TEXT,
+    audio_channels    INTEGER,
+    audio_layout      TEXT,
+    audio_sample_rate INTEGER,
+    probed_at         TEXT NOT NULL,
+    PRIMARY KEY (file_key, user_id),
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+);
+
+-- Migration for existing databases (file_key alone was the primary key):
+-- ALTER TABLE media_probes RENAME TO media_probes_old;
+-- (run the CREATE TABLE above)
+-- INSERT INTO media_probes SELECT * FROM media_probes_old;
+-- DROP TABLE media_probes_old;
+
+-- Running least-squares sums of stage seconds vs. video seconds, one row per
+-- pipeline step, so ETA fits never need to scan job history
+CREATE TABLE IF NOT EXISTS stage_timing_fits (
+    stage   INTEGER PRIMARY KEY,
+    n       INTEGER NOT NULL DEFAULT 0,
+    sum_x   REAL NOT NULL DEFAULT 0,
+    sum_y   REAL NOT NULL DEFAULT 0,
+    sum_xx  REAL NOT NULL DEFAULT 0,
+    sum_xy  REAL NOT NULL DEFAULT 0
+);
+
+-- Hourly and daily rollups fed from job state transitions (see stats.py).
+-- Counters only use count/sum; timings also carry min/max and a log-bucketed
+-- histogram so percentiles can be read without touching jobs.
+CREATE TABLE IF NOT EXISTS stats_rollups (
+    granularity   TEXT NOT NULL,
+    period_start  TEXT NOT NULL,
+    metric        TEXT NOT NULL,
+    count         INTEGER NOT NULL DEFAULT 0,
+    sum           REAL NOT NULL DEFAULT 0,
+    min           REAL,
+    max           REAL,
+    PRIMARY KEY (granularity, period_start, metric)
+);
+
+CREATE TABLE IF NOT EXISTS stats_histograms (
+    granularity   TEXT NOT NULL,
+    period_start  TEXT NOT NULL,
+    metric        TEXT NOT NULL,
+    bucket        INTEGER NOT NULL,
+    count         INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (granularity, period_start, metric, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS stats_gauges (
+    name   TEXT PRIMARY KEY,
+    value  INTEGER NOT NULL DEFAULT 0
+);
+
+-- One row per pipeline stage invocation (a Modal call, or a step the
+-- orchestrator runs itself), reported by the orchestrator from the records
+-- every stage writes under /pipeline/{job_id}/metrics/. queue_sec is spawn
+-- to start, container boot included; wall_sec is queue_sec + exec_sec.
+-- warm_saved_sec is the estimated cold start a warm call avoided because the
+-- orchestrator warmed its function ahead of time (ml/warmup.py).
+CREATE TABLE IF NOT EXISTS job_stage_metrics (
+    job_id         TEXT NOT NULL,
+    record_id      TEXT NOT NULL,
+    stage          TEXT NOT NULL,
+    started_at     TEXT NOT NULL,
+    wall_sec       REAL,
+    queue_sec      REAL,
+    exec_sec       REAL NOT NULL,
+    model_load_sec REAL,
+    boot_sec       REAL,
+    cold_start     INTEGER NOT NULL DEFAULT 0,
+    warm_saved_sec REAL,
+    gpu_type       TEXT,
+    video_sec      REAL,
+    segment_count  INTEGER,
+    output_bytes   INTEGER,
+    status         TEXT NOT NULL DEFAULT 'ok',
+    PRIMARY KEY (job_id, record_id),
+    FOREIGN KEY (job_id) REFERENCES jobs(job_id) ON DELETE CASCADE
+);
+
+-- Migration for existing databases:
+-- ALTER TABLE job_stage_metrics ADD COLUMN warm_saved_sec REAL;
+
+-- Segment-level transcripts and translations, written by the pipeline after
+-- the translation step. transcript_fts is an external-content FTS5 index over
+-- them; user_id is indexed so a search only walks one user's postings.
+CREATE TABLE IF NOT EXISTS transcript_segments (
+    segment_id      INTEGER PRIMARY KEY,
+    job_id          TEXT NOT NULL,
+    user_id         TEXT NOT NULL,
+    seq             INTEGER NOT NULL,
+    start_sec       REAL,
+    end_sec         REAL,
+    original_text   TEXT NOT NULL DEFAULT '',
+    translated_text TEXT NOT NULL DEFAULT '',
+    UNIQUE (job_id, seq),
+    FOREIGN KEY (job_id) REFERENCES jobs(job_id) ON DELETE CASCADE
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS transcript_fts USING fts5(
+    user_id, original_text, translated_text,
+    content='transcript_segments', content_rowid='segment_id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS transcript_segments_ai AFTER INSERT ON transcript_segments BEGIN
+    INSERT INTO transcript_fts (rowid, user_id, original_text, translated_text)
+    VALUES (new.segment_id, new.user_id, new.original_text, new.translated_text);
+END;
+
+CREATE TRIGGER IF NOT EXISTS transcript_segments_ad AFTER DELETE ON transcript_segments BEGIN
+    INSERT INTO transcript_fts (transcript_fts, rowid, user_id, original_text, translated_text)
+    VALUES ('delete', old.segment_id, old.user_id, old.original_text, old.translated_text);
+END;
+
+CREATE TRIGGER IF NOT EXISTS transcript_segments_au AFTER UPDATE ON transcript_segments BEGIN
+    INSERT INTO transcript_fts (transcript_fts, rowid, user_id, original_text, translated_text)
+    VALUES ('delete', old.segment_id, old.user_id, old.original_text, old.translated_text);
+    INSERT INTO transcript_fts (rowid, user_id, original_text, translated_text)
+    VALUES (new.segment_id, new.user_id, new.original_text, new.translated_text);
+END;
@@ -0,0 +1,143 @@
+from datetime import datetime, timedelta, timezone
+
+from d1 import fetch_one, fetch_all, batch
+
+_COLUMNS = [
+    "stage", "started_at", "wall_sec", "queue_sec", "exec_sec", "model_load_sec", "boot_sec",
+    "cold_start", "gpu_type", "video_sec", "segment_count", "output_bytes", "status", "warm_saved_sec",
+]
+_KEEP_IF_MISSING = ("wall_sec", "queue_sec", "warm_saved_sec")  # Only known to the container that spawned the call
+
+ESTIMATE_WINDOW_DAYS = 14
+
+
+def _row(record: dict) -> list:
+    started_at = datetime.fromtimestamp(float(record["started_at"]), timezone.utc).isoformat()
+    return [
+        record["stage"], started_at, record.get("wall_sec"), record.get("queue_sec"),
+        float(record["exec_sec"]), record.get("model_load_sec"), record.get("boot_sec"),
+        1 if record.get("cold_start") else 0, record.get("gpu_type"), record.get("video_sec"),
+        record.get("segment_count"), record.get("output_bytes"), record.get("status") or "ok",
+        record.get("warm_saved_sec"),
+    ]
+
+
+async def store_stage_metrics(job_id: str, records: list[dict]) -> int:
+    """Upsert the per-stage records the orchestrator reports for a job.
+
+    Records are keyed by their id, so the repeated reports of a retried job
+    or of a group's shared stages rewrite rows in place. Queue, wall and
+    warm-saved time are only known to the container that spawned a call; a
+    later report without them keeps the values already stored. Returns the
+    number stored.
+    """
+    job = await fetch_one("SELECT job_id FROM jobs WHERE job_id = ?", [job_id])
+    if job is None:
+        raise ValueError(f"Unknown job {job_id}")
+
+    updates = ", ".join(
+        f"{col} = COALESCE(excluded.{col}, {col})" if col in _KEEP_IF_MISSING else f"{col} = excluded.{col}"
+        for col in _COLUMNS
+    )
+    statements = []
+    for record in records:
+        try:
+            params = [job_id, str(record["id"]), *_row(record)]
+        except (KeyError, TypeError, ValueError):
+            print(f"[warn] Skipping malformed stage record for {job_id}: {record}")
+            continue
+        statements.append((
+            f"INSERT INTO job_stage_metrics (job_id, record_id, {', '.join(_COLUMNS)})"
+            f" VALUES ({', '.join('?' * (len(_COLUMNS) + 2))})"
+            f" ON CONFLICT (job_id, record_id) DO UPDATE SET {updates}",
+            params,
+        ))
+    if statements:
+        await batch(statements)
+    return len(statements)
+
+
+async def get_stage_timings(job_id: str) -> dict:
+    """Every stage record of a job plus a per-stage summary, slowest stage first.
+
+    A stage's span runs from the earliest spawn to the latest finish across
+    its calls, so fanned-out stages (lip-sync windows, TTS shards) are not
+    overcounted; total_exec_sec is what they cost in container time.
+    """
+    rows = await fetch_all(
+        f"SELECT record_id, {', '.join(_COLUMNS)} FROM job_stage_metrics"
+        " WHERE job_id = ? ORDER BY started_at",
+        [job_id],
+    )
+
+    summary: dict[str, dict] = {}
+    for row in rows:
+        row["cold_start"] = bool(row["cold_start"])
+        started = datetime.fromisoformat(row["started_at"]).timestamp()
+        spawned = started - (row["queue_sec"] or 0.0)
+        finished = started + row["exec_sec"]
+        stage = summary.setdefault(row["stage"], {
+            "stage": row["stage"], "calls": 0, "cold_starts": 0, "first": spawned, "last": finished,
+            "total_exec_sec": 0.0, "max_queue_sec": None, "model_load_sec": 0.0, "warm_saved_sec": 0.0,
+            "video_sec": 0.0, "segment_count": 0, "output_bytes": 0, "gpu_types": [], "errors": 0,
+        })
+        stage["calls"] += 1
+        stage["cold_starts"] += row["cold_start"]
+        stage["errors"] += row["status"] != "ok"
+        stage["first"] = min(stage["first"], spawned)
+        stage["last"] = max(stage["last"], finished)
+        stage["total_exec_sec"] += row["exec_sec"]
+        stage["model_load_sec"] += row["model_load_sec"] or 0.0
+        stage["warm_saved_sec"] += row["warm_saved_sec"] or 0.0
+        if row["queue_sec"] is not None:
+            stage["max_queue_sec"] = max(stage["max_queue_sec"] or 0.0, row["queue_sec"])
+        for key in ("video_sec", "segment_count", "output_bytes"):
+            stage[key] += row[key] or 0
+        if row["gpu_type"] and row["gpu_type"] not in stage["gpu_types"]:
+            stage["gpu_types"].append(row["gpu_type"])
+
+    stages = []
+    for stage in summary.values():
+        stage["span_sec"] = round(stage.pop("last") - stage.pop("first"), 3)
+        stage["total_exec_sec"] = round(stage["total_exec_sec"], 3)
+        stage["model_load_sec"] = round(stage["model_load_sec"], 3)
+        stage["warm_saved_sec"] = round(stage["warm_saved_sec"], 3)
+        stages.append(stage)
+    stages.sort(key=lambda s: s["span_sec"], reverse=True)
+
+    return {
+        "job_id": job_id,
+        "bottleneck": stages[0]["stage"] if stages else None,
+        "warm_saved_sec": round(sum(s["warm_saved_sec"] for s in stages), 3),
+        "stages": stages,
+        "records": rows,
+    }
+
+
+async def get_stage_estimates(days: int = ESTIMATE_WINDOW_DAYS) -> dict:
+    """Per-stage duration and cold-start history the orchestrator times warm-ups from.
+
+    sec_per_video_sec is a stage's mean wall time (exec time when the wall
+    time is unknown) per second of source video; cold_start_sec is the mean
+    queue plus model load time of its cold calls. Only successful calls of
+    the last `days` days count.
+    """
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    rows = await fetch_all(
+        "SELECT m.stage, COUNT(*) AS calls,"
+        " AVG(COALESCE(m.wall_sec, m.exec_sec) / j.duration_sec) AS sec_per_video_sec,"
+        " AVG(CASE WHEN m.cold_start = 1 THEN COALESCE(m.queue_sec, m.boot_sec, 0) + COALESCE(m.model_load_sec, 0) END)"
+        " AS cold_start_sec"
+        " FROM job_stage_metrics m JOIN jobs j ON j.job_id = m.job_id"
+        " WHERE m.status = 'ok' AND j.duration_sec > 0 AND m.started_at >= ?"
+        " GROUP BY m.stage",
+        [since],
+    )
+    return {
+        row["stage"]: {
+            "calls": row["calls"],
+            "sec_per_video_sec": round(row["sec_per_video_sec"], 4) if row["sec_per_video_sec"] is not None else None,
+            "cold_start_sec": round(row["cold_start_sec"], 3) if row["cold_start_sec"] is not None else None,
+        }
+        for row in rows
+    }
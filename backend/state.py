@@ -0,0 +1,230 @@
+"""Shared state for running several uvicorn workers or hosts.
+
+Anything that must be visible to every worker — job event pub/sub, TTL
+caches, rate-limit buckets and leader leases — goes through the backend
+returned by get_state(). Set STATE_BACKEND_URL=redis://host:6379/0 in
+production; when it is unset an in-process backend is used, which is also
+what local dev and tests run against.
+"""
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from collections.abc import AsyncIterator, Awaitable, Callable
+
+BUCKET_SWEEP_SEC = 60.0  # How often the in-process backend drops buckets that have refilled
+
+
+class InMemoryState:
+    """Single-process stand-in for the Redis backend with the same semantics."""
+
+    def __init__(self):
+        self._channels: dict[str, set[asyncio.Queue]] = {}
+        self._cache: dict[str, tuple[float, object]] = {}
+        self._buckets: dict[str, tuple[float, float, float]] = {}  # key -> (tokens, last, full_at)
+        self._next_sweep = 0.0
+        self._leases: dict[str, tuple[str, float]] = {}
+
+    # ── Pub/sub ───────────────────────────────────────────────────
+
+    async def publish(self, channel: str, message: dict):
+        for queue in self._channels.get(channel, ()):
+            queue.put_nowait(message)
+
+    async def subscribe(self, channel: str, heartbeat: float = 15.0) -> AsyncIterator[dict | None]:
+        """Yield messages published on channel; yields None every `heartbeat` idle seconds."""
+        queue: asyncio.Queue = asyncio.Queue()
+        self._channels.setdefault(channel, set()).add(queue)
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            subscribers = self._channels.get(channel)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._channels[channel]
+
+    # ── TTL cache ─────────────────────────────────────────────────
+
+    async def cache_get(self, key: str):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._cache[key]
+            return None
+        return value
+
+    async def cache_set(self, key: str, value, ttl: float):
+        self._cache[key] = (time.monotonic() + ttl, value)
+
+    async def cache_delete(self, key: str):
+        self._cache.pop(key, None)
+
+    # ── Token-bucket rate limits ──────────────────────────────────
+
+    async def take_token(self, key: str, rate: float, capacity: float, cost: float = 1.0) -> bool:
+        """Refill at `rate` tokens/s up to `capacity`; return True if `cost` tokens were taken."""
+        now = time.monotonic()
+        self._sweep_buckets(now)
+        tokens, last, _ = self._buckets.get(key, (capacity, now, now))
+        tokens = min(capacity, tokens + (now - last) * rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+        return allowed
+
+    def _sweep_buckets(self, now: float):
+        # A full bucket is the same as a missing one, so drop them like Redis expires its keys
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + BUCKET_SWEEP_SEC
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+
+    # ── Leader election ───────────────────────────────────────────
+
+    async def acquire_leadership(self, name: str, holder: str, ttl: float) -> bool:
+        """Take or renew the lease on `name`. Returns True while `holder` is the leader."""
+        now = time.monotonic()
+        current = self._leases.get(name)
+        if current is None or current[1] <= now or current[0] == holder:
+            self._leases[name] = (holder, now + ttl)
+            return True
+        return False
+
+    async def release_leadership(self, name: str, holder: str):
+        current = self._leases.get(name)
+        if current is not None and current[0] == holder:
+            del self._leases[name]
+
+
+# Token bucket evaluated atomically on the Redis server, using the server clock
+# so hosts with skewed clocks share one refill timeline.
+_TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or capacity
+local ts = tonumber(data[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate)
+local allowed = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return allowed
+"""
+
+_ACQUIRE_LEASE_LUA = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+  return 1
+end
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  redis.call('PEXPIRE', KEYS[1], ARGV[2])
+  return 1
+end
+return 0
+"""
+
+_RELEASE_LEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisState:
+    """Shared state over the Redis protocol (Redis, Valkey, KeyDB, ...)."""
+
+    def __init__(self, url: str, prefix: str = "redub:"):
+        import redis.asyncio as redis  # optional dependency, only needed when configured
+
+        self._redis = redis.from_url(url, decode_responses=True)
+        self._prefix = prefix
+        self._token_bucket = self._redis.register_script(_TOKEN_BUCKET_LUA)
+        self._acquire_lease = self._redis.register_script(_ACQUIRE_LEASE_LUA)
+        self._release_lease = self._redis.register_script(_RELEASE_LEASE_LUA)
+
+    async def publish(self, channel: str, message: dict):
+        await self._redis.publish(self._prefix + channel, json.dumps(message))
+
+    async def subscribe(self, channel: str, heartbeat: float = 15.0) -> AsyncIterator[dict | None]:
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(self._prefix + channel)
+        try:
+            while True:
+                msg = await pubsub.get_message(ignore_subscribe_messages=True, timeout=heartbeat)
+                yield json.loads(msg["data"]) if msg else None
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+
+    async def cache_get(self, key: str):
+        raw = await self._redis.get(self._prefix + "cache:" + key)
+        return json.loads(raw) if raw is not None else None
+
+    async def cache_set(self, key: str, value, ttl: float):
+        await self._redis.set(self._prefix + "cache:" + key, json.dumps(value), px=int(ttl * 1000))
+
+    async def cache_delete(self, key: str):
+        await self._redis.delete(self._prefix + "cache:" + key)
+
+    async def take_token(self, key: str, rate: float, capacity: float, cost: float = 1.0) -> bool:
+        allowed = await self._token_bucket(keys=[self._prefix + "rl:" + key], args=[rate, capacity, cost])
+        return bool(allowed)
+
+    async def acquire_leadership(self, name: str, holder: str, ttl: float) -> bool:
+        acquired = await self._acquire_lease(keys=[self._prefix + "leader:" + name], args=[holder, int(ttl * 1000)])
+        return bool(acquired)
+
+    async def release_leadership(self, name: str, holder: str):
+        await self._release_lease(keys=[self._prefix + "leader:" + name], args=[holder])
+
+
+_state = None
+
+
+def get_state() -> InMemoryState | RedisState:
+    """Return the process-wide shared-state backend, creating it on first use."""
+    global _state
+    if _state is None:
+        url = os.getenv("STATE_BACKEND_URL")
+        _state = RedisState(url) if url else InMemoryState()
+    return _state
+
+
+async def run_as_leader(name: str, interval: float, task: Callable[[], Awaitable[None]]):
+    """Run `task` every `interval` seconds on whichever worker currently holds the lease.
+
+    Every worker calls this; the lease TTL is three intervals, so a dead
+    leader is replaced within that window.
+    """
+    holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    state = get_state()
+    try:
+        while True:
+            try:
+                if await state.acquire_leadership(name, holder, ttl=interval * 3):
+                    await task()
+            except Exception as e:
+                print(f"[warn] Background task {name} failed: {e}")
+            await asyncio.sleep(interval)
+    finally:
+        try:
+            await state.release_leadership(name, holder)
+        except Exception:
+            pass
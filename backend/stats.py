@@ -0,0 +1,203 @@
+import math
+from datetime import datetime, timedelta, timezone
+
+import modal
+
+from d1 import fetch_all, batch
+
+# Each observation is folded into an hourly and a daily row at write time, so
+# reads never touch the jobs table. Distributions are kept as log-scale
+# histograms (≈10% bucket width) so percentiles survive aggregation.
+GRANULARITIES = {
+    "hour": "%Y-%m-%dT%H:00Z",
+    "day": "%Y-%m-%d",
+}
+HISTOGRAM_BASE = 1.2
+NON_POSITIVE_BUCKET = -10_000
+PERCENTILES = (50, 95, 99)
+
+# Gauges tracked from state transitions
+GAUGE_PENDING = "jobs_pending"
+GAUGE_PROCESSING = "jobs_processing"
+
+# Hit/miss counters written by the ML stages' artifact cache (ml/artifact_cache.py)
+CACHE_STATS_DICT = "redub-cache-stats"
+
+
+def _bucket(value: float) -> int:
+    if value <= 0:
+        return NON_POSITIVE_BUCKET
+    return math.floor(math.log(value, HISTOGRAM_BASE))
+
+
+def _bucket_value(bucket: int) -> float:
+    """Geometric midpoint of a histogram bucket."""
+    if bucket == NON_POSITIVE_BUCKET:
+        return 0.0
+    return HISTOGRAM_BASE ** (bucket + 0.5)
+
+
+def observe(metric: str, value: float = None, count: int = 1, at: datetime = None) -> list[tuple[str, list]]:
+    """Statements recording one observation (or a `count` bump when value is None)."""
+    at = at or datetime.now(timezone.utc)
+    statements = []
+    for granularity, fmt in GRANULARITIES.items():
+        period = at.strftime(fmt)
+        total = count if value is None else value
+        statements.append((
+            "INSERT INTO stats_rollups (granularity, period_start, metric, count, sum, min, max)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT(granularity, period_start, metric) DO UPDATE SET"
+            " count = count + excluded.count, sum = sum + excluded.sum,"
+            " min = MIN(COALESCE(min, excluded.min), excluded.min),"
+            " max = MAX(COALESCE(max, excluded.max), excluded.max)",
+            [granularity, period, metric, count, total, value, value],
+        ))
+        if value is not None:
+            statements.append((
+                "INSERT INTO stats_histograms (granularity, period_start, metric, bucket, count)"
+                " VALUES (?, ?, ?, ?, 1)"
+                " ON CONFLICT(granularity, period_start, metric, bucket) DO UPDATE SET count = count + 1",
+                [granularity, period, metric, _bucket(value)],
+            ))
+    return statements
+
+
+def adjust_gauge(name: str, delta: int) -> list[tuple[str, list]]:
+    return [(
+        "INSERT INTO stats_gauges (name, value) VALUES (?, ?)"
+        " ON CONFLICT(name) DO UPDATE SET value = MAX(value + excluded.value, 0)",
+        [name, delta],
+    )]
+
+
+def transition(prev_status: str | None, new_status: str, count: int = 1) -> list[tuple[str, list]]:
+    """Gauge and counter statements for `count` jobs moving between statuses.
+
+    prev_status is None for newly submitted jobs.
+    """
+    gauges = {"PENDING": GAUGE_PENDING, "PROCESSING": GAUGE_PROCESSING}
+    statements = []
+    if prev_status == new_status:
+        return statements
+    if prev_status is None:
+        statements += observe("jobs_submitted", count=count)
+    if prev_status in gauges:
+        statements += adjust_gauge(gauges[prev_status], -count)
+    if new_status in gauges:
+        statements += adjust_gauge(gauges[new_status], count)
+    if new_status in ("COMPLETED", "FAILED", "CANCELLED"):
+        statements += observe(f"jobs_{new_status.lower()}", count=count)
+    return statements
+
+
+async def record(statements: list[tuple[str, list]]):
+    """Write rollup statements in one D1 round trip. Stats never fail the caller."""
+    if not statements:
+        return
+    try:
+        await batch(statements)
+    except Exception as e:
+        print(f"[warn] Could not record stats: {e}")
+
+
+def _percentiles(histogram: dict[int, int]) -> dict:
+    total = sum(histogram.values())
+    result = {}
+    if not total:
+        return result
+    buckets = sorted(histogram.items())
+    for p in PERCENTILES:
+        rank = math.ceil(total * p / 100)
+        seen = 0
+        for bucket, count in buckets:
+            seen += count
+            if seen >= rank:
+                result[f"p{p}"] = round(_bucket_value(bucket), 3)
+                break
+    return result
+
+
+async def query_stats(granularity: str, start: datetime, end: datetime, metric: str = None) -> dict:
+    """Per-period series and whole-range totals for every metric (or one) in [start, end]."""
+    fmt = GRANULARITIES[granularity]
+    params = [granularity, start.strftime(fmt), end.strftime(fmt)]
+    where = "granularity = ? AND period_start BETWEEN ? AND ?"
+    if metric:
+        where += " AND metric = ?"
+        params.append(metric)
+
+    rollups = await fetch_all(
+        f"SELECT period_start, metric, count, sum, min, max FROM stats_rollups WHERE {where}"
+        " ORDER BY metric, period_start",
+        params,
+    )
+    histograms = await fetch_all(
+        f"SELECT period_start, metric, bucket, count FROM stats_histograms WHERE {where}",
+        params,
+    )
+
+    per_period: dict[tuple, dict[int, int]] = {}
+    per_metric: dict[str, dict[int, int]] = {}
+    for row in histograms:
+        per_period.setdefault((row["metric"], row["period_start"]), {})[row["bucket"]] = row["count"]
+        merged = per_metric.setdefault(row["metric"], {})
+        merged[row["bucket"]] = merged.get(row["bucket"], 0) + row["count"]
+
+    series: dict[str, list] = {}
+    totals: dict[str, dict] = {}
+    for row in rollups:
+        name = row["metric"]
+        point = {
+            "period_start": row["period_start"],
+            "count": row["count"],
+            "sum": row["sum"],
+        }
+        if row["min"] is not None:
+            point.update(
+                avg=round(row["sum"] / row["count"], 3),
+                min=row["min"],
+                max=row["max"],
+                **_percentiles(per_period.get((name, row["period_start"]), {})),
+            )
+        series.setdefault(name, []).append(point)
+
+        agg = totals.setdefault(name, {"count": 0, "sum": 0.0})
+        agg["count"] += row["count"]
+        agg["sum"] += row["sum"]
+        if row["min"] is not None:
+            agg["min"] = min(agg.get("min", row["min"]), row["min"])
+            agg["max"] = max(agg.get("max", row["max"]), row["max"])
+
+    for name, agg in totals.items():
+        if "min" in agg:
+            agg["avg"] = round(agg["sum"] / agg["count"], 3)
+            agg.update(_percentiles(per_metric.get(name, {})))
+
+    return {"series": series, "totals": totals}
+
+
+async def get_gauges() -> dict:
+    rows = await fetch_all("SELECT name, value FROM stats_gauges")
+    return {r["name"]: r["value"] for r in rows}
+
+
+async def get_cache_hit_rates() -> dict:
+    """{stage kind: {"hits", "misses", "hit_rate"}} for the pipeline artifact cache."""
+    rates = {}
+    try:
+        counters = modal.Dict.from_name(CACHE_STATS_DICT, create_if_missing=True)
+        async for name, count in counters.items.aio():
+            kind, outcome = name.rsplit(":", 1)
+            rates.setdefault(kind, {"hits": 0, "misses": 0})[outcome] = count
+    except Exception as e:
+        print(f"[warn] Could not read cache stats: {e}")
+    for counts in rates.values():
+        lookups = counts["hits"] + counts["misses"]
+        counts["hit_rate"] = round(counts["hits"] / lookups, 4) if lookups else 0.0
+    return rates
+
+
+def default_range(granularity: str) -> tuple[datetime, datetime]:
+    end = datetime.now(timezone.utc)
+    return end - (timedelta(hours=24) if granularity == "hour" else timedelta(days=30)), end
@@ -0,0 +1,109 @@
+import re
+
+from d1 import fetch_one, fetch_all, batch
+
+MAX_SEARCH_RESULTS = 100
+MAX_HITS_PER_PROJECT = 5  # So one long project can't crowd every other match out of the limit
+MAX_QUERY_TERMS = 16
+SNIPPET_TOKENS = 12
+
+# Word characters as FTS5's unicode61 tokenizer sees them
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+
+async def store_transcript(job_id: str, segments: list[dict]) -> int:
+    """Replace a job's segment transcript and translation.
+
+    Triggers on transcript_segments keep the transcript_fts index in step, so
+    redelivered webhooks simply rewrite the rows. Returns the number stored.
+    """
+    job = await fetch_one("SELECT user_id FROM jobs WHERE job_id = ?", [job_id])
+    if job is None:
+        raise ValueError(f"Unknown job {job_id}")
+
+    statements = [("DELETE FROM transcript_segments WHERE job_id = ?", [job_id])]
+    for seq, seg in enumerate(segments):
+        statements.append((
+            "INSERT INTO transcript_segments (job_id, user_id, seq, start_sec, end_sec, original_text, translated_text)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [job_id, job["user_id"], seq, seg.get("start"), seg.get("end"),
+             (seg.get("original_text") or "").strip(), (seg.get("translated_text") or "").strip()],
+        ))
+    await batch(statements)
+    return len(segments)
+
+
+async def get_transcript(job_id: str, user_id: str) -> list[dict]:
+    return await fetch_all(
+        "SELECT seq, start_sec, end_sec, original_text, translated_text FROM transcript_segments"
+        " WHERE job_id = ? AND user_id = ? ORDER BY seq",
+        [job_id, user_id],
+    )
+
+
+def _match_expression(user_id: str, query: str) -> str | None:
+    """Build an FTS5 MATCH expression from free text.
+
+    Every word is quoted so user input can never be read as FTS5 syntax; the
+    last word is a prefix match so partial words still hit. The user_id
+    column filter scopes the lookup to one user's postings.
+    """
+    terms = _TERM_RE.findall(query)[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    quoted = [f'"{t}"' for t in terms]
+    quoted[-1] += "*"
+    user = user_id.replace('"', '""')
+    return f'{{user_id}}: "{user}" AND {{original_text translated_text}}: ({" ".join(quoted)})'
+
+
+async def search_transcripts(user_id: str, query: str, limit: int = 50) -> list[dict]:
+    """Rank a user's transcript segments against query, grouped by project.
+
+    Projects are ordered by their best hit; each carries its timestamped hits.
+    limit counts hits, not projects, and each project contributes at most
+    its MAX_HITS_PER_PROJECT best. The segment's own user_id is checked as
+    well as the FTS column filter.
+    """
+    expression = _match_expression(user_id, query)
+    if expression is None:
+        return []
+    # snippet() and bm25() only work in the query that runs the MATCH, so it is
+    # materialized before the per-project window function sees it
+    rows = await fetch_all(
+        "WITH matched AS MATERIALIZED ("
+        "SELECT s.job_id, s.seq, s.start_sec, s.end_sec,"
+        f" snippet(transcript_fts, 1, '<b>', '</b>', '…', {SNIPPET_TOKENS}) AS original_snippet,"
+        f" snippet(transcript_fts, 2, '<b>', '</b>', '…', {SNIPPET_TOKENS}) AS translated_snippet,"
+        " bm25(transcript_fts) AS rank"
+        " FROM transcript_fts"
+        " JOIN transcript_segments s ON s.segment_id = transcript_fts.rowid"
+        " WHERE transcript_fts MATCH ? AND s.user_id = ?"
+        "), ranked AS ("
+        "SELECT *, ROW_NUMBER() OVER (PARTITION BY job_id ORDER BY rank) AS project_hit FROM matched"
+        ")"
+        " SELECT r.job_id, r.seq, r.start_sec, r.end_sec, r.original_snippet, r.translated_snippet,"
+        " j.project_name, j.target_language"
+        " FROM ranked r"
+        " JOIN jobs j ON j.job_id = r.job_id"
+        " WHERE r.project_hit <= ?"
+        " ORDER BY r.rank LIMIT ?",
+        [expression, user_id, MAX_HITS_PER_PROJECT, min(limit, MAX_SEARCH_RESULTS)],
+    )
+
+    projects: dict[str, dict] = {}
+    for row in rows:
+        project = projects.setdefault(row["job_id"], {
+            "job_id": row["job_id"],
+            "project_name": row["project_name"],
+            "target_language": row["target_language"],
+            "hits": [],
+        })
+        project["hits"].append({
+            "seq": row["seq"],
+            "start": row["start_sec"],
+            "end": row["end_sec"],
+            "original": row["original_snippet"],
+            "translated": row["translated_snippet"],
+        })
+    return list(projects.values())
@@ -48,7 +48,7 @@ export default function PolyGlotDubs() {
 
   function handleCardClick(p) {
     if (p.status === "COMPLETED") {
-      navigate("/preview", { state: { downloadUrl: p.download_url, job_id: p.job_id, target_language: p.target_language, project_name: p.project_name } });
+      navigate("/preview", { state: { downloadUrl: p.preview_url || p.download_url, posterUrl: p.poster_url, job_id: p.job_id, target_language: p.target_language, project_name: p.project_name } });
     } else if (p.status === "PROCESSING" || p.status === "PENDING") {
       navigate("/loading", { state: { job_id: p.job_id } });
     }
@@ -109,23 +109,36 @@ export default function PolyGlotDubs() {
 function ProjectCard({ project: p, onClick }) {
   const st = STATUS[p.status] || STATUS.FAILED;
   const isClickable = p.status !== "FAILED";
+  const [hovered, setHovered] = useState(false);
 
   return (
     <div
       style={{ ...styles.card, cursor: isClickable ? "pointer" : "default" }}
       onClick={isClickable ? onClick : undefined}
+      onMouseEnter={() => setHovered(true)}
+      onMouseLeave={() => setHovered(false)}
     >
       {/* Thumbnail */}
       <div style={styles.thumb}>
         {p.status === "COMPLETED" ? (
           <div style={styles.playThumb}>
-            <video
-              src={p.download_url}
-              muted
-              preload="metadata"
-              style={styles.thumbImg}
-              onLoadedMetadata={e => { e.target.currentTime = 1; }}
-            />
+            {p.poster_url ? (
+              // Poster at rest, animated strip on hover — no video bytes until the card is opened
+              <img
+                src={hovered && p.thumbs_url ? p.thumbs_url : p.poster_url}
+                alt=""
+                loading="lazy"
+                style={styles.thumbImg}
+              />
+            ) : (
+              <video
+                src={p.preview_url || p.download_url}
+                muted
+                preload="metadata"
+                style={styles.thumbImg}
+                onLoadedMetadata={e => { e.target.currentTime = 1; }}
+              />
+            )}
             <div style={styles.thumbOverlay} />
             <div style={styles.playBtn}>
               <svg width="18" height="18" viewBox="0 0 24 24" fill="white">
@@ -48,7 +48,7 @@ export default function LoadingScreen() {
           clearInterval(intervalRef.current);
           setCurrentStep(STEPS.length - 1);
           setDone(true);
-          setTimeout(() => navigate("/preview", { state: { downloadUrl: data.download_url, job_id: jobId, target_language: data.target_language } }), 1000);
+          setTimeout(() => navigate("/preview", { state: { downloadUrl: data.preview_url || data.download_url, posterUrl: data.poster_url, job_id: jobId, target_language: data.target_language } }), 1000);
           return;
         }
 
@@ -59,6 +59,13 @@ export default function LoadingScreen() {
           return;
         }
 
+        if (data.status === "CANCELLED") {
+          clearInterval(intervalRef.current);
+          setFailed(true);
+          setErrorMsg("This dub was cancelled.");
+          return;
+        }
+
         // PROCESSING: step is 1-5 from orchestrator
         if (data.step >= 1) {
           setCurrentStep(data.step - 1); // convert to 0-indexed
@@ -6,7 +6,7 @@ import { authFetch } from "../auth";
 export default function VideoPreview() {
   const navigate = useNavigate();
   const location = useLocation();
-  const { downloadUrl, job_id, target_language, project_name } = location.state ?? {};
+  const { downloadUrl, posterUrl, job_id, target_language, project_name } = location.state ?? {};
   const videoRef = useRef(null);
   const [isPlaying, setIsPlaying] = useState(false);
   const [currentTime, setCurrentTime] = useState(0);
@@ -115,6 +115,7 @@ export default function VideoPreview() {
               <video
                 ref={videoRef}
                 src={downloadUrl}
+                poster={posterUrl}
                 style={styles.thumbnail}
                 playsInline
                 onEnded={() => setIsPlaying(false)}
@@ -0,0 +1,231 @@
+import modal
+import os
+import json
+
+# 1. Define the Modal App
+app = modal.App("redub-gc")
+
+# 2. Persistent volume shared across all pipeline apps
+pipeline_vol = modal.Volume.from_name("redub-pipeline", create_if_missing=True)
+
+# "active:{work_id}:{run}" flags set by the orchestrator while a run uses a directory
+job_control = modal.Dict.from_name("redub-job-control", create_if_missing=True)
+
+# 3. Define the Environment — CPU only
+gc_image = (
+    modal.Image.debian_slim(python_version="3.11")
+    .add_local_python_source("artifact_cache")
+)
+
+# ── Retention policy ──────────────────────────────────────────────
+
+DAY = 24 * 3600
+
+# First matching pattern (relative to /pipeline/{work_id}/) wins. Intermediates
+# go first; outputs and the manifest stay long enough to resume or re-publish.
+RETENTION = [
+    ("segments/*", 1 * DAY),
+    ("windows/*", 1 * DAY),
+    ("clips/*", 2 * DAY),
+    ("asr_16k.f32", 2 * DAY),
+    ("voice_22k.wav", 3 * DAY),
+    ("speaker_ref.wav", 3 * DAY),
+    ("speech.json", 3 * DAY),
+    ("mezzanine.mp4", 3 * DAY),
+    ("scenes.json", 3 * DAY),
+    ("source.mp4", 7 * DAY),
+    ("dubbed_audio.wav", 14 * DAY),
+    ("dubbed_output.mp4", 14 * DAY),
+    ("manifest.json", 30 * DAY),
+    ("metrics/*", 30 * DAY),
+]
+DEFAULT_RETENTION = 7 * DAY
+FINETUNE_RETENTION = 1 * DAY  # finetune_* dirs only survive a run when it failed
+
+ACTIVE_GRACE_SEC = 3600          # Never touch a directory written to this recently
+ACTIVE_FLAG_MAX_AGE = 12 * 3600  # Older flags are left over from crashed runs
+
+SKIP_DIRS = {"cache", ".gc"}     # The artifact cache is trimmed by artifact_cache.evict() below
+INDEX_PATH = "/pipeline/.gc/index.json"
+REPORT_HISTORY = 30
+
+
+def _retention(rel_path: str) -> int:
+    from fnmatch import fnmatch
+
+    for pattern, seconds in RETENTION:
+        if fnmatch(rel_path, pattern):
+            return seconds
+    return DEFAULT_RETENTION
+
+
+def _signature(work_dir: str) -> list[float]:
+    """mtimes of the directory and its immediate subdirectories.
+
+    Adding or removing a file changes its parent's mtime, and pipeline
+    files are written once, so an unchanged signature means the indexed
+    file list is still accurate without walking it.
+    """
+    sig = [os.path.getmtime(work_dir)]
+    for entry in sorted(os.scandir(work_dir), key=lambda e: e.name):
+        if entry.is_dir(follow_symlinks=False):
+            sig.append(entry.stat().st_mtime)
+    return sig
+
+
+def _scan(work_dir: str) -> dict:
+    files = {}
+    for root, _, names in os.walk(work_dir):
+        for name in names:
+            path = f"{root}/{name}"
+            st = os.stat(path)
+            files[os.path.relpath(path, work_dir)] = [st.st_size, st.st_mtime]
+    return files
+
+
+def _load_index() -> dict:
+    try:
+        with open(INDEX_PATH) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"dirs": {}, "runs": []}
+
+
+def _save_index(index: dict):
+    os.makedirs(os.path.dirname(INDEX_PATH), exist_ok=True)
+    tmp_path = f"{INDEX_PATH}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, INDEX_PATH)
+
+
+def _active_work_ids(now: float) -> set[str]:
+    active = set()
+    for key, started in job_control.items():
+        if isinstance(key, str) and key.startswith("active:") and now - float(started) < ACTIVE_FLAG_MAX_AGE:
+            active.add(key.split(":")[1])
+    return active
+
+
+def _started_since(work_id: str) -> bool:
+    """Whether a run flagged work_id after the GC read the flags, e.g. a retry; checked right before deleting."""
+    import time
+
+    return work_id in _active_work_ids(time.time())
+
+
+def _remove_empty_dirs(work_dir: str):
+    for root, _, _ in sorted(os.walk(work_dir), key=lambda w: len(w[0]), reverse=True):
+        if not os.listdir(root):
+            os.rmdir(root)
+
+
+# 4. Scheduled GC Function
+@app.function(
+    image=gc_image,
+    schedule=modal.Period(hours=6),
+    timeout=3600,
+    volumes={"/pipeline": pipeline_vol}
+)
+def collect_garbage(dry_run: bool = False) -> dict:
+    """Delete pipeline files past their retention and report what was reclaimed.
+
+    Directories of running jobs (flagged in redub-job-control, re-checked
+    just before deleting) or written to within ACTIVE_GRACE_SEC are
+    skipped. File sizes and ages come from a size index kept at
+    /pipeline/.gc/index.json; a directory is only re-walked when its
+    signature changed since the last run. A dry run writes nothing.
+    """
+    import shutil
+    import time
+    import artifact_cache
+
+    pipeline_vol.reload()
+    now = time.time()
+    index = _load_index()
+    active = _active_work_ids(now)
+    report = {"at": now, "reclaimed_bytes": 0, "files_deleted": 0, "dirs_removed": 0,
+              "dirs_rescanned": 0, "dirs_skipped_active": 0, "dry_run": dry_run}
+
+    present = {e.name for e in os.scandir("/pipeline") if e.is_dir() and e.name not in SKIP_DIRS}
+    for work_id in list(index["dirs"]):
+        if work_id not in present:
+            del index["dirs"][work_id]
+
+    for work_id in sorted(present):
+        work_dir = f"/pipeline/{work_id}"
+        entry = index["dirs"].get(work_id)
+        signature = _signature(work_dir)
+        if entry is None or entry["signature"] != signature:
+            entry = index["dirs"][work_id] = {"signature": signature, "files": _scan(work_dir)}
+            report["dirs_rescanned"] += 1
+
+        files = entry["files"]
+        newest = max((mtime for _, mtime in files.values()), default=os.path.getmtime(work_dir))
+        if work_id in active or now - newest < ACTIVE_GRACE_SEC:
+            report["dirs_skipped_active"] += 1
+            continue
+
+        if work_id.startswith("finetune_"):
+            if now - newest >= FINETUNE_RETENTION:
+                if _started_since(work_id):
+                    report["dirs_skipped_active"] += 1
+                    continue
+                report["reclaimed_bytes"] += sum(size for size, _ in files.values())
+                report["files_deleted"] += len(files)
+                report["dirs_removed"] += 1
+                if not dry_run:
+                    shutil.rmtree(work_dir, ignore_errors=True)
+                    del index["dirs"][work_id]
+            continue
+
+        expired = [rel for rel, (_, mtime) in files.items() if now - mtime >= _retention(rel)]
+        if expired and _started_since(work_id):
+            report["dirs_skipped_active"] += 1
+            continue
+        for rel in expired:
+            size, _ = files[rel]
+            report["reclaimed_bytes"] += size
+            report["files_deleted"] += 1
+            if not dry_run:
+                try:
+                    os.remove(f"{work_dir}/{rel}")
+                except FileNotFoundError:
+                    pass
+                del files[rel]
+        if expired and not dry_run:
+            _remove_empty_dirs(work_dir)
+            if not os.path.exists(work_dir):
+                report["dirs_removed"] += 1
+                del index["dirs"][work_id]
+            else:
+                entry["signature"] = _signature(work_dir)
+
+    if not dry_run:
+        report["reclaimed_bytes"] += artifact_cache.evict()
+    report["volume_bytes"] = sum(
+        size for entry in index["dirs"].values() for size, _ in entry["files"].values()
+    )
+    # A dry run leaves the volume untouched, index included
+    if not dry_run:
+        index["runs"] = (index["runs"] + [report])[-REPORT_HISTORY:]
+        _save_index(index)
+        pipeline_vol.commit()
+
+    print(f"GC{' (dry run)' if dry_run else ''}: reclaimed {report['reclaimed_bytes'] / 1024 ** 3:.2f} GB "
+          f"from {report['files_deleted']} files, removed {report['dirs_removed']} dirs, "
+          f"rescanned {report['dirs_rescanned']}, skipped {report['dirs_skipped_active']} active; "
+          f"{report['volume_bytes'] / 1024 ** 3:.2f} GB of job data remain")
+    return report
+
+
+# 5. Local Entrypoint
+@app.local_entrypoint()
+def main(dry_run: bool = True):
+    """
+    Preview what the next scheduled run would delete:
+      modal run ml/app_gc.py
+    Collect for real:
+      modal run ml/app_gc.py --no-dry-run
+    """
+    print(json.dumps(collect_garbage.remote(dry_run=dry_run), indent=2))
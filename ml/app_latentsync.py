@@ -43,19 +43,17 @@ latentsync_image = (
         "safetensors",
         "av",
     )
+    .pip_install("boto3")
+    .add_local_python_source("lipsync_windows", "preprocess", "r2_upload", "telemetry")
 )
 
-# 4. Define the Heavy GPU Function
-# Must use H100 — LatentSync will OOM on T4 or A10G.
-@app.function(
-    image=latentsync_image,
-    gpu="H200",
-    timeout=1800,
-    volumes={"/models": model_vol, "/pipeline": pipeline_vol}
-)
-def sync_lip_movements(job_id: str):
+LATENTSYNC_DIR = "/models/latentsync"
+LATENTSYNC_SCRIPT = f"{LATENTSYNC_DIR}/scripts/inference.py"
+
+
+def _ensure_latentsync():
+    """Clone LatentSync and download its checkpoints to the model volume on first use."""
     import subprocess
-    import tempfile
 
     # LATENTSYNC_DIR = "/models/latentsync"
     # LATENTSYNC_SENTINEL = f"{LATENTSYNC_DIR}/inference.py"
@@ -76,15 +74,6 @@ def sync_lip_movements(job_id: str):
     #     model_vol.commit()
     #     print("LatentSync weights cached to volume.")
 
-    # source_video_path = f"/pipeline/{job_id}/source.mp4"
-    # dubbed_audio_path = f"/pipeline/{job_id}/dubbed_audio.wav"
-    # output_video_path = tempfile.mktemp(suffix=".mp4")
-
-    # print("Running LatentSync diffusion inference...")
-
-    LATENTSYNC_DIR = "/models/latentsync"
-    LATENTSYNC_SCRIPT = f"{LATENTSYNC_DIR}/scripts/inference.py"
-
     if not os.path.exists(LATENTSYNC_SCRIPT):
         print("Cold start: cloning LatentSync repo and downloading checkpoints to volume...")
         # Clean up any partial clone
@@ -107,8 +96,16 @@ def sync_lip_movements(job_id: str):
     else:
         print("LatentSync repo and weights found on volume.")
 
-    source_video_path = f"/pipeline/{job_id}/source.mp4"
-    dubbed_audio_path = f"/pipeline/{job_id}/dubbed_audio.wav"
+
+def _run_latentsync(source_video_path: str, dubbed_audio_path: str, start: float = None, duration: float = None) -> str:
+    """Lip-sync a video (or the [start, start + duration) slice of it) to an audio file.
+
+    Returns the path of LatentSync's output video.
+    """
+    import subprocess
+    import tempfile
+    import lipsync_windows
+
     output_video_path = tempfile.mktemp(suffix=".mp4")
 
     # Verify inputs exist
@@ -116,6 +113,14 @@ def sync_lip_movements(job_id: str):
         if not os.path.exists(path):
             raise FileNotFoundError(f"{label} not found at {path}")
 
+    if start is not None:
+        window_video_path = tempfile.mktemp(suffix=".mp4")
+        lipsync_windows.cut_window(
+            source_video_path, window_video_path, start,
+            None if duration is None else start + duration,
+        )
+        source_video_path = window_video_path
+
     print("Running LatentSync diffusion inference...")
 
     command = [
@@ -138,11 +143,58 @@ def sync_lip_movements(job_id: str):
     except subprocess.CalledProcessError as e:
         print(f"LatentSync Error: {e.stderr}")
         raise e
+    return output_video_path
+
+
+# 4. Define the Heavy GPU Function
+# Must use H100 — LatentSync will OOM on T4 or A10G.
+@app.function(
+    image=latentsync_image,
+    gpu="H200",
+    timeout=1800,
+    volumes={"/models": model_vol, "/pipeline": pipeline_vol},
+    secrets=[modal.Secret.from_name("redub-r2-secret")],  # Output goes straight to R2
+)
+def sync_lip_movements(job_id: str, source_job_id: str = None, output_key: str = None) -> dict:
+    """Lip-sync the whole video and stream the result to R2; returns {"key", "size", "sha256"}."""
+    import lipsync_windows
+    import telemetry
 
-    with open(output_video_path, "rb") as out_file:
-        final_video_bytes = out_file.read()
+    with telemetry.stage(job_id, "lipsync", pipeline_vol) as rec:
+        with rec.model_load():
+            _ensure_latentsync()
 
-    os.remove(output_video_path)
+        source_video_path = f"/pipeline/{source_job_id or job_id}/source.mp4"
+        dubbed_audio_path = f"/pipeline/{job_id}/dubbed_audio.wav"
+        output_video_path = _run_latentsync(source_video_path, dubbed_audio_path)
 
-    print("Diffusion lip-syncing complete.")
-    return final_video_bytes
+        # ── Stream the result to R2 ───────────────────────────────────
+        import r2_upload
+        uploaded = r2_upload.upload(output_video_path, output_key or f"projects/{job_id}/dubbed_output.mp4")
+        rec.record(video_sec=lipsync_windows.media_duration(output_video_path), output_bytes=uploaded["size"])
+        os.remove(output_video_path)
+
+        print(f"Diffusion lip-syncing complete. Uploaded {uploaded['size'] / (1024 * 1024):.2f} MB to {uploaded['key']}")
+        return uploaded
+
+
+@app.function(
+    image=latentsync_image,
+    gpu="H200",
+    timeout=1800,
+    volumes={"/models": model_vol, "/pipeline": pipeline_vol}
+)
+def sync_window(job_id: str, index: int, start: float, end: float = None, source_job_id: str = None) -> dict:
+    """Lip-sync one time window of the video; see lipsync_windows.sync_window."""
+    import lipsync_windows
+    import telemetry
+
+    with telemetry.stage(job_id, "lipsync_window", pipeline_vol) as rec:
+        with rec.model_load():
+            _ensure_latentsync()
+        pipeline_vol.reload()  # Pick up the window audio the orchestrator just committed
+        result = lipsync_windows.sync_window(_run_latentsync, job_id, index, start, end, source_job_id)
+        rec.record(video_sec=result["frames"] / lipsync_windows.VIDEO_FPS,
+                   output_bytes=os.path.getsize(result["path"]))
+        pipeline_vol.commit()
+    return result
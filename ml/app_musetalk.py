@@ -32,24 +32,17 @@ musetalk_image = (
         'mim install "mmdet==3.1.0"',
         'mim install "mmpose==1.1.0"',
     )
+    .pip_install("boto3")
+    .add_local_python_source("lipsync_windows", "preprocess", "r2_upload", "telemetry")
 )
 
 MUSETALK_DIR = "/models/musetalk_repo"
 MUSETALK_SENTINEL = f"{MUSETALK_DIR}/scripts/inference.py"
 
 
-# 4. Define the GPU Function
-# A10G is sufficient — MuseTalk is lighter than LatentSync's diffusion pipeline.
-@app.function(
-    image=musetalk_image,
-    gpu="H200",
-    timeout=1800,
-    volumes={"/models": model_vol, "/pipeline": pipeline_vol}
-)
-def sync_lip_movements(job_id: str) -> bytes:
+def _ensure_musetalk():
+    """Clone MuseTalk and download its weights to the model volume on first use."""
     import subprocess
-    import tempfile
-    import glob
     import shutil
 
     if not os.path.exists(MUSETALK_SENTINEL):
@@ -145,8 +138,15 @@ def sync_lip_movements(job_id: str) -> bytes:
     else:
         print("MuseTalk repo and weights found on volume.")
 
-    source_video_path = f"/pipeline/{job_id}/source.mp4"
-    dubbed_audio_path = f"/pipeline/{job_id}/dubbed_audio.wav"
+
+def _run_musetalk(source_video_path: str, dubbed_audio_path: str, start: float = None, duration: float = None) -> str:
+    """Lip-sync a video (or the [start, start + duration) slice of it) to an audio file.
+
+    Returns the path of MuseTalk's output video.
+    """
+    import subprocess
+    import tempfile
+    import glob
 
     # Verify inputs exist
     for path, label in [(source_video_path, "source video"), (dubbed_audio_path, "dubbed audio")]:
@@ -159,15 +159,23 @@ def sync_lip_movements(job_id: str) -> bytes:
     # the script.  Re-encode to 25fps (MuseTalk's expected frame rate) before
     # inference; the dubbed_audio.wav is passed separately so no audio re-encode needed.
     reencoded_video_path = tempfile.mktemp(suffix=".mp4")
-    reencode_cmd = [
-        "ffmpeg", "-y",
-        "-i", source_video_path,
-        "-vf", "fps=25",
-        "-c:v", "libx264", "-crf", "18", "-preset", "fast",
-        "-an",  # strip audio — we supply dubbed_audio.wav separately
-        reencoded_video_path,
-    ]
-    subprocess.run(reencode_cmd, check=True)
+    if start is not None:
+        # Windows come from the 25 fps mezzanine; only the slice is decoded
+        import lipsync_windows
+        lipsync_windows.cut_window(
+            source_video_path, reencoded_video_path, start,
+            None if duration is None else start + duration,
+        )
+    else:
+        reencode_cmd = [
+            "ffmpeg", "-y",
+            "-i", source_video_path,
+            "-vf", "fps=25",
+            "-c:v", "libx264", "-crf", "18", "-preset", "fast",
+            "-an",  # strip audio — we supply dubbed_audio.wav separately
+            reencoded_video_path,
+        ]
+        subprocess.run(reencode_cmd, check=True)
     print(f"Re-encoded source video to 25fps: {reencoded_video_path}")
 
     print("Running MuseTalk lip-sync inference...")
@@ -210,17 +218,72 @@ def sync_lip_movements(job_id: str) -> bytes:
         raise RuntimeError(
             "MuseTalk produced no output video. Check the STDERR above for the internal error."
         )
-    output_video_path = output_files[0]
-
-    with open(output_video_path, "rb") as out_file:
-        final_video_bytes = out_file.read()
 
     # Cleanup temp files
     os.remove(config_path)
     os.remove(reencoded_video_path)
+    return output_files[0]
+
+
+# 4. Define the GPU Function
+# A10G is sufficient — MuseTalk is lighter than LatentSync's diffusion pipeline.
+@app.function(
+    image=musetalk_image,
+    gpu="H200",
+    timeout=1800,
+    volumes={"/models": model_vol, "/pipeline": pipeline_vol},
+    secrets=[modal.Secret.from_name("redub-r2-secret")],  # Output goes straight to R2
+)
+def sync_lip_movements(job_id: str, source_job_id: str = None, output_key: str = None) -> dict:
+    """Lip-sync the whole video and stream the result to R2; returns {"key", "size", "sha256"}."""
+    import lipsync_windows
+    import telemetry
+
+    with telemetry.stage(job_id, "lipsync", pipeline_vol) as rec:
+        with rec.model_load():
+            _ensure_musetalk()
+
+        source_video_path = f"/pipeline/{source_job_id or job_id}/source.mp4"
+        dubbed_audio_path = f"/pipeline/{job_id}/dubbed_audio.wav"
+        output_video_path = _run_musetalk(source_video_path, dubbed_audio_path)
+
+        # ── Stream the result to R2 ───────────────────────────────────
+        import r2_upload
+        uploaded = r2_upload.upload(output_video_path, output_key or f"projects/{job_id}/dubbed_output.mp4")
+        rec.record(video_sec=lipsync_windows.media_duration(output_video_path), output_bytes=uploaded["size"])
+        os.remove(output_video_path)
+
+        print(f"MuseTalk lip-syncing complete. Uploaded {uploaded['size'] / (1024 * 1024):.2f} MB to {uploaded['key']}")
+        return uploaded
 
-    print("MuseTalk lip-syncing complete.")
-    return final_video_bytes
+
+@app.function(
+    image=musetalk_image,
+    gpu="H200",
+    timeout=1800,
+    volumes={"/models": model_vol, "/pipeline": pipeline_vol}
+)
+def sync_window(job_id: str, index: int, start: float, end: float = None, source_job_id: str = None) -> dict:
+    """Lip-sync one time window of the video against its slice of the dubbed audio.
+
+    Reads /pipeline/{job_id}/windows/audio_{index}.wav (written by the
+    orchestrator) and writes a video-only window of exactly the frames
+    [start, end) spans to windows/video_{index}.mp4, encoded so windows can
+    be concatenated without re-encoding. end=None runs to the end of the
+    source video.
+    """
+    import lipsync_windows
+    import telemetry
+
+    with telemetry.stage(job_id, "lipsync_window", pipeline_vol) as rec:
+        with rec.model_load():
+            _ensure_musetalk()
+        pipeline_vol.reload()  # Pick up the window audio the orchestrator just committed
+        result = lipsync_windows.sync_window(_run_musetalk, job_id, index, start, end, source_job_id)
+        rec.record(video_sec=result["frames"] / lipsync_windows.VIDEO_FPS,
+                   output_bytes=os.path.getsize(result["path"]))
+        pipeline_vol.commit()
+    return result
 
 
 # 5. Local Entrypoint
@@ -237,12 +300,6 @@ def main(job_id: str = "test-123"):
       modal volume put redub-pipeline /path/to/audio.wav {job_id}/dubbed_audio.wav
     """
     print(f"Triggering MuseTalk lip-sync for job_id={job_id}...")
-    final_video_bytes = sync_lip_movements.remote(job_id)
-
-    output_dir = os.path.join(os.path.dirname(__file__), "tmp")
-    os.makedirs(output_dir, exist_ok=True)
-    output_path = os.path.join(output_dir, f"{job_id}_musetalk_output.mp4")
-    with open(output_path, "wb") as f:
-        f.write(final_video_bytes)
-
-    print(f"Success! Output saved to {output_path} ({len(final_video_bytes) / (1024 * 1024):.2f} MB)")
+    uploaded = sync_lip_movements.remote(job_id, output_key=f"projects/{job_id}/musetalk_output.mp4")
+    print(f"Success! Output uploaded to R2 at {uploaded['key']} "
+          f"({uploaded['size'] / (1024 * 1024):.2f} MB, sha256 {uploaded['sha256']})")
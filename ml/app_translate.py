@@ -1,32 +1,58 @@
 import modal
 import json
+import os
+import threading
 
 # 1. Define the Modal App
 app = modal.App("redub-translate")
 
+# Only used for the artifact cache (/pipeline/cache)
+pipeline_vol = modal.Volume.from_name("redub-pipeline", create_if_missing=True)
+
 # 2. Define the Environment — CPU only, no GPU needed
 translate_image = (
     modal.Image.debian_slim(python_version="3.11")
     .pip_install("groq")
+    .add_local_python_source("artifact_cache", "telemetry", "translate_windows")
 )
 
-# 3. Define the Serverless CPU Function
-@app.function(
-    image=translate_image,
-    secrets=[modal.Secret.from_name("groq-secret")]  # Needs GROQ_API_KEY
-)
-def translate_text(segments: list, target_language: str, glossary: dict = None):
-    from groq import Groq
+MODEL_NAME = "llama-3.3-70b-versatile"
+TEMPERATURE = 0.3
+
+# Chunked mode: windows of at most this many prompt tokens, translated concurrently
+CHUNKED = os.getenv("REDUB_TRANSLATE_CHUNKED", "1") != "0"
+WINDOW_TOKENS = int(os.getenv("REDUB_TRANSLATE_WINDOW_TOKENS", "1500"))
+MAX_CONCURRENT_WINDOWS = int(os.getenv("REDUB_TRANSLATE_CONCURRENCY", "4"))
+# Groq's per-minute limits for MODEL_NAME on the account's tier, enforced per container
+REQUESTS_PER_MIN = int(os.getenv("REDUB_TRANSLATE_RPM", "30"))
+TOKENS_PER_MIN = int(os.getenv("REDUB_TRANSLATE_TPM", "12000"))
+MAX_CONCURRENT_INPUTS = 8
+WINDOW_ATTEMPTS = 3
+RETRY_BACKOFF_SEC = 2.0
+
+_limiter = None
+_limiter_lock = threading.Lock()
 
-    client = Groq()  # Picks up GROQ_API_KEY from environment
 
+def _rate_limiter():
+    """The container's one RateLimiter, shared by every translation it runs at once."""
+    global _limiter
+    import translate_windows
+
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = translate_windows.RateLimiter(REQUESTS_PER_MIN, TOKENS_PER_MIN)
+        return _limiter
+
+
+def _system_prompt(target_language: str, glossary: dict = None) -> str:
     glossary_text = ""
     if glossary:
         glossary_text = "Glossary (translate strictly as shown or keep in English):\n"
         for key, value in glossary.items():
             glossary_text += f"- {key}: {value}\n"
 
-    system_prompt = f"""You are an expert video localization translator.
+    return f"""You are an expert video localization translator.
 Your target language is {target_language}.
 
 CRITICAL CONSTRAINTS:
@@ -35,39 +61,149 @@ CRITICAL CONSTRAINTS:
 3. You MUST maintain the exact same number of segments.
 4. PACING: Try to keep the syllable count of the translation as close to the original as possible so it fits within the same audio duration.
 5. Return ONLY a JSON object with a 'translated_segments' key containing an array of strings.
+6. 'context_before' and 'context_after', when present, are the neighbouring lines of the video for reference only. Do NOT translate or return them.
 
 {glossary_text}"""
 
-    original_texts = [seg["text"] for seg in segments]
 
-    print(f"Translating {len(segments)} segments to {target_language} via Groq (llama-3.3-70b-versatile)...")
+def _translate_window(client, limiter, system_prompt: str, texts: list[str], window: dict) -> list[str]:
+    """Translate one window's segments; raises ValueError unless one string per segment comes back."""
+    import translate_windows
 
+    segments = texts[window["start"]:window["end"]]
+    payload = {"segments": segments}
+    if window["context_before"]:
+        payload["context_before"] = window["context_before"]
+    if window["context_after"]:
+        payload["context_after"] = window["context_after"]
+    content = json.dumps(payload)
+
+    # The response is about as long as the segments it translates
+    limiter.acquire(translate_windows.estimate_tokens(system_prompt + content + json.dumps(segments)))
     response = client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
+        model=MODEL_NAME,
         response_format={"type": "json_object"},
         messages=[
             {"role": "system", "content": system_prompt},
-            {"role": "user", "content": json.dumps({"segments": original_texts})}
+            {"role": "user", "content": content}
         ],
-        temperature=0.3
+        temperature=TEMPERATURE
     )
 
-    result_json = json.loads(response.choices[0].message.content)
-    translated_texts = result_json.get("translated_segments", [])
+    translated = json.loads(response.choices[0].message.content).get("translated_segments")
+    if not isinstance(translated, list) or len(translated) != len(segments):
+        got = len(translated) if isinstance(translated, list) else "no"
+        raise ValueError(f"window {window['index']} expected {len(segments)} segments, got {got}")
+    return [str(text) for text in translated]
+
 
-    # Re-map translated text back to original timestamps
+def _translate(segments: list, target_language: str, glossary: dict = None, chunked: bool = None) -> list[dict]:
+    """Translate segments in token-budgeted windows (one window when not chunked).
+
+    Windows run concurrently under the per-minute rate limits; a window
+    whose response does not hold exactly one translation per segment, or
+    whose call fails, is retried on its own up to WINDOW_ATTEMPTS times.
+    """
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    import artifact_cache
+    import translate_windows
+    from groq import Groq
+
+    chunked = CHUNKED if chunked is None else chunked
+    cache_key = artifact_cache.key(
+        "translation",
+        segments=[{"start": seg["start"], "end": seg["end"], "text": seg["text"]} for seg in segments],
+        target_language=target_language, glossary=glossary or {},
+        model=MODEL_NAME, temperature=TEMPERATURE,
+        window_tokens=WINDOW_TOKENS if chunked else None,
+    )
+    cached = artifact_cache.get_json("translation", cache_key)
+    if cached is not None:
+        print(f"Translation of {len(segments)} segments found in cache.")
+        return cached
+
+    client = Groq()  # Picks up GROQ_API_KEY from environment
+    limiter = _rate_limiter()
+    system_prompt = _system_prompt(target_language, glossary)
+
+    original_texts = [seg["text"] for seg in segments]
+    if chunked:
+        windows = translate_windows.plan(original_texts, WINDOW_TOKENS)
+    else:
+        windows = [{"index": 0, "start": 0, "end": len(original_texts), "context_before": [], "context_after": []}]
+
+    print(f"Translating {len(segments)} segments to {target_language} via Groq ({MODEL_NAME}) "
+          f"in {len(windows)} windows...")
+
+    translated_windows = {}
+    pending = windows
+    for attempt in range(1, WINDOW_ATTEMPTS + 1):
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_WINDOWS) as pool:
+            futures = [
+                (window, pool.submit(_translate_window, client, limiter, system_prompt, original_texts, window))
+                for window in pending
+            ]
+        failed = []
+        for window, future in futures:
+            try:
+                translated_windows[window["index"]] = future.result()
+            except Exception as e:
+                print(f"[warn] Translation window {window['index']} failed (attempt {attempt}/{WINDOW_ATTEMPTS}): {e}")
+                failed.append(window)
+        pending = failed
+        if not pending:
+            break
+        if attempt < WINDOW_ATTEMPTS:
+            time.sleep(RETRY_BACKOFF_SEC * attempt)
+    if pending:
+        raise RuntimeError(
+            f"Translation failed for windows {[w['index'] for w in pending]} after {WINDOW_ATTEMPTS} attempts"
+        )
+
+    # Re-map translated text back to original timestamps, window by window in order
+    translated_texts = [text for window in windows for text in translated_windows[window["index"]]]
     translated_segments = []
-    for i, original_seg in enumerate(segments):
+    for original_seg, translated_text in zip(segments, translated_texts):
         translated_segments.append({
             "start": original_seg["start"],
             "end": original_seg["end"],
             "original_text": original_seg["text"],
-            "translated_text": translated_texts[i] if i < len(translated_texts) else ""
+            "translated_text": translated_text
         })
 
     print("Translation complete.")
+    artifact_cache.put_json("translation", cache_key, translated_segments)
+    pipeline_vol.commit()
     return translated_segments
 
+
+# 3. Define the Serverless CPU Function
+@app.function(
+    image=translate_image,
+    secrets=[modal.Secret.from_name("groq-secret")],  # Needs GROQ_API_KEY
+    volumes={"/pipeline": pipeline_vol},
+)
+# Streaming runs translate many transcript windows at once; serving them from one
+# container lets its shared rate limiter actually pace them
+@modal.concurrent(max_inputs=MAX_CONCURRENT_INPUTS)
+def translate_text(
+    segments: list, target_language: str, glossary: dict = None, job_id: str = None, chunked: bool = None,
+):
+    """Translate transcript segments; with job_id, a stage record goes under /pipeline/{job_id}/metrics/.
+
+    chunked (default REDUB_TRANSLATE_CHUNKED, on) splits long transcripts
+    into concurrent windows; False sends them in a single call.
+    """
+    import telemetry
+
+    if job_id is None:
+        return _translate(segments, target_language, glossary, chunked)
+    with telemetry.stage(job_id, "translate", pipeline_vol) as rec:
+        rec.record(segment_count=len(segments))
+        return _translate(segments, target_language, glossary, chunked)
+
 # 4. Local Testing Entrypoint
 @app.local_entrypoint()
 def main():
@@ -27,6 +27,8 @@ wav2lip_image = (
         "numba==0.58.1",
         "gdown>=5.1.0",
     )
+    .pip_install("boto3")
+    .add_local_python_source("lipsync_windows", "preprocess", "r2_upload", "telemetry")
 )
 
 # Google Drive checkpoint links
@@ -46,24 +48,17 @@ WAV2LIP_CKPT_FILENAME = "wav2lip_gan.pth"
 S3FD_URL = "https://www.adrianbulat.com/downloads/python-fan/s3fd-619a316812.pth"
 
 
-# 4. Define the GPU Function
-# Wav2Lip is much lighter than LatentSync — A10G or even T4 is sufficient.
-@app.function(
-    image=wav2lip_image,
-    gpu="H100",
-    timeout=1800,
-    volumes={"/models": model_vol, "/pipeline": pipeline_vol},
-)
-def sync_lip_movements(job_id: str):
+WAV2LIP_DIR = "/models/wav2lip"
+WAV2LIP_SCRIPT = f"{WAV2LIP_DIR}/inference.py"
+CHECKPOINTS_DIR = f"{WAV2LIP_DIR}/checkpoints"
+S3FD_PATH = f"{WAV2LIP_DIR}/face_detection/detection/sfd/s3fd.pth"
+
+
+def _ensure_wav2lip():
+    """Clone Wav2Lip, download its checkpoints and patch it for PyTorch 2.x on first use."""
     import subprocess
-    import tempfile
     import gdown
 
-    WAV2LIP_DIR = "/models/wav2lip"
-    WAV2LIP_SCRIPT = f"{WAV2LIP_DIR}/inference.py"
-    CHECKPOINTS_DIR = f"{WAV2LIP_DIR}/checkpoints"
-    S3FD_PATH = f"{WAV2LIP_DIR}/face_detection/detection/sfd/s3fd.pth"
-
     # ── Cold start: clone repo + download weights ─────────────────
     if not os.path.exists(WAV2LIP_SCRIPT):
         print("Cold start: cloning Wav2Lip repo and downloading checkpoints to volume...")
@@ -172,9 +167,17 @@ def load_model(path):
         size_mb = os.path.getsize(filepath) / (1024 * 1024)
         print(f"  Checkpoint: {f} ({size_mb:.1f} MB)")
 
+
+def _run_wav2lip(source_video_path: str, dubbed_audio_path: str, start: float = None, duration: float = None) -> str:
+    """Lip-sync a video (or the [start, start + duration) slice of it) to an audio file.
+
+    Returns the path of Wav2Lip's output video.
+    """
+    import subprocess
+    import tempfile
+    import lipsync_windows
+
     # ── Prepare inputs ────────────────────────────────────────────
-    source_video_path = f"/pipeline/{job_id}/source.mp4"
-    dubbed_audio_path = f"/pipeline/{job_id}/dubbed_audio.wav"
     output_video_path = tempfile.mktemp(suffix=".mp4")
 
     # Verify inputs exist
@@ -182,6 +185,14 @@ def load_model(path):
         if not os.path.exists(path):
             raise FileNotFoundError(f"{label} not found at {path}")
 
+    if start is not None:
+        window_video_path = tempfile.mktemp(suffix=".mp4")
+        lipsync_windows.cut_window(
+            source_video_path, window_video_path, start,
+            None if duration is None else start + duration,
+        )
+        source_video_path = window_video_path
+
     # ── Run Wav2Lip inference ─────────────────────────────────────
     print("Running Wav2Lip inference...")
 
@@ -223,17 +234,63 @@ def load_model(path):
         print(f"Wav2Lip stderr: {e.stderr}")
         raise e
 
-    # ── Read and return result ────────────────────────────────────
     if not os.path.exists(output_video_path):
         raise FileNotFoundError(
             f"Wav2Lip did not produce output at {output_video_path}. "
             "Check stdout/stderr above for errors."
         )
+    return output_video_path
 
-    with open(output_video_path, "rb") as out_file:
-        final_video_bytes = out_file.read()
 
-    os.remove(output_video_path)
+# 4. Define the GPU Function
+# Wav2Lip is much lighter than LatentSync — A10G or even T4 is sufficient.
+@app.function(
+    image=wav2lip_image,
+    gpu="H100",
+    timeout=1800,
+    volumes={"/models": model_vol, "/pipeline": pipeline_vol},
+    secrets=[modal.Secret.from_name("redub-r2-secret")],  # Output goes straight to R2
+)
+def sync_lip_movements(job_id: str, source_job_id: str = None, output_key: str = None) -> dict:
+    """Lip-sync the whole video and stream the result to R2; returns {"key", "size", "sha256"}."""
+    import lipsync_windows
+    import telemetry
+
+    with telemetry.stage(job_id, "lipsync", pipeline_vol) as rec:
+        with rec.model_load():
+            _ensure_wav2lip()
+
+        source_video_path = f"/pipeline/{source_job_id or job_id}/source.mp4"
+        dubbed_audio_path = f"/pipeline/{job_id}/dubbed_audio.wav"
+        output_video_path = _run_wav2lip(source_video_path, dubbed_audio_path)
 
-    print(f"Wav2Lip lip-syncing complete. Output size: {len(final_video_bytes) / (1024 * 1024):.2f} MB")
-    return final_video_bytes
+        # ── Stream the result to R2 ───────────────────────────────────
+        import r2_upload
+        uploaded = r2_upload.upload(output_video_path, output_key or f"projects/{job_id}/dubbed_output.mp4")
+        rec.record(video_sec=lipsync_windows.media_duration(output_video_path), output_bytes=uploaded["size"])
+        os.remove(output_video_path)
+
+        print(f"Wav2Lip lip-syncing complete. Uploaded {uploaded['size'] / (1024 * 1024):.2f} MB to {uploaded['key']}")
+        return uploaded
+
+
+@app.function(
+    image=wav2lip_image,
+    gpu="H100",
+    timeout=1800,
+    volumes={"/models": model_vol, "/pipeline": pipeline_vol},
+)
+def sync_window(job_id: str, index: int, start: float, end: float = None, source_job_id: str = None) -> dict:
+    """Lip-sync one time window of the video; see lipsync_windows.sync_window."""
+    import lipsync_windows
+    import telemetry
+
+    with telemetry.stage(job_id, "lipsync_window", pipeline_vol) as rec:
+        with rec.model_load():
+            _ensure_wav2lip()
+        pipeline_vol.reload()  # Pick up the window audio the orchestrator just committed
+        result = lipsync_windows.sync_window(_run_wav2lip, job_id, index, start, end, source_job_id)
+        rec.record(video_sec=result["frames"] / lipsync_windows.VIDEO_FPS,
+                   output_bytes=os.path.getsize(result["path"]))
+        pipeline_vol.commit()
+    return result
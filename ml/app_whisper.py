@@ -1,5 +1,4 @@
 import modal
-import os
 
 # 1. Define the Modal App
 app = modal.App("redub-whisper")
@@ -8,59 +7,245 @@ app = modal.App("redub-whisper")
 model_vol = modal.Volume.from_name("redub-model-weights", create_if_missing=True)
 pipeline_vol = modal.Volume.from_name("redub-pipeline", create_if_missing=True)
 
-# 3. Build the custom Docker image (no weight baking — lazy load at runtime)
+# 3. Build the custom Docker image (no weight baking — loaded from the volume once per container)
 whisper_image = (
     modal.Image.debian_slim(python_version="3.11")
     .apt_install("ffmpeg")
     .pip_install(
         "openai-whisper",
+        "faster-whisper>=1.1",  # CTranslate2 engine (REDUB_ASR_ENGINE=faster)
         "torch",
         "torchaudio",
         "requests"
     )
+    .add_local_python_source("artifact_cache", "preprocess", "telemetry", "asr_engines", "speech_map")
 )
 
-# 4. Define the Serverless GPU Function
-@app.function(
-    image=whisper_image,
-    gpu="A10G",
-    timeout=600,
-    volumes={"/models": model_vol, "/pipeline": pipeline_vol}
-)
-def transcribe_video(job_id: str):
-    import whisper
+# Streaming mode hands out transcripts in windows of this much audio
+WINDOW_SEC = 60.0
+MIN_WINDOW_ADVANCE_SEC = 1.0
+
+MODEL_NAME = "large-v3"
+WHISPER_CACHE = "/models/whisper"
+
+# Idle containers stay up this long, so back-to-back jobs reuse the loaded model
+SCALEDOWN_WINDOW_SEC = 300
 
-    WHISPER_CACHE = "/models/whisper"
-    needs_commit = not os.path.exists(f"{WHISPER_CACHE}/large-v3.pt")
+
+def _create_engine():
+    import asr_engines
+
+    name = asr_engines.DEFAULT_ENGINE
+    download_root = WHISPER_CACHE if name == "openai" else f"{WHISPER_CACHE}/{name}"
+    return asr_engines.create(MODEL_NAME, name, download_root=download_root)
+
+
+def _load_engine(engine, device: str):
+    needs_commit = not engine.cached()
 
     if needs_commit:
-        print("Cold start: downloading Whisper large-v3 weights to volume...")
+        print(f"Cold start: downloading Whisper {MODEL_NAME} weights ({engine.name}) to volume...")
 
-    print("Loading Whisper model into VRAM...")
-    model = whisper.load_model("large-v3", download_root=WHISPER_CACHE)
+    print(f"Loading Whisper model ({engine.name}) onto {device}...")
+    engine.load(device)
 
     if needs_commit:
         model_vol.commit()
         print("Whisper weights cached to volume.")
 
-    source_video_path = f"/pipeline/{job_id}/source.mp4"
-    print(f"Transcribing {source_video_path}...")
 
-    # word_timestamps=True is critical for precise lip-syncing downstream
-    result = model.transcribe(source_video_path, word_timestamps=True)
+def _load_audio(job_id: str):
+    """16 kHz mono float32 audio: the preprocessed PCM if present, else decoded from source.mp4."""
+    import numpy as np
+    import whisper
+    import preprocess
+
+    asr_path = preprocess.artifact(f"/pipeline/{job_id}", preprocess.ASR_AUDIO)
+    if asr_path is not None:
+        return np.fromfile(asr_path, dtype=np.float32)
+    return whisper.load_audio(f"/pipeline/{job_id}/source.mp4")
+
+
+def _segments(result: dict, offset: float = 0.0) -> list[dict]:
+    return [
+        {
+            "start": seg["start"] + offset,
+            "end": seg["end"] + offset,
+            "text": seg["text"]
+        }
+        for seg in result["segments"]
+    ]
+
+
+def _speech(job_id: str) -> dict | None:
+    import speech_map
+
+    speech = speech_map.load(f"/pipeline/{job_id}")
+    if speech is not None:
+        print(f"Speech map: {speech['speech_sec']:.1f}s of speech in {speech['duration']:.1f}s.")
+    return speech
+
+
+def _transcribe(engine, audio, speech: dict = None, offset: float = 0.0) -> dict:
+    """Transcribe audio starting offset seconds into the source; timestamps come back absolute.
+
+    With a speech map only its speech spans are decoded, back to back, and
+    segment times are mapped back onto the source timeline.
+    """
+    import speech_map
+
+    if speech is None:
+        result = engine.transcribe(audio)
+        return {**result, "segments": _segments(result, offset)}
+
+    intervals = speech_map.clip(speech["intervals"], offset, offset + len(audio) / speech_map.SAMPLE_RATE)
+    compacted, spans = speech_map.compact(audio, intervals)
+    if not spans:
+        return {"text": "", "language": None, "segments": []}
+    result = engine.transcribe(compacted)
+    segments = [
+        {
+            **seg,
+            "start": speech_map.to_source(seg["start"], spans) + offset,
+            "end": speech_map.to_source(seg["end"], spans) + offset,
+        }
+        for seg in _segments(result)
+    ]
+    return {**result, "segments": segments}
+
+
+def _cache_parts(engine, speech: dict = None) -> dict:
+    """Transcript cache identity; the VAD settings only count when a speech map is used."""
+    return {**engine.cache_identity(), **({"vad": speech["params"]} if speech else {})}
 
-    print("Transcription complete.")
-    return {
-        "text": result["text"],
-        "segments": [
-            {
-                "start": float(seg["start"]),
-                "end": float(seg["end"]),
-                "text": seg["text"]
+
+# 4. Define the Serverless GPU Service
+@app.cls(
+    image=whisper_image,
+    gpu="A10G",
+    timeout=1800,
+    scaledown_window=SCALEDOWN_WINDOW_SEC,
+    enable_memory_snapshot=True,
+    volumes={"/models": model_vol, "/pipeline": pipeline_vol}
+)
+class Whisper:
+    """Whisper large-v3, loaded once per container and reused by every call it serves.
+
+    The engine comes from asr_engines (REDUB_ASR_ENGINE). Engines that can
+    move between devices read their weights into CPU memory before the
+    memory snapshot is taken, so containers restored from it only copy the
+    model to the GPU; the others load straight onto the GPU.
+
+    Jobs with a speech map (speech_map.py) only have their speech decoded.
+    """
+
+    @modal.enter(snap=True)
+    def load(self):
+        self.engine = _create_engine()
+        if self.engine.movable:
+            _load_engine(self.engine, "cpu")
+
+    @modal.enter(snap=False)
+    def to_gpu(self):
+        import telemetry
+
+        telemetry.container_started()
+        _load_engine(self.engine, "cuda")
+
+    @modal.method()
+    def transcribe_video(self, job_id: str):
+        import whisper
+        import artifact_cache
+        import telemetry
+
+        pipeline_vol.reload()  # Warm containers outlive jobs; pick up this one's source and audio
+        # The stage record commits the volume on exit, cache hits included
+        with telemetry.stage(job_id, "transcribe", pipeline_vol) as rec:
+            source_video_path = f"/pipeline/{job_id}/source.mp4"
+            speech = _speech(job_id)
+            cache_key = artifact_cache.key(
+                "transcript", audio=artifact_cache.audio_digest(source_video_path),
+                **_cache_parts(self.engine, speech),
+            )
+            cached = artifact_cache.get_json("transcript", cache_key)
+            if cached is not None:
+                print("Transcript found in cache.")
+                rec.record(segment_count=len(cached["segments"]))
+                return cached
+
+            print(f"Transcribing {source_video_path}...")
+
+            audio = _load_audio(job_id)
+            result = _transcribe(self.engine, audio, speech)
+
+            print("Transcription complete.")
+            transcription = {
+                "text": result["text"],
+                "language": result["language"],
+                "segments": result["segments"],
             }
-            for seg in result["segments"]
-        ]
-    }
+            rec.record(video_sec=len(audio) / whisper.audio.SAMPLE_RATE, segment_count=len(transcription["segments"]))
+            artifact_cache.put_json("transcript", cache_key, transcription)
+            return transcription
+
+    @modal.method()
+    def transcribe_windows(self, job_id: str, window_sec: float = WINDOW_SEC):
+        """Generator: yield the transcript window by window as soon as each is decoded.
+
+        Each window is {"index", "start", "end", "segments", "final"} with
+        absolute timestamps. A window's last segment may have been cut off by
+        the window edge, so unless it is the only one it is dropped and the next
+        window resumes from its start; windows therefore tile the audio without
+        splitting speech.
+        """
+        import whisper
+        import artifact_cache
+        import telemetry
+
+        pipeline_vol.reload()  # Warm containers outlive jobs; pick up this one's source and audio
+        with telemetry.stage(job_id, "transcribe", pipeline_vol) as rec:
+            source_video_path = f"/pipeline/{job_id}/source.mp4"
+            speech = _speech(job_id)
+            cache_key = artifact_cache.key(
+                "transcript_windows", audio=artifact_cache.audio_digest(source_video_path),
+                window_sec=window_sec, **_cache_parts(self.engine, speech),
+            )
+            cached = artifact_cache.get_json("transcript_windows", cache_key)
+            if cached is not None:
+                print(f"Transcript found in cache ({len(cached)} windows).")
+                rec.record(segment_count=sum(len(w["segments"]) for w in cached))
+                yield from cached
+                return
+
+            audio = _load_audio(job_id)
+            sample_rate = whisper.audio.SAMPLE_RATE
+            total = len(audio) / sample_rate
+            print(f"Transcribing {source_video_path} ({total:.1f}s) in {window_sec:.0f}s windows...")
+
+            windows = []
+            offset = 0.0
+            index = 0
+            while offset < total:
+                end = min(offset + window_sec, total)
+                chunk = audio[int(offset * sample_rate):int(end * sample_rate)]
+                segments = _transcribe(self.engine, chunk, speech, offset)["segments"]
+
+                final = end >= total
+                next_offset = end
+                if not final and len(segments) > 1 and segments[-1]["start"] - offset >= MIN_WINDOW_ADVANCE_SEC:
+                    next_offset = segments[-1]["start"]
+                    segments = segments[:-1]
+
+                print(f"  Window {index}: {offset:.1f}s-{next_offset:.1f}s, {len(segments)} segments")
+                window = {"index": index, "start": offset, "end": next_offset, "segments": segments, "final": final}
+                windows.append(window)
+                yield window
+                offset = next_offset
+                index += 1
+
+            rec.record(video_sec=total, segment_count=sum(len(w["segments"]) for w in windows))
+            artifact_cache.put_json("transcript_windows", cache_key, windows)
+
 
 # 5. Local Testing Entrypoint
 @app.local_entrypoint()
@@ -70,7 +255,7 @@ def main(job_id: str = "test-123"):
     Requires source.mp4 to already be present at /pipeline/{job_id}/source.mp4
     """
     print(f"Triggering Modal transcription job for job_id={job_id}...")
-    transcription_data = transcribe_video.remote(job_id)
+    transcription_data = Whisper().transcribe_video.remote(job_id)
 
     print("\n--- Final Output ---")
     for segment in transcription_data["segments"]:
@@ -2,8 +2,6 @@ import modal
 import os
 import subprocess
 import json
-import struct
-import tempfile
 
 # 1. Define the Modal App
 app = modal.App("redub-xtts")
@@ -12,7 +10,7 @@ app = modal.App("redub-xtts")
 model_vol = modal.Volume.from_name("redub-model-weights", create_if_missing=True)
 pipeline_vol = modal.Volume.from_name("redub-pipeline", create_if_missing=True)
 
-# 3. Build the custom Docker image (no weight baking — lazy load at runtime)
+# 3. Build the custom Docker image (no weight baking — loaded from the volume once per container)
 xtts_image = (
     modal.Image.debian_slim(python_version="3.11")
     .apt_install("ffmpeg")
@@ -24,6 +22,7 @@ xtts_image = (
         "requests",
         "boto3",
     )
+    .add_local_python_source("timeline", "artifact_cache", "telemetry")
 )
 
 # ── Helpers ───────────────────────────────────────────────────────
@@ -40,6 +39,13 @@ STRETCH_ALPHA = 0.3
 SAMPLE_RATE = 22050  # XTTS v2 output sample rate
 NUM_CHANNELS = 1     # mono
 
+PRESET_TEMPERATURE = 0.7  # Sampling temperature when conditioning on preset latents
+
+# Sharded synthesis: roughly this many segments per GPU container, capped at MAX_SHARDS
+SEGMENTS_PER_SHARD = 40
+MAX_SHARDS = 8
+SEGMENT_COST_OVERHEAD = 20  # Per-segment cost in characters (model call, time-stretch)
+
 
 def _get_wav_duration(path: str) -> float:
     """Get WAV duration in seconds via ffprobe."""
@@ -83,52 +89,14 @@ def _time_stretch_wav(input_path: str, output_path: str, tempo: float):
     )
 
 
-def _generate_silence_wav(path: str, duration_sec: float):
-    """Write a silent WAV file of the given duration (16-bit PCM, mono, 22050 Hz)."""
-    num_samples = int(SAMPLE_RATE * duration_sec)
-    data_size = num_samples * NUM_CHANNELS * 2  # 16-bit = 2 bytes per sample
-
-    with open(path, "wb") as f:
-        # RIFF header
-        f.write(b"RIFF")
-        f.write(struct.pack("<I", 36 + data_size))
-        f.write(b"WAVE")
-        # fmt chunk
-        f.write(b"fmt ")
-        f.write(struct.pack("<I", 16))                    # chunk size
-        f.write(struct.pack("<H", 1))                     # PCM format
-        f.write(struct.pack("<H", NUM_CHANNELS))
-        f.write(struct.pack("<I", SAMPLE_RATE))
-        f.write(struct.pack("<I", SAMPLE_RATE * NUM_CHANNELS * 2))  # byte rate
-        f.write(struct.pack("<H", NUM_CHANNELS * 2))      # block align
-        f.write(struct.pack("<H", 16))                    # bits per sample
-        # data chunk
-        f.write(b"data")
-        f.write(struct.pack("<I", data_size))
-        f.write(b"\x00" * data_size)
-
-
-def _concat_wavs(wav_paths: list[str], output_path: str):
-    """Concatenate WAV files using ffmpeg's concat demuxer."""
-    list_file = tempfile.mktemp(suffix=".txt")
-    with open(list_file, "w") as f:
-        for p in wav_paths:
-            f.write(f"file '{p}'\n")
-
-    subprocess.run(
-        ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", list_file,
-         "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE), "-ac", str(NUM_CHANNELS),
-         output_path],
-        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
-    )
-    os.remove(list_file)
-
-
 # ── Shared Model Setup ────────────────────────────────────────────
 
 XTTS_HOME = "/models/xtts"
 PRESETS_DIR = "/models/xtts_presets"
 
+# Idle containers stay up this long, so back-to-back jobs reuse the loaded model
+SCALEDOWN_WINDOW_SEC = 300
+
 
 def _ensure_base_model():
     """Download XTTS v2 base weights to volume if not already cached."""
@@ -146,8 +114,8 @@ def _ensure_base_model():
         print("XTTS v2 weights cached to volume.")
 
 
-def _load_tts(checkpoint_volume_path: str = None):
-    """Load XTTS v2, optionally with pre-computed speaker conditioning latents."""
+def _load_tts(device: str):
+    """Load XTTS v2 onto device."""
     os.environ["COQUI_TOS_AGREED"] = "1"
     os.environ["TTS_HOME"] = XTTS_HOME
 
@@ -155,261 +123,32 @@ def _load_tts(checkpoint_volume_path: str = None):
 
     from TTS.api import TTS
 
-    tts = TTS("tts_models/multilingual/multi-dataset/xtts_v2").to("cuda")
-
-    return tts
-
-
-# ── Fine-Tuning Function ─────────────────────────────────────────
-
-@app.function(
-    image=xtts_image,
-    gpu="H200",
-    timeout=1800,   # 30 min — fine-tuning can be slow
-    secrets=[
-        modal.Secret.from_name("backend-webhook-secret"),
-        modal.Secret.from_name("redub-r2-secret"),
-    ],
-    volumes={"/models": model_vol, "/pipeline": pipeline_vol},
-)
-def fine_tune_speaker(preset_id: str, audio_url: str):
-    """Compute high-quality speaker conditioning latents from reference audio.
-
-    XTTS v2's Xtts class has no training support (forward/train_step raise
-    NotImplementedError). Instead, we extract speaker conditioning latents
-    (gpt_cond_latent + speaker_embedding) from many audio chunks, average
-    them for robustness, and cache the result. At inference time we load
-    these pre-computed latents and pass them directly to the model, bypassing
-    the short 6-second speaker_ref.wav extraction and producing much more
-    consistent and higher-quality voice cloning.
-
-    Steps:
-        1. Download reference audio from R2 (via presigned URL)
-        2. Normalize to 22050 Hz mono WAV
-        3. Split into 8-15 second chunks
-        4. Extract gpt_cond_latent + speaker_embedding from each chunk
-        5. Average across all chunks for a robust speaker representation
-        6. Save latents + best speaker_ref.wav to volume
-        7. Fire webhook to backend
-    """
-    import requests
-    import torch
-    import shutil
-    import traceback
-
-    os.environ["COQUI_TOS_AGREED"] = "1"
-    os.environ["TTS_HOME"] = XTTS_HOME
-
-    _ensure_base_model()
-
-    webhook_url = os.environ["WEBHOOK_URL"]
-    webhook_headers = {"Authorization": f"Bearer {os.environ['WEBHOOK_SECRET']}"}
-
-    try:
-        # ── Download reference audio ──────────────────────────────
-        work_dir = f"/pipeline/finetune_{preset_id}"
-        os.makedirs(work_dir, exist_ok=True)
-        raw_audio_path = f"{work_dir}/reference_raw.wav"
-
-        print(f"Downloading reference audio for preset {preset_id}...")
-        with requests.get(audio_url, stream=True) as r:
-            r.raise_for_status()
-            with open(raw_audio_path, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
-
-        # ── Normalize to 22050 Hz mono WAV ────────────────────────
-        normalized_path = f"{work_dir}/reference.wav"
-        subprocess.run([
-            "ffmpeg", "-y", "-i", raw_audio_path,
-            "-ar", "22050", "-ac", "1", "-acodec", "pcm_s16le",
-            normalized_path,
-        ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-        total_duration = _get_wav_duration(normalized_path)
-        print(f"Reference audio: {total_duration:.1f}s")
-
-        # ── Split into conditioning chunks (8-15 sec each) ────────
-        chunks_dir = f"{work_dir}/chunks"
-        os.makedirs(chunks_dir, exist_ok=True)
-
-        chunk_duration = 10  # seconds per chunk
-        num_chunks = max(1, int(total_duration / chunk_duration))
-        chunk_paths = []
-
-        for i in range(num_chunks):
-            start = i * chunk_duration
-            chunk_path = f"{chunks_dir}/chunk_{i:03d}.wav"
-            subprocess.run([
-                "ffmpeg", "-y", "-i", normalized_path,
-                "-ss", str(start), "-t", str(chunk_duration),
-                "-ar", "22050", "-ac", "1", "-acodec", "pcm_s16le",
-                chunk_path,
-            ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            # Only include chunks that are at least 3 seconds
-            dur = _get_wav_duration(chunk_path)
-            if dur >= 3.0:
-                chunk_paths.append(chunk_path)
-            else:
-                os.remove(chunk_path)
-
-        print(f"Split into {len(chunk_paths)} conditioning chunks (≥3s each)")
-
-        if len(chunk_paths) < 2:
-            raise ValueError(
-                f"Not enough usable audio for speaker conditioning "
-                f"({total_duration:.1f}s total, {len(chunk_paths)} chunks ≥3s). "
-                f"Please upload at least 30 seconds of clear speech."
-            )
-
-        # ── Extract conditioning latents from each chunk ──────────
-        from TTS.api import TTS
-
-        print("Loading XTTS v2 for speaker conditioning extraction...")
-        tts = TTS("tts_models/multilingual/multi-dataset/xtts_v2").to("cuda")
-        model = tts.synthesizer.tts_model
-
-        all_gpt_cond = []
-        all_speaker_emb = []
-
-        for i, chunk_path in enumerate(chunk_paths):
-            print(f"  Extracting latents from chunk {i+1}/{len(chunk_paths)}...")
-            gpt_cond_latent, speaker_embedding = model.get_conditioning_latents(
-                audio_path=[chunk_path],
-                gpt_cond_len=30,            # longer context = better quality
-                gpt_cond_chunk_len=4,
-            )
-            all_gpt_cond.append(gpt_cond_latent)
-            all_speaker_emb.append(speaker_embedding)
-
-        # ── Average latents across all chunks ─────────────────────
-        avg_gpt_cond = torch.mean(torch.stack(all_gpt_cond), dim=0)
-        avg_speaker_emb = torch.mean(torch.stack(all_speaker_emb), dim=0)
-
-        print(f"Averaged conditioning latents from {len(chunk_paths)} chunks")
-        print(f"  gpt_cond_latent: {avg_gpt_cond.shape}")
-        print(f"  speaker_embedding: {avg_speaker_emb.shape}")
-
-        # ── Save latents to volume ────────────────────────────────
-        checkpoint_dir = f"{PRESETS_DIR}/{preset_id}"
-        os.makedirs(checkpoint_dir, exist_ok=True)
-        latents_path = f"{checkpoint_dir}/speaker_latents.pth"
-
-        torch.save({
-            "gpt_cond_latent": avg_gpt_cond.cpu(),
-            "speaker_embedding": avg_speaker_emb.cpu(),
-            "num_chunks": len(chunk_paths),
-            "total_duration": total_duration,
-            "preset_id": preset_id,
-        }, latents_path)
-
-        model_vol.commit()
-        print(f"Speaker latents saved to {latents_path}")
-
-        # Also save a long speaker reference WAV (the full normalized audio)
-        # as fallback and for future use
-        speaker_ref_dest = f"{checkpoint_dir}/speaker_ref.wav"
-        shutil.copy2(normalized_path, speaker_ref_dest)
-        model_vol.commit()
-
-        # ── Upload completion marker to R2 (webhook fallback) ──
-        import boto3 as _boto3
-        _s3 = _boto3.client(
-            "s3",
-            endpoint_url=f"https://{os.environ['ACCOUNT_ID']}.r2.cloudflarestorage.com",
-            aws_access_key_id=os.environ["R2_ACCESS_KEY_ID"],
-            aws_secret_access_key=os.environ["R2_SECRET_ACCESS_KEY"],
-            region_name="auto",
-        )
-        marker_key = f"presets/{preset_id}/done.json"
-        marker_body = json.dumps({
-            "preset_id": preset_id,
-            "status": "READY",
-            "checkpoint_volume_path": latents_path,
-        })
-        _s3.put_object(
-            Bucket=os.environ["R2_BUCKET_NAME"],
-            Key=marker_key,
-            Body=marker_body.encode(),
-            ContentType="application/json",
-        )
-        print(f"Uploaded completion marker to R2: {marker_key}")
-
-        # ── Clean up working directory ────────────────────────────
-        shutil.rmtree(work_dir, ignore_errors=True)
-        pipeline_vol.commit()
-
-        # ── Fire webhook ──────────────────────────────────────────
-        # print("Notifying backend — speaker conditioning complete...")
-        # webhook_base = webhook_url.replace("/job-complete", "")
-        # payload = {
-        #     "preset_id": preset_id,
-        #     "status": "READY",
-        #     "checkpoint_volume_path": latents_path,
-        # }
-        # resp = requests.post(
-        #     f"{webhook_base}/preset-complete",
-        #     json=payload, headers=webhook_headers, timeout=10,
-        # )
-        # resp.raise_for_status()
-        print(f"Speaker conditioning complete for preset {preset_id}.")
-
-    except Exception as e:
-        print(f"Speaker conditioning FAILED for preset {preset_id}: {e}")
-        traceback.print_exc()
-        try:
-            webhook_base = webhook_url.replace("/job-complete", "")
-            requests.post(
-                f"{webhook_base}/preset-complete",
-                json={"preset_id": preset_id, "status": "FAILED", "error": str(e)},
-                headers=webhook_headers, timeout=10,
-            )
-        except Exception:
-            pass
-        raise
+    print(f"Loading XTTS v2 onto {device}...")
+    return TTS("tts_models/multilingual/multi-dataset/xtts_v2").to(device)
 
 
 # ── Main Function ─────────────────────────────────────────────────
 
-# 4. Define the Serverless GPU Function
-@app.function(
-    image=xtts_image,
-    gpu="H200",
-    timeout=900,   # longer timeout for per-segment generation
-    volumes={"/models": model_vol, "/pipeline": pipeline_vol}
-)
-def generate_dubbed_audio(
-    job_id: str,
-    segments: list[dict],
-    target_language: str,
-    checkpoint_volume_path: str = None,
-):
-    """Generate time-aligned dubbed audio from translated segments.
+def _speaker_digest(job_id: str, checkpoint_volume_path: str = None, source_job_id: str = None) -> str:
+    """Cache identity of the voice being cloned: the preset latents, else the reference WAV."""
+    import artifact_cache
 
-    Each segment dict must have:
-        - "translated_text": str   — the text to speak
-        - "start": float           — original segment start time (seconds)
-        - "end": float             — original segment end time (seconds)
+    if checkpoint_volume_path and os.path.exists(checkpoint_volume_path):
+        return artifact_cache.file_digest(checkpoint_volume_path)
+    return artifact_cache.file_digest(f"/pipeline/{source_job_id or job_id}/speaker_ref.wav")
 
-    If checkpoint_volume_path is provided, loads a fine-tuned XTTS model
-    and uses the preset's bundled speaker_ref.wav instead of the one
-    extracted from the source video.
 
-    The function generates TTS audio per segment, time-stretches each clip
-    to match the original segment duration, inserts silence for gaps between
-    segments, and writes the final stitched result to dubbed_audio.wav.
-    """
-    print(f"Loading XTTS v2 for language '{target_language}'"
-          f"{' (preset)' if checkpoint_volume_path else ''}...")
-    tts = _load_tts(checkpoint_volume_path)
-
-    job_dir = f"/pipeline/{job_id}"
+def _load_voice(tts, job_id: str, checkpoint_volume_path: str = None, source_job_id: str = None):
+    """Pair the container's XTTS with the speaker conditioning to clone: preset latents or a reference WAV.
 
+    Returns (tts, preset_latents, speaker_ref_path); preset_latents is None
+    for zero-shot cloning from the source video's speaker_ref.wav.
+    """
     # Load pre-computed speaker latents if a preset is available,
     # otherwise we'll use speaker_wav for zero-shot conditioning
     import torch
     preset_latents = None
-    speaker_ref_path = f"{job_dir}/speaker_ref.wav"
+    speaker_ref_path = f"/pipeline/{source_job_id or job_id}/speaker_ref.wav"
 
     if checkpoint_volume_path and os.path.exists(checkpoint_volume_path):
         print(f"Loading pre-computed speaker latents from {checkpoint_volume_path}...")
@@ -426,112 +165,535 @@ def generate_dubbed_audio(
     elif checkpoint_volume_path:
         print(f"[warn] Latents not found at {checkpoint_volume_path}, using zero-shot from video.")
 
-    dubbed_audio_path = f"{job_dir}/dubbed_audio.wav"
+    return tts, preset_latents, speaker_ref_path
+
+
+def _render_clip(voice, seg: dict, lang_code: str, index: int, job_dir: str) -> float | None:
+    """Synthesize one segment and time-stretch it toward its original duration.
+
+    Writes the clip to timeline.clip_path(job_dir, index) and returns its
+    duration, or None for a segment with no text.
+    """
+    import shutil
+    import timeline
+
+    tts, preset_latents, speaker_ref_path = voice
+    text = seg["translated_text"].strip()
+    target_duration = float(seg["end"]) - float(seg["start"])
+
+    if not text:
+        print(f"  Segment {index}: empty text — skipping.")
+        return None
+
     seg_dir = f"{job_dir}/segments"
     os.makedirs(seg_dir, exist_ok=True)
+    os.makedirs(f"{job_dir}/clips", exist_ok=True)
+    raw_path = f"{seg_dir}/raw_{index:04d}.wav"
+    out_path = timeline.clip_path(job_dir, index)
+
+    # ── Generate raw TTS for this segment ─────────────────────────
+    if preset_latents is not None:
+        # Use pre-computed speaker conditioning latents (higher quality)
+        import torch
+        import torchaudio
+        model = tts.synthesizer.tts_model
+        out = model.inference(
+            text=text,
+            language=lang_code,
+            gpt_cond_latent=preset_latents["gpt_cond_latent"].to("cuda"),
+            speaker_embedding=preset_latents["speaker_embedding"].to("cuda"),
+            temperature=PRESET_TEMPERATURE,
+        )
+        wav_tensor = torch.tensor(out["wav"]).unsqueeze(0)
+        torchaudio.save(raw_path, wav_tensor, SAMPLE_RATE)
+    else:
+        # Zero-shot: use speaker_wav file
+        tts.tts_to_file(
+            text=text,
+            speaker_wav=speaker_ref_path,
+            language=lang_code,
+            file_path=raw_path,
+        )
+    raw_duration = _get_wav_duration(raw_path)
+
+    # ── Time-stretch to match original segment duration ───────────
+    if target_duration > 0.05 and raw_duration > 0.05:
+        raw_tempo = raw_duration / target_duration  # >1 = speed up, <1 = slow down
+        # Dampen: blend toward 1.0 so we don't fully distort the voice
+        tempo = 1.0 + STRETCH_ALPHA * (raw_tempo - 1.0)
+        clamped_tempo = max(MIN_TEMPO, min(MAX_TEMPO, tempo))
+
+        _time_stretch_wav(raw_path, out_path, tempo)
+        actual_duration = _get_wav_duration(out_path)
+
+        print(
+            f"  Segment {index}: \"{text[:40]}...\" "
+            f"target={target_duration:.2f}s  raw={raw_duration:.2f}s  "
+            f"raw_tempo={raw_tempo:.2f}  applied={clamped_tempo:.2f} "
+            f"(alpha={STRETCH_ALPHA})  final={actual_duration:.2f}s"
+        )
+        return actual_duration
 
-    lang_code = target_language[:2].lower()
-    pieces: list[str] = []  # ordered list of WAV paths to concatenate
+    # Segment too short to stretch — use raw audio as-is
+    print(f"  Segment {index}: \"{text[:40]}...\" raw={raw_duration:.2f}s (no stretch)")
+    shutil.copyfile(raw_path, out_path)
+    return raw_duration
 
-    print(f"Generating audio for {len(segments)} segments (lang={lang_code})...")
 
-    for i, seg in enumerate(segments):
-        text = seg["translated_text"].strip()
-        target_start = float(seg["start"])
-        target_end = float(seg["end"])
-        target_duration = target_end - target_start
+def _render_clips_cached(
+    tts,
+    job_id: str,
+    indexed_segments: list[tuple[int, dict]],
+    lang_code: str,
+    checkpoint_volume_path: str = None,
+    source_job_id: str = None,
+    rec=None,
+) -> dict:
+    """Render (index, segment) pairs to clips, reusing cached clips where possible.
+
+    A clip is keyed by its text, target duration, language, voice and the
+    sampling/stretch settings; the speaker conditioning is only loaded if
+    some clip misses, timed on the telemetry record rec when given. Returns {index: duration}
+    (None for empty segments).
+    """
+    from contextlib import nullcontext
+    import artifact_cache
+    import timeline
 
+    job_dir = f"/pipeline/{job_id}"
+    os.makedirs(f"{job_dir}/clips", exist_ok=True)
+    speaker = _speaker_digest(job_id, checkpoint_volume_path, source_job_id)
+    durations = {}
+    misses = []
+    for index, seg in indexed_segments:
+        text = seg["translated_text"].strip()
         if not text:
-            print(f"  Segment {i}: empty text — skipping.")
+            durations[index] = None
             continue
-
-        # ── Insert silence gap before this segment ────────────────
-        if pieces:
-            # End of the previous piece in the timeline
-            prev_end = float(segments[i - 1]["end"]) if i > 0 else 0.0
+        cache_key = artifact_cache.key(
+            "tts_clip", text=text, language=lang_code, speaker=speaker,
+            target_duration=round(float(seg["end"]) - float(seg["start"]), 3),
+            temperature=PRESET_TEMPERATURE if checkpoint_volume_path else None,
+            stretch=[STRETCH_ALPHA, MIN_TEMPO, MAX_TEMPO],
+        )
+        clip = timeline.clip_path(job_dir, index)
+        if artifact_cache.get_file("tts_clip", cache_key, clip):
+            durations[index] = _get_wav_duration(clip)
         else:
-            prev_end = 0.0
-
-        gap = target_start - prev_end
-        if gap > 0.01:  # only insert if gap is meaningful (>10ms)
-            silence_path = f"{seg_dir}/silence_{i:04d}.wav"
-            _generate_silence_wav(silence_path, gap)
-            pieces.append(silence_path)
-            print(f"  Gap before segment {i}: {gap:.3f}s of silence")
-
-        # ── Generate raw TTS for this segment ─────────────────────
-        raw_path = f"{seg_dir}/raw_{i:04d}.wav"
-
-        if preset_latents is not None:
-            # Use pre-computed speaker conditioning latents (higher quality)
-            import torchaudio
-            model = tts.synthesizer.tts_model
-            out = model.inference(
-                text=text,
-                language=lang_code,
-                gpt_cond_latent=preset_latents["gpt_cond_latent"].to("cuda"),
-                speaker_embedding=preset_latents["speaker_embedding"].to("cuda"),
-                temperature=0.7,
+            misses.append((index, seg, cache_key))
+
+    print(f"{len(indexed_segments) - len(misses)} clips from cache, {len(misses)} to synthesize.")
+    if misses:
+        with rec.model_load() if rec else nullcontext():
+            voice = _load_voice(tts, job_id, checkpoint_volume_path, source_job_id)
+        for index, seg, cache_key in misses:
+            durations[index] = _render_clip(voice, seg, lang_code, index, job_dir)
+            artifact_cache.put_file("tts_clip", cache_key, timeline.clip_path(job_dir, index))
+    return durations
+
+
+# 4. Define the Serverless GPU Service
+@app.cls(
+    image=xtts_image,
+    gpu="H200",
+    timeout=1800,   # 30 min — fine-tuning can be slow
+    scaledown_window=SCALEDOWN_WINDOW_SEC,
+    enable_memory_snapshot=True,
+    secrets=[
+        modal.Secret.from_name("backend-webhook-secret"),
+        modal.Secret.from_name("redub-r2-secret"),
+    ],
+    volumes={"/models": model_vol, "/pipeline": pipeline_vol},
+)
+class XTTS:
+    """XTTS v2, loaded once per container and shared by every call it serves.
+
+    The weights are read into CPU memory before the memory snapshot is
+    taken, so containers restored from it skip the load and only copy the
+    model to the GPU. Speaker conditioning (preset latents or a reference
+    WAV) is per call.
+    """
+
+    @modal.enter(snap=True)
+    def load(self):
+        self.tts = _load_tts("cpu")
+
+    @modal.enter(snap=False)
+    def to_gpu(self):
+        import telemetry
+
+        telemetry.container_started()
+        self.tts = self.tts.to("cuda")
+
+    @modal.method()
+    def fine_tune_speaker(self, preset_id: str, audio_url: str):
+        """Compute high-quality speaker conditioning latents from reference audio.
+
+        XTTS v2's Xtts class has no training support (forward/train_step raise
+        NotImplementedError). Instead, we extract speaker conditioning latents
+        (gpt_cond_latent + speaker_embedding) from many audio chunks, average
+        them for robustness, and cache the result. At inference time we load
+        these pre-computed latents and pass them directly to the model, bypassing
+        the short 6-second speaker_ref.wav extraction and producing much more
+        consistent and higher-quality voice cloning.
+
+        Steps:
+            1. Download reference audio from R2 (via presigned URL)
+            2. Normalize to 22050 Hz mono WAV
+            3. Split into 8-15 second chunks
+            4. Extract gpt_cond_latent + speaker_embedding from each chunk
+            5. Average across all chunks for a robust speaker representation
+            6. Save latents + best speaker_ref.wav to volume
+            7. Fire webhook to backend
+        """
+        import requests
+        import torch
+        import shutil
+        import traceback
+
+        webhook_url = os.environ["WEBHOOK_URL"]
+        webhook_headers = {"Authorization": f"Bearer {os.environ['WEBHOOK_SECRET']}"}
+
+        try:
+            # ── Download reference audio ──────────────────────────────
+            work_dir = f"/pipeline/finetune_{preset_id}"
+            os.makedirs(work_dir, exist_ok=True)
+            raw_audio_path = f"{work_dir}/reference_raw.wav"
+
+            print(f"Downloading reference audio for preset {preset_id}...")
+            with requests.get(audio_url, stream=True) as r:
+                r.raise_for_status()
+                with open(raw_audio_path, "wb") as f:
+                    for chunk in r.iter_content(chunk_size=8192):
+                        f.write(chunk)
+
+            # ── Normalize to 22050 Hz mono WAV ────────────────────────
+            normalized_path = f"{work_dir}/reference.wav"
+            subprocess.run([
+                "ffmpeg", "-y", "-i", raw_audio_path,
+                "-ar", "22050", "-ac", "1", "-acodec", "pcm_s16le",
+                normalized_path,
+            ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+            total_duration = _get_wav_duration(normalized_path)
+            print(f"Reference audio: {total_duration:.1f}s")
+
+            # ── Split into conditioning chunks (8-15 sec each) ────────
+            chunks_dir = f"{work_dir}/chunks"
+            os.makedirs(chunks_dir, exist_ok=True)
+
+            chunk_duration = 10  # seconds per chunk
+            num_chunks = max(1, int(total_duration / chunk_duration))
+            chunk_paths = []
+
+            for i in range(num_chunks):
+                start = i * chunk_duration
+                chunk_path = f"{chunks_dir}/chunk_{i:03d}.wav"
+                subprocess.run([
+                    "ffmpeg", "-y", "-i", normalized_path,
+                    "-ss", str(start), "-t", str(chunk_duration),
+                    "-ar", "22050", "-ac", "1", "-acodec", "pcm_s16le",
+                    chunk_path,
+                ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                # Only include chunks that are at least 3 seconds
+                dur = _get_wav_duration(chunk_path)
+                if dur >= 3.0:
+                    chunk_paths.append(chunk_path)
+                else:
+                    os.remove(chunk_path)
+
+            print(f"Split into {len(chunk_paths)} conditioning chunks (≥3s each)")
+
+            if len(chunk_paths) < 2:
+                raise ValueError(
+                    f"Not enough usable audio for speaker conditioning "
+                    f"({total_duration:.1f}s total, {len(chunk_paths)} chunks ≥3s). "
+                    f"Please upload at least 30 seconds of clear speech."
+                )
+
+            # ── Extract conditioning latents from each chunk ──────────
+            model = self.tts.synthesizer.tts_model
+
+            all_gpt_cond = []
+            all_speaker_emb = []
+
+            for i, chunk_path in enumerate(chunk_paths):
+                print(f"  Extracting latents from chunk {i+1}/{len(chunk_paths)}...")
+                gpt_cond_latent, speaker_embedding = model.get_conditioning_latents(
+                    audio_path=[chunk_path],
+                    gpt_cond_len=30,            # longer context = better quality
+                    gpt_cond_chunk_len=4,
+                )
+                all_gpt_cond.append(gpt_cond_latent)
+                all_speaker_emb.append(speaker_embedding)
+
+            # ── Average latents across all chunks ─────────────────────
+            avg_gpt_cond = torch.mean(torch.stack(all_gpt_cond), dim=0)
+            avg_speaker_emb = torch.mean(torch.stack(all_speaker_emb), dim=0)
+
+            print(f"Averaged conditioning latents from {len(chunk_paths)} chunks")
+            print(f"  gpt_cond_latent: {avg_gpt_cond.shape}")
+            print(f"  speaker_embedding: {avg_speaker_emb.shape}")
+
+            # ── Save latents to volume ────────────────────────────────
+            checkpoint_dir = f"{PRESETS_DIR}/{preset_id}"
+            os.makedirs(checkpoint_dir, exist_ok=True)
+            latents_path = f"{checkpoint_dir}/speaker_latents.pth"
+
+            torch.save({
+                "gpt_cond_latent": avg_gpt_cond.cpu(),
+                "speaker_embedding": avg_speaker_emb.cpu(),
+                "num_chunks": len(chunk_paths),
+                "total_duration": total_duration,
+                "preset_id": preset_id,
+            }, latents_path)
+
+            model_vol.commit()
+            print(f"Speaker latents saved to {latents_path}")
+
+            # Also save a long speaker reference WAV (the full normalized audio)
+            # as fallback and for future use
+            speaker_ref_dest = f"{checkpoint_dir}/speaker_ref.wav"
+            shutil.copy2(normalized_path, speaker_ref_dest)
+            model_vol.commit()
+
+            # ── Upload completion marker to R2 (webhook fallback) ──
+            import boto3 as _boto3
+            _s3 = _boto3.client(
+                "s3",
+                endpoint_url=f"https://{os.environ['ACCOUNT_ID']}.r2.cloudflarestorage.com",
+                aws_access_key_id=os.environ["R2_ACCESS_KEY_ID"],
+                aws_secret_access_key=os.environ["R2_SECRET_ACCESS_KEY"],
+                region_name="auto",
             )
-            wav_tensor = torch.tensor(out["wav"]).unsqueeze(0)
-            torchaudio.save(raw_path, wav_tensor, SAMPLE_RATE)
-        else:
-            # Zero-shot: use speaker_wav file
-            tts.tts_to_file(
-                text=text,
-                speaker_wav=speaker_ref_path,
-                language=lang_code,
-                file_path=raw_path,
+            marker_key = f"presets/{preset_id}/done.json"
+            marker_body = json.dumps({
+                "preset_id": preset_id,
+                "status": "READY",
+                "checkpoint_volume_path": latents_path,
+            })
+            _s3.put_object(
+                Bucket=os.environ["R2_BUCKET_NAME"],
+                Key=marker_key,
+                Body=marker_body.encode(),
+                ContentType="application/json",
             )
-        raw_duration = _get_wav_duration(raw_path)
-
-        # ── Time-stretch to match original segment duration ───────
-        if target_duration > 0.05 and raw_duration > 0.05:
-            raw_tempo = raw_duration / target_duration  # >1 = speed up, <1 = slow down
-            # Dampen: blend toward 1.0 so we don't fully distort the voice
-            tempo = 1.0 + STRETCH_ALPHA * (raw_tempo - 1.0)
-            clamped_tempo = max(MIN_TEMPO, min(MAX_TEMPO, tempo))
-
-            stretched_path = f"{seg_dir}/stretched_{i:04d}.wav"
-            _time_stretch_wav(raw_path, stretched_path, tempo)
-            actual_duration = _get_wav_duration(stretched_path)
-
-            print(
-                f"  Segment {i}: \"{text[:40]}...\" "
-                f"target={target_duration:.2f}s  raw={raw_duration:.2f}s  "
-                f"raw_tempo={raw_tempo:.2f}  applied={clamped_tempo:.2f} "
-                f"(alpha={STRETCH_ALPHA})  final={actual_duration:.2f}s"
+            print(f"Uploaded completion marker to R2: {marker_key}")
+
+            # ── Clean up working directory ────────────────────────────
+            shutil.rmtree(work_dir, ignore_errors=True)
+            pipeline_vol.commit()
+
+            # ── Fire webhook ──────────────────────────────────────────
+            # print("Notifying backend — speaker conditioning complete...")
+            # webhook_base = webhook_url.replace("/job-complete", "")
+            # payload = {
+            #     "preset_id": preset_id,
+            #     "status": "READY",
+            #     "checkpoint_volume_path": latents_path,
+            # }
+            # resp = requests.post(
+            #     f"{webhook_base}/preset-complete",
+            #     json=payload, headers=webhook_headers, timeout=10,
+            # )
+            # resp.raise_for_status()
+            print(f"Speaker conditioning complete for preset {preset_id}.")
+
+        except Exception as e:
+            print(f"Speaker conditioning FAILED for preset {preset_id}: {e}")
+            traceback.print_exc()
+            try:
+                webhook_base = webhook_url.replace("/job-complete", "")
+                requests.post(
+                    f"{webhook_base}/preset-complete",
+                    json={"preset_id": preset_id, "status": "FAILED", "error": str(e)},
+                    headers=webhook_headers, timeout=10,
+                )
+            except Exception:
+                pass
+            raise
+
+    @modal.method()
+    def generate_dubbed_audio(
+        self,
+        job_id: str,
+        segments: list[dict],
+        target_language: str,
+        checkpoint_volume_path: str = None,
+        source_job_id: str = None,
+    ):
+        """Generate time-aligned dubbed audio from translated segments.
+
+        Each segment dict must have:
+            - "translated_text": str   — the text to speak
+            - "start": float           — original segment start time (seconds)
+            - "end": float             — original segment end time (seconds)
+
+        If checkpoint_volume_path is provided, conditions on the preset's
+        speaker latents and uses the preset's bundled speaker_ref.wav instead of the one
+        extracted from the source video.
+
+        source_job_id names the /pipeline/ directory holding speaker_ref.wav when
+        it differs from job_id (e.g. the shared group directory of a
+        multi-language run). Output is always written under job_id.
+
+        The function generates TTS audio per segment, time-stretches each clip
+        to match the original segment duration, inserts silence for gaps between
+        segments, and writes the final stitched result to dubbed_audio.wav.
+        """
+        import timeline
+        import telemetry
+
+        job_dir = f"/pipeline/{job_id}"
+        lang_code = target_language[:2].lower()
+
+        pipeline_vol.reload()  # Warm containers outlive jobs; pick up this one's speaker_ref.wav
+        with telemetry.stage(job_id, "tts", pipeline_vol) as rec:
+            print(f"Generating audio for {len(segments)} segments (lang={lang_code})...")
+            rendered = _render_clips_cached(
+                self.tts, job_id, list(enumerate(segments)), lang_code, checkpoint_volume_path, source_job_id, rec,
             )
-            pieces.append(stretched_path)
-        else:
-            # Segment too short to stretch — use raw audio as-is
-            print(f"  Segment {i}: \"{text[:40]}...\" raw={raw_duration:.2f}s (no stretch)")
-            pieces.append(raw_path)
+            durations = [rendered[i] for i in range(len(segments))]
+            pieces = timeline.plan(segments, durations)
+
+            # ── Concatenate all pieces into final dubbed_audio.wav ────────
+            dubbed_audio_path = f"{job_dir}/dubbed_audio.wav"
+            print(f"Concatenating {len(pieces)} audio pieces into dubbed_audio.wav...")
+            timeline.render(pieces, job_dir, dubbed_audio_path)
+
+            final_duration = _get_wav_duration(dubbed_audio_path)
+            print(f"Final dubbed audio: {final_duration:.2f}s")
+            rec.record(video_sec=final_duration, segment_count=len(segments),
+                       output_bytes=os.path.getsize(dubbed_audio_path))
+
+            pipeline_vol.commit()  # Makes dubbed_audio.wav visible to lip-sync container
+            print("Audio generation complete.")
+
+            return {
+                "duration": final_duration,
+                "num_segments": len(segments),
+                "num_pieces": len(pieces),
+            }
+
+    @modal.method()
+    def render_clips(
+        self,
+        job_id: str,
+        segments: list[dict],
+        target_language: str,
+        checkpoint_volume_path: str = None,
+        source_job_id: str = None,
+    ) -> dict:
+        """Render clips for a subset of a job's segments without assembling them.
+
+        Each segment carries its global "index" in the job's transcript so the
+        clips land where timeline.plan() expects them. Returns {index: duration}
+        (None for empty segments); the caller assembles dubbed audio once the
+        clips it needs exist.
+        """
+        import telemetry
+        import timeline
+
+        lang_code = target_language[:2].lower()
+
+        pipeline_vol.reload()  # Warm containers outlive jobs; pick up this one's speaker_ref.wav
+        with telemetry.stage(job_id, "tts_clips", pipeline_vol) as rec:
+            print(f"Rendering {len(segments)} clips (lang={lang_code})...")
+            durations = _render_clips_cached(
+                self.tts, job_id, [(seg["index"], seg) for seg in segments], lang_code,
+                checkpoint_volume_path, source_job_id, rec,
+            )
+            rec.record(
+                video_sec=sum(d for d in durations.values() if d),
+                segment_count=len(segments),
+                output_bytes=sum(
+                    os.path.getsize(timeline.clip_path(f"/pipeline/{job_id}", i)) for i, d in durations.items() if d is not None
+                ),
+            )
+            pipeline_vol.commit()  # Makes the clips visible to whoever assembles the timeline
+        return durations
 
-    # ── Handle leading silence (if first segment doesn't start at 0) ──
-    if segments and float(segments[0]["start"]) > 0.01 and pieces:
-        lead_silence = f"{seg_dir}/silence_lead.wav"
-        _generate_silence_wav(lead_silence, float(segments[0]["start"]))
-        pieces.insert(0, lead_silence)
 
-    # ── Concatenate all pieces into final dubbed_audio.wav ────────
-    if not pieces:
-        raise RuntimeError("No audio segments were generated — nothing to concatenate.")
+def shard_segments(segments: list[dict], num_shards: int) -> list[list[dict]]:
+    """Split segments into num_shards lists of about equal synthesis cost.
 
-    print(f"Concatenating {len(pieces)} audio pieces into dubbed_audio.wav...")
-    _concat_wavs(pieces, dubbed_audio_path)
+    Cost is estimated from text length; segments are placed longest first
+    on the cheapest shard so far. Each segment gains its position in the
+    transcript as "index", which is where XTTS.render_clips() writes its clip.
+    """
+    import heapq
 
-    final_duration = _get_wav_duration(dubbed_audio_path)
-    print(f"Final dubbed audio: {final_duration:.2f}s")
+    indexed = [{**seg, "index": i} for i, seg in enumerate(segments)]
+    costs = {
+        seg["index"]: len(seg["translated_text"].strip()) + SEGMENT_COST_OVERHEAD
+        for seg in indexed if seg["translated_text"].strip()
+    }
+    shards = [[] for _ in range(num_shards)]
+    heap = [(0, n) for n in range(num_shards)]
+    for seg in sorted(indexed, key=lambda s: costs.get(s["index"], 0), reverse=True):
+        load, n = heapq.heappop(heap)
+        shards[n].append(seg)
+        heapq.heappush(heap, (load + costs.get(seg["index"], 0), n))
+    return [sorted(shard, key=lambda s: s["index"]) for shard in shards if shard]
 
-    pipeline_vol.commit()  # Makes dubbed_audio.wav visible to lip-sync container
-    print("Audio generation complete.")
 
-    return {
-        "duration": final_duration,
-        "num_segments": len(segments),
-        "num_pieces": len(pieces),
-    }
+@app.function(
+    image=xtts_image,
+    timeout=1800,
+    volumes={"/pipeline": pipeline_vol}
+)
+def generate_dubbed_audio_sharded(
+    job_id: str,
+    segments: list[dict],
+    target_language: str,
+    checkpoint_volume_path: str = None,
+    source_job_id: str = None,
+    num_shards: int = None,
+):
+    """Same contract and output as generate_dubbed_audio, synthesized across containers.
+
+    Segments are split into cost-balanced shards rendered in parallel with
+    XTTS.render_clips.map(); this (CPU) container then lays the clips out with
+    the same timeline.plan() the serial path uses and writes
+    dubbed_audio.wav.
+    """
+    import math
+    import timeline
+    import telemetry
+
+    if num_shards is None:
+        num_shards = min(MAX_SHARDS, max(1, math.ceil(len(segments) / SEGMENTS_PER_SHARD)))
+    with telemetry.stage(job_id, "tts", pipeline_vol) as rec:
+        shards = shard_segments(segments, num_shards)
+        print(f"Rendering {len(segments)} segments across {len(shards)} shards...")
+
+        durations = {}
+        n = len(shards)
+        for shard_durations in XTTS().render_clips.map(
+            [job_id] * n, shards, [target_language] * n, [checkpoint_volume_path] * n, [source_job_id] * n,
+        ):
+            durations.update(shard_durations)
+
+        # ── Reduce: assemble every clip into dubbed_audio.wav ─────────
+        pipeline_vol.reload()  # Clips were committed by the render_clips containers
+        job_dir = f"/pipeline/{job_id}"
+        pieces = timeline.plan(segments, [durations.get(i) for i in range(len(segments))])
+        dubbed_audio_path = f"{job_dir}/dubbed_audio.wav"
+        print(f"Concatenating {len(pieces)} audio pieces into dubbed_audio.wav...")
+        timeline.render(pieces, job_dir, dubbed_audio_path)
+
+        final_duration = _get_wav_duration(dubbed_audio_path)
+        print(f"Final dubbed audio: {final_duration:.2f}s")
+        rec.record(video_sec=final_duration, segment_count=len(segments),
+                   output_bytes=os.path.getsize(dubbed_audio_path))
+
+        pipeline_vol.commit()  # Makes dubbed_audio.wav visible to lip-sync container
+        return {
+            "duration": final_duration,
+            "num_segments": len(segments),
+            "num_pieces": len(pieces),
+            "num_shards": len(shards),
+        }
 
 
 # 5. Local Testing Entrypoint
@@ -549,7 +711,7 @@ def main(job_id: str = "test-123"):
     target_lang = "es"
 
     print(f"Triggering Modal voice cloning job for job_id={job_id}...")
-    result = generate_dubbed_audio.remote(
+    result = XTTS().generate_dubbed_audio.remote(
         job_id=job_id, segments=test_segments, target_language=target_lang,
         checkpoint_volume_path=None,  # pass a path to test fine-tuned preset
     )
@@ -0,0 +1,156 @@
+"""Content-addressed cache for pipeline stage outputs on the redub-pipeline volume.
+
+Each stage derives a key from everything its output depends on (inputs,
+model, configuration) with key(), looks it up before doing any GPU or API
+work, and stores what it produced afterwards. Entries live under
+/pipeline/cache/{kind}/{key[:2]}/{key}/ and are either a JSON document or
+a single file. A hit touches the entry's mtime, so evict() can drop the
+least recently used entries once the cache outgrows CACHE_MAX_BYTES.
+evict() walks the whole cache, so only the scheduled volume GC
+(app_gc.py) runs it; stages never do, and between runs the cache may
+overshoot CACHE_MAX_BYTES by what those hours add. Hit and miss counts
+per kind go to the redub-cache-stats Dict, which the backend reports in
+GET /api/admin/stats.
+
+Mount with .add_local_python_source("artifact_cache"); callers reload and
+commit the pipeline volume around their stage as usual.
+"""
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import time
+
+CACHE_ROOT = "/pipeline/cache"
+CACHE_MAX_BYTES = int(float(os.getenv("REDUB_CACHE_MAX_GB", "50")) * 1024 ** 3)
+STATS_DICT = "redub-cache-stats"
+
+_JSON_NAME = "value.json"
+_FILE_NAME = "artifact"
+
+
+def key(kind: str, **parts) -> str:
+    """Stable hash of a stage's inputs; parts must be JSON-serializable."""
+    payload = json.dumps({"kind": kind, **parts}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def audio_digest(media_path: str) -> str:
+    """Hash of a file's audio packets (no decode), so remuxes of the same audio match."""
+    result = subprocess.run(
+        ["ffmpeg", "-v", "quiet", "-i", media_path, "-map", "0:a:0", "-c", "copy",
+         "-f", "hash", "-hash", "sha256", "-"],
+        capture_output=True, text=True, check=True,
+    )
+    return result.stdout.strip().split("=", 1)[-1]
+
+
+def _entry_dir(kind: str, cache_key: str) -> str:
+    return f"{CACHE_ROOT}/{kind}/{cache_key[:2]}/{cache_key}"
+
+
+def _record(kind: str, hit: bool):
+    # Dicts have no atomic increment: two containers recording the same counter at
+    # once can lose one count. The counts only feed hit rates, so that is accepted.
+    try:
+        import modal
+
+        stats = modal.Dict.from_name(STATS_DICT, create_if_missing=True)
+        name = f"{kind}:{'hits' if hit else 'misses'}"
+        stats[name] = stats.get(name, 0) + 1
+    except Exception as e:
+        print(f"[warn] Could not record cache {kind} {'hit' if hit else 'miss'}: {e}")
+
+
+def _lookup(kind: str, cache_key: str, name: str) -> str | None:
+    path = f"{_entry_dir(kind, cache_key)}/{name}"
+    hit = os.path.exists(path)
+    _record(kind, hit)
+    if hit:
+        now = time.time()
+        os.utime(_entry_dir(kind, cache_key), (now, now))
+        return path
+    return None
+
+
+def get_json(kind: str, cache_key: str):
+    """Cached JSON value, or None on a miss."""
+    path = _lookup(kind, cache_key, _JSON_NAME)
+    if path is None:
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def put_json(kind: str, cache_key: str, value):
+    entry = _entry_dir(kind, cache_key)
+    os.makedirs(entry, exist_ok=True)
+    tmp_path = f"{entry}/{_JSON_NAME}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(value, f, ensure_ascii=False)
+    os.replace(tmp_path, f"{entry}/{_JSON_NAME}")
+
+
+def get_file(kind: str, cache_key: str, output_path: str) -> bool:
+    """Copy a cached file to output_path. Returns False on a miss."""
+    path = _lookup(kind, cache_key, _FILE_NAME)
+    if path is None:
+        return False
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    shutil.copyfile(path, output_path)
+    return True
+
+
+def put_file(kind: str, cache_key: str, source_path: str):
+    entry = _entry_dir(kind, cache_key)
+    os.makedirs(entry, exist_ok=True)
+    tmp_path = f"{entry}/{_FILE_NAME}.tmp"
+    shutil.copyfile(source_path, tmp_path)
+    os.replace(tmp_path, f"{entry}/{_FILE_NAME}")
+
+
+def _entries() -> list[tuple[float, int, str]]:
+    """(last used, size in bytes, path) for every cache entry."""
+    entries = []
+    if not os.path.isdir(CACHE_ROOT):
+        return entries
+    for kind in os.listdir(CACHE_ROOT):
+        kind_dir = f"{CACHE_ROOT}/{kind}"
+        for prefix in os.listdir(kind_dir):
+            prefix_dir = f"{kind_dir}/{prefix}"
+            for name in os.listdir(prefix_dir):
+                entry = f"{prefix_dir}/{name}"
+                size = sum(
+                    os.path.getsize(f"{root}/{f}")
+                    for root, _, files in os.walk(entry) for f in files
+                )
+                entries.append((os.path.getmtime(entry), size, entry))
+    return entries
+
+
+def evict(max_bytes: int = CACHE_MAX_BYTES) -> int:
+    """Delete least recently used entries until the cache fits in max_bytes.
+
+    Returns the number of bytes freed.
+    """
+    entries = sorted(_entries())
+    total = sum(size for _, size, _ in entries)
+    freed = 0
+    for _, size, entry in entries:
+        if total - freed <= max_bytes:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        freed += size
+    if freed:
+        print(f"Cache eviction freed {freed / 1024 ** 2:.1f} MB")
+    return freed
+
@@ -0,0 +1,108 @@
+"""Transcription engines behind app_whisper.
+
+Every engine takes 16 kHz mono float32 audio and returns
+{"text", "language", "segments": [{"start", "end", "text"}]} with
+timestamps relative to the audio it was given. language is an optional
+ISO code; declaring it skips language detection.
+
+  openai     openai-whisper, the reference decoder (word timestamps on)
+  faster     faster-whisper on CTranslate2: batched inference through
+             BatchedInferencePipeline, int8 or float16 compute
+
+REDUB_ASR_ENGINE picks the engine ("openai" by default),
+REDUB_ASR_COMPUTE_TYPE the CTranslate2 compute type (float16 on GPU, int8
+on CPU by default) and REDUB_ASR_BATCH_SIZE the batch size. Engine
+libraries are imported on load, so this module imports anywhere.
+"""
+import os
+
+DEFAULT_ENGINE = os.getenv("REDUB_ASR_ENGINE", "openai")
+DEFAULT_BATCH_SIZE = int(os.getenv("REDUB_ASR_BATCH_SIZE", "16"))
+
+
+class OpenAIWhisper:
+    name = "openai"
+    movable = True  # Loaded on CPU once, then moved; fits a memory snapshot
+
+    def __init__(self, model_name: str, download_root: str = None):
+        self.model_name = model_name
+        self.download_root = download_root
+        self.model = None
+
+    def load(self, device: str):
+        import whisper
+
+        if self.model is None:
+            self.model = whisper.load_model(self.model_name, device=device, download_root=self.download_root)
+        else:
+            self.model = self.model.to(device)
+        return self
+
+    def cached(self) -> bool:
+        return os.path.exists(f"{self.download_root}/{self.model_name}.pt")
+
+    def cache_identity(self) -> dict:
+        return {"model": self.model_name}
+
+    def transcribe(self, audio, language: str = None) -> dict:
+        # Word timestamps sharpen segment boundaries, which lip-sync timing relies on
+        result = self.model.transcribe(audio, word_timestamps=True, language=language)
+        return {
+            "text": result["text"],
+            "language": result.get("language", language),
+            "segments": [
+                {"start": float(seg["start"]), "end": float(seg["end"]), "text": seg["text"]}
+                for seg in result["segments"]
+            ],
+        }
+
+
+class FasterWhisper:
+    name = "faster"
+    movable = False  # CTranslate2 models are built for one device
+
+    def __init__(self, model_name: str, download_root: str = None, compute_type: str = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE):
+        self.model_name = model_name
+        self.download_root = download_root
+        self.compute_type = compute_type or os.getenv("REDUB_ASR_COMPUTE_TYPE")
+        self.batch_size = batch_size
+        self.pipeline = None
+
+    def load(self, device: str):
+        from faster_whisper import BatchedInferencePipeline, WhisperModel
+
+        self.compute_type = self.compute_type or ("float16" if device == "cuda" else "int8")
+        model = WhisperModel(
+            self.model_name, device=device, compute_type=self.compute_type, download_root=self.download_root,
+        )
+        self.pipeline = BatchedInferencePipeline(model=model)
+        return self
+
+    def cached(self) -> bool:
+        return os.path.isdir(self.download_root) and bool(os.listdir(self.download_root))
+
+    def cache_identity(self) -> dict:
+        return {"model": self.model_name, "engine": self.name, "compute_type": self.compute_type}
+
+    def transcribe(self, audio, language: str = None) -> dict:
+        segments, info = self.pipeline.transcribe(
+            audio, language=language, batch_size=self.batch_size, word_timestamps=True,
+        )
+        segments = [{"start": float(seg.start), "end": float(seg.end), "text": seg.text} for seg in segments]
+        return {
+            "text": "".join(seg["text"] for seg in segments),
+            "language": info.language,
+            "segments": segments,
+        }
+
+
+ENGINES = {engine.name: engine for engine in (OpenAIWhisper, FasterWhisper)}
+
+
+def create(model_name: str, engine: str = None, **options):
+    """An unloaded engine; call .load(device) before transcribing."""
+    engine = engine or DEFAULT_ENGINE
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown ASR engine {engine!r}; expected one of {sorted(ENGINES)}")
+    return ENGINES[engine](model_name, **options)
@@ -0,0 +1,131 @@
+"""
+Benchmark: the ASR engines in asr_engines.py on CPU.
+
+Usage:
+    modal run ml/bench_asr.py --job-id test-123
+    modal run ml/bench_asr.py --job-id test-123 --model tiny --seconds 300 --batch-size 8
+
+Transcribes the first --seconds of /pipeline/{job_id}/asr_16k.f32 (or
+source.mp4) on a CPU container with openai-whisper and with faster-whisper
+at int8 and float32 compute. Each run is given the language openai-whisper
+detected, so no run pays for detection. Reports:
+    - throughput: audio seconds transcribed per wall-clock second
+    - parity: every openai-whisper segment is matched to the candidate
+      segment overlapping it most; start/end differences are summarized,
+      and reference segments with no overlap are counted as unmatched
+
+Requires:
+    - a job prepared on the pipeline volume (source.mp4, ideally asr_16k.f32)
+"""
+import json
+
+import modal
+
+app = modal.App("redub-asr-bench")
+
+pipeline_vol = modal.Volume.from_name("redub-pipeline", create_if_missing=True)
+
+bench_image = (
+    modal.Image.debian_slim(python_version="3.11")
+    .apt_install("ffmpeg")
+    .pip_install("openai-whisper", "faster-whisper>=1.1", "torch", "numpy")
+    .add_local_python_source("asr_engines", "preprocess")
+)
+
+SAMPLE_RATE = 16000
+
+
+def _parity(reference: list[dict], candidate: list[dict]) -> dict:
+    """Start/end differences between each reference segment and its best-overlapping candidate."""
+    start_diffs, end_diffs = [], []
+    unmatched = 0
+    for ref in reference:
+        overlaps = [(min(ref["end"], c["end"]) - max(ref["start"], c["start"]), c) for c in candidate]
+        overlap, match = max(overlaps, key=lambda o: o[0], default=(0.0, None))
+        if match is None or overlap <= 0:
+            unmatched += 1
+            continue
+        start_diffs.append(abs(match["start"] - ref["start"]))
+        end_diffs.append(abs(match["end"] - ref["end"]))
+
+    def summary(diffs: list[float]) -> dict:
+        if not diffs:
+            return {"mean": None, "p90": None, "max": None}
+        ordered = sorted(diffs)
+        return {
+            "mean": round(sum(ordered) / len(ordered), 3),
+            "p90": round(ordered[min(len(ordered) - 1, int(0.9 * len(ordered)))], 3),
+            "max": round(ordered[-1], 3),
+        }
+
+    return {
+        "segments": len(candidate),
+        "reference_segments": len(reference),
+        "unmatched": unmatched,
+        "start_diff_sec": summary(start_diffs),
+        "end_diff_sec": summary(end_diffs),
+    }
+
+
+@app.function(
+    image=bench_image,
+    cpu=8.0,
+    memory=8192,
+    timeout=3600,
+    volumes={"/pipeline": pipeline_vol},
+)
+def benchmark(job_id: str, model: str = "tiny", seconds: float = 120.0, batch_size: int = 8) -> dict:
+    import time
+    import numpy as np
+    import whisper
+    import asr_engines
+    import preprocess
+
+    asr_path = preprocess.artifact(f"/pipeline/{job_id}", preprocess.ASR_AUDIO)
+    if asr_path is not None:
+        audio = np.fromfile(asr_path, dtype=np.float32)
+    else:
+        audio = whisper.load_audio(f"/pipeline/{job_id}/source.mp4")
+    audio = audio[:int(seconds * SAMPLE_RATE)]
+    audio_sec = len(audio) / SAMPLE_RATE
+
+    configs = [
+        ("openai", {}),
+        ("faster", {"compute_type": "int8", "batch_size": batch_size}),
+        ("faster", {"compute_type": "float32", "batch_size": batch_size}),
+    ]
+    runs = []
+    language = None
+    for name, options in configs:
+        engine = asr_engines.create(model, name, download_root=f"/tmp/asr-bench/{name}", **options)
+        started = time.monotonic()
+        engine.load("cpu")
+        load_sec = time.monotonic() - started
+
+        if language is None:
+            # Detection runs once, outside the timed runs
+            language = engine.transcribe(audio[:30 * SAMPLE_RATE])["language"]
+
+        started = time.monotonic()
+        result = engine.transcribe(audio, language)
+        wall_sec = time.monotonic() - started
+        label = name if not options else f"{name}-{options['compute_type']}"
+        print(f"{label}: {wall_sec:.1f}s for {audio_sec:.1f}s of audio, {len(result['segments'])} segments")
+        runs.append({
+            "engine": label,
+            "load_sec": round(load_sec, 2),
+            "wall_sec": round(wall_sec, 2),
+            "audio_sec_per_sec": round(audio_sec / wall_sec, 2),
+            "segments": result["segments"],
+        })
+
+    reference = runs[0]["segments"]
+    for run in runs:
+        run["parity"] = _parity(reference, run.pop("segments"))
+    return {"model": model, "audio_sec": round(audio_sec, 1), "language": language, "runs": runs}
+
+
+@app.local_entrypoint()
+def main(job_id: str = "test-123", model: str = "tiny", seconds: float = 120.0, batch_size: int = 8):
+    report = benchmark.remote(job_id, model, seconds, batch_size)
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,273 @@
+"""Small DAG engine for the dubbing pipeline.
+
+A Graph is a set of Nodes. Each node names the values it consumes
+(inputs) and the values it produces (outputs), and edges follow from
+those names. run() starts a node as soon as all of its inputs exist, so
+independent branches overlap. Each node also has:
+
+  resource   a class such as "cpu", "gpu" or "io"; executors cap how many
+             nodes of each class run at once
+  retries    extra attempts after a failure
+  timeout    seconds per attempt, never past the run's deadline; node
+             bodies bound their blocking waits with remaining()
+  cancellable
+             attempts stop on their own once remaining() runs out (every
+             wait is bounded by it and remote work is cancelled with it).
+             Only these are retried after a timeout, and only once the
+             timed-out attempt has stopped; any other node that times out
+             fails the run, since its abandoned attempt may still be
+             writing the files a retry would write.
+  restore    returns checkpointed outputs to use instead of running the
+             node, or None. It is only consulted while every upstream node
+             was restored too, so a rerun invalidates everything downstream.
+
+Executors decide where node bodies run. ThreadExecutor runs them on
+threads (in the orchestrator they mostly wait on Modal calls).
+LocalExecutor runs them one at a time in graph order, for tests and local
+debugging. Stdlib only.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable
+
+POLL_SEC = 1.0  # How often run() checks timeouts and the stop callback while nodes are in flight
+CANCEL_GRACE_SEC = 60.0  # How long a timed-out cancellable attempt gets to stop before the run gives up
+
+
+class NodeTimeout(Exception):
+    """An attempt at a node ran past its timeout."""
+
+
+class GraphError(ValueError):
+    """The graph is malformed: duplicate or missing values, or a cycle."""
+
+
+@dataclass(frozen=True)
+class Node:
+    name: str
+    fn: Callable[..., dict | None]        # Called with the inputs as keyword arguments; returns {output: value}
+    inputs: tuple[str, ...] = ()
+    outputs: tuple[str, ...] = ()
+    resource: str = "cpu"
+    retries: int = 0
+    timeout: float | None = None
+    cancellable: bool = False
+    restore: Callable[..., dict | None] | None = None  # Same arguments as fn
+
+
+_attempt = threading.local()
+
+
+def remaining() -> float | None:
+    """Seconds left in the current node attempt's timeout, or None if it has none.
+
+    Only meaningful inside a node body; pass it to blocking waits so a
+    timed-out attempt stops instead of lingering on its thread.
+    """
+    deadline = getattr(_attempt, "deadline", None)
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0.0)
+
+
+def attempt_deadline() -> float | None:
+    """The current node attempt's time.monotonic() deadline, to hand to threads the node starts."""
+    return getattr(_attempt, "deadline", None)
+
+
+@contextmanager
+def within(deadline: float | None):
+    """Run a block under an attempt deadline, so remaining() works on threads a node body starts."""
+    previous = getattr(_attempt, "deadline", None)
+    _attempt.deadline = deadline
+    try:
+        yield
+    finally:
+        _attempt.deadline = previous
+
+
+class Graph:
+    def __init__(self, nodes: list[Node]):
+        self.nodes = {}
+        self.producers = {}
+        for node in nodes:
+            if node.name in self.nodes:
+                raise GraphError(f"Duplicate node {node.name!r}")
+            self.nodes[node.name] = node
+            for value in node.outputs:
+                if value in self.producers:
+                    raise GraphError(f"{value!r} is produced by both {self.producers[value]!r} and {node.name!r}")
+                self.producers[value] = node.name
+        self.order = self._topological_order()
+
+    def upstream(self, name: str) -> set[str]:
+        """Names of the nodes producing this node's inputs (inputs given to run() have none)."""
+        return {self.producers[v] for v in self.nodes[name].inputs if v in self.producers}
+
+    def _topological_order(self) -> list[str]:
+        order = []
+        state = {}  # name -> "visiting" | "done"
+
+        def visit(name: str, path: list[str]):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise GraphError(f"Cycle: {' -> '.join(path + [name])}")
+            state[name] = "visiting"
+            for dep in sorted(self.upstream(name)):
+                visit(dep, path + [name])
+            state[name] = "done"
+            order.append(name)
+
+        for name in self.nodes:
+            visit(name, [])
+        return order
+
+
+class ThreadExecutor:
+    """Runs node bodies on a thread pool, at most limits[resource] per class at once."""
+
+    def __init__(self, limits: dict[str, int] = None, max_workers: int = 16):
+        self.limits = limits or {}
+        self.max_workers = max_workers
+
+    def can_start(self, resource: str, running: dict[str, int]) -> bool:
+        if sum(running.values()) >= self.max_workers:
+            return False
+        limit = self.limits.get(resource)
+        return limit is None or running.get(resource, 0) < limit
+
+
+class LocalExecutor(ThreadExecutor):
+    """One node at a time in graph order: deterministic, for tests and local runs."""
+
+    def __init__(self):
+        super().__init__(max_workers=1)
+
+
+def _attempt_deadline(node: Node, started: float, deadline: float | None) -> float | None:
+    """When an attempt started at started times out: its node's timeout, clipped to the run's deadline."""
+    ends = [t for t in (None if node.timeout is None else started + node.timeout, deadline) if t is not None]
+    return min(ends) if ends else None
+
+
+def _call(node: Node, fn: Callable, kwargs: dict, deadline: float | None) -> dict:
+    with within(deadline):
+        result = fn(**kwargs) or {}
+    missing = [v for v in node.outputs if v not in result]
+    if missing:
+        raise GraphError(f"Node {node.name!r} did not produce {missing}")
+    return {v: result[v] for v in node.outputs}
+
+
+def run(
+    graph: Graph,
+    values: dict[str, Any] = None,
+    executor: ThreadExecutor = None,
+    should_stop: Callable[[], None] = None,
+    deadline: float | None = None,
+) -> dict[str, Any]:
+    """Run every node of graph and return all values, the given ones included.
+
+    should_stop is called between scheduling steps and may raise to abort
+    the run (e.g. on cancellation); it is also called before each retry.
+    deadline (time.monotonic()) caps every attempt's timeout, so node
+    budgets never outlast the caller's own. A node that fails after its
+    retries re-raises its last error; nodes already in flight are
+    abandoned, not waited for.
+    """
+    values = dict(values or {})
+    executor = executor or ThreadExecutor()
+    should_stop = should_stop or (lambda: None)
+
+    missing = {v for n in graph.nodes.values() for v in n.inputs if v not in graph.producers and v not in values}
+    if missing:
+        raise GraphError(f"No node produces {sorted(missing)} and no value was given")
+
+    pending = list(graph.order)
+    fresh = set()      # Nodes that ran rather than being restored
+    checked = set()    # Nodes whose restore was already consulted
+    attempts = {}      # node -> attempts started
+    running = {}       # future -> (node, started monotonic, attempt deadline)
+    overdue = set()    # Timed-out cancellable attempts still stopping
+    busy = {}          # resource -> nodes running
+    pool = ThreadPoolExecutor(max_workers=executor.max_workers, thread_name_prefix="dag")
+
+    def launch(node: Node, kwargs: dict):
+        attempts[node.name] = attempts.get(node.name, 0) + 1
+        busy[node.resource] = busy.get(node.resource, 0) + 1
+        started = time.monotonic()
+        attempt_deadline = _attempt_deadline(node, started, deadline)
+        running[pool.submit(_call, node, node.fn, kwargs, attempt_deadline)] = (node, started, attempt_deadline)
+        print(f"[dag] {node.name} started (attempt {attempts[node.name]}/{node.retries + 1})")
+
+    def finish(node: Node):
+        busy[node.resource] -= 1
+
+    try:
+        while pending or running:
+            should_stop()
+
+            # Restore or start every node whose inputs exist, in graph order
+            for name in list(pending):
+                node = graph.nodes[name]
+                if any(v not in values for v in node.inputs):
+                    continue
+                kwargs = {v: values[v] for v in node.inputs}
+                if node.restore is not None and name not in checked and not (graph.upstream(name) & fresh):
+                    checked.add(name)
+                    restored = node.restore(**kwargs)
+                    if restored is not None:
+                        values.update({v: restored[v] for v in node.outputs})
+                        pending.remove(name)
+                        print(f"[dag] {name} restored from checkpoint")
+                        continue
+                if not executor.can_start(node.resource, busy):
+                    continue
+                pending.remove(name)
+                fresh.add(name)
+                launch(node, kwargs)
+
+            if not running:
+                if pending:
+                    raise GraphError(f"Nodes {pending} can never start")
+                break
+
+            done, _ = wait(list(running), timeout=POLL_SEC, return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            for future in list(running):
+                node, started, attempt_deadline = running[future]
+                retryable = True
+                if future in done:
+                    # A cancellable attempt that ran over ends with its own NodeTimeout
+                    error = future.exception()
+                elif attempt_deadline is None or now <= attempt_deadline:
+                    continue
+                elif node.cancellable and now <= attempt_deadline + CANCEL_GRACE_SEC:
+                    if future not in overdue:
+                        overdue.add(future)
+                        print(f"[warn] [dag] {node.name} timed out; waiting for the attempt to stop")
+                    continue
+                else:
+                    error = NodeTimeout(f"{node.name} exceeded its {attempt_deadline - started:.0f}s budget")
+                    retryable = False
+                del running[future]
+                overdue.discard(future)
+                finish(node)
+                if error is None:
+                    values.update(future.result())
+                    print(f"[dag] {node.name} finished in {now - started:.1f}s")
+                    continue
+                if deadline is not None and now >= deadline:
+                    retryable = False
+                if not retryable or attempts[node.name] > node.retries:
+                    raise error
+                print(f"[warn] [dag] {node.name} failed ({error}); retrying")
+                should_stop()
+                launch(node, {v: values[v] for v in node.inputs})
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return values
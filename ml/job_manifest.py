@@ -0,0 +1,68 @@
+"""Per-job checkpoint manifest at /pipeline/{job_id}/manifest.json.
+
+The orchestrator records each stage (prepare, transcribe, translate, tts,
+lipsync, publish) as it completes, with the files it produced (path and
+size) and any small result it returned (transcript, translated segments,
+output key), plus the parameters the job was started with. A resumed run
+skips every leading stage whose entry is still valid, meaning all of its
+artifacts exist with the recorded size, and reruns from the first one
+that is not. Lip-sync windows are also recorded as they finish, under
+"windows", so a rerun lip-sync only redoes the missing ones. Stdlib only.
+"""
+import json
+import os
+from datetime import datetime, timezone
+
+MANIFEST_NAME = "manifest.json"
+
+
+def manifest_path(work_id: str) -> str:
+    return f"/pipeline/{work_id}/{MANIFEST_NAME}"
+
+
+def load(work_id: str) -> dict:
+    """The manifest for a job or group directory, or an empty one."""
+    try:
+        with open(manifest_path(work_id)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"job_id": work_id, "params": {}, "stages": {}}
+
+
+def _save(work_id: str, manifest: dict):
+    path = manifest_path(work_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def start(work_id: str, **params):
+    """Record the parameters a run was started with, keeping completed stages."""
+    manifest = load(work_id)
+    manifest["params"].update({k: v for k, v in params.items() if v is not None})
+    _save(work_id, manifest)
+
+
+def record(work_id: str, stage: str, artifacts: list[str] = (), data=None):
+    """Mark a stage complete with the files it wrote and its (JSON) result."""
+    manifest = load(work_id)
+    manifest["stages"][stage] = {
+        "completed_at": datetime.now(timezone.utc).isoformat(),
+        "artifacts": {path: os.path.getsize(path) for path in artifacts},
+        "data": data,
+    }
+    _save(work_id, manifest)
+
+
+def valid_stage(work_id: str, stage: str) -> dict | None:
+    """The stage's entry if it completed and its artifacts are intact, else None."""
+    entry = load(work_id)["stages"].get(stage)
+    if entry is None:
+        return None
+    for path, size in entry["artifacts"].items():
+        if not os.path.exists(path) or os.path.getsize(path) != size:
+            print(f"[warn] Checkpoint for {stage} is stale: {path} is missing or changed")
+            return None
+    return entry
@@ -0,0 +1,221 @@
+"""Time windows for lip-syncing a video in pieces and stitching the results.
+
+Window boundaries sit on the 25 fps frame grid, preferably on a scene cut
+or in a pause in the dubbed audio where a seam is invisible. Every
+lip-sync engine writes each window with normalize_window(), padded or
+trimmed to exactly the frames its bounds span, so all windows share codec,
+frame rate, pixel format and timescale and stitch() can join them with the
+concat demuxer's stream copy. The dubbed audio is muxed once over the
+joined video rather than carried per window, so A/V sync holds at every
+seam. Stdlib + ffmpeg only.
+"""
+import json
+import os
+import re
+import subprocess
+import tempfile
+
+VIDEO_FPS = 25           # Frame grid every window is cut and encoded on
+VIDEO_TIMESCALE = 12800  # Shared MP4 timescale so concatenated timestamps line up
+
+SCENE_THRESHOLD = 0.4    # ffmpeg scene-change score that counts as a cut
+SILENCE_NOISE_DB = -35
+SILENCE_MIN_SEC = 0.3
+BOUNDARY_TOLERANCE = 0.25  # Boundaries may move this fraction of a window to hit a cut
+
+
+def snap_to_frame(seconds: float) -> float:
+    """Round a timestamp to the nearest video frame boundary."""
+    return round(seconds * VIDEO_FPS) / VIDEO_FPS
+
+
+def frames_between(start: float, end: float) -> int:
+    return round((end - start) * VIDEO_FPS)
+
+
+def media_duration(path: str) -> float:
+    result = subprocess.run(
+        ["ffprobe", "-v", "quiet", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+        capture_output=True, text=True, check=True,
+    )
+    return float(result.stdout.strip())
+
+
+def source_video(work_dir: str) -> str:
+    """The 25 fps mezzanine from preprocessing if there is one, else source.mp4."""
+    import preprocess
+
+    return preprocess.artifact(work_dir, preprocess.MEZZANINE) or f"{work_dir}/source.mp4"
+
+
+def count_frames(path: str) -> int:
+    """Number of video frames in a file, counted from packets (no decode)."""
+    result = subprocess.run(
+        ["ffprobe", "-v", "quiet", "-select_streams", "v:0", "-count_packets",
+         "-show_entries", "stream=nb_read_packets", "-of", "json", path],
+        capture_output=True, text=True, check=True,
+    )
+    return int(json.loads(result.stdout)["streams"][0]["nb_read_packets"])
+
+
+# ── Boundary selection ───────────────────────────────────────────
+
+def detect_scene_cuts(video_path: str, threshold: float = SCENE_THRESHOLD) -> list[float]:
+    """Timestamps of hard cuts, scored on a downscaled decode to keep it cheap."""
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-i", video_path, "-an",
+         "-vf", f"scale=160:-2,select='gt(scene,{threshold})',showinfo",
+         "-f", "null", "-"],
+        capture_output=True, text=True, check=True,
+    )
+    return [float(t) for t in re.findall(r"pts_time:([0-9.]+)", result.stderr)]
+
+
+def detect_silences(audio_path: str, noise_db: float = SILENCE_NOISE_DB,
+                    min_sec: float = SILENCE_MIN_SEC) -> list[float]:
+    """Midpoints of pauses in an audio file."""
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-i", audio_path,
+         "-af", f"silencedetect=noise={noise_db}dB:d={min_sec}", "-f", "null", "-"],
+        capture_output=True, text=True, check=True,
+    )
+    starts = [float(t) for t in re.findall(r"silence_start: ([0-9.]+)", result.stderr)]
+    ends = [float(t) for t in re.findall(r"silence_end: ([0-9.]+)", result.stderr)]
+    return [(s + e) / 2 for s, e in zip(starts, ends)]
+
+
+def choose_boundary(target: float, scene_cuts: list[float], silences: list[float],
+                    tolerance: float) -> float:
+    """Frame-aligned boundary near target: a scene cut if one is close, else a pause, else target."""
+    for candidates in (scene_cuts, silences):
+        near = [t for t in candidates if abs(t - target) <= tolerance]
+        if near:
+            return snap_to_frame(min(near, key=lambda t: abs(t - target)))
+    return snap_to_frame(target)
+
+
+def aligned_windows(duration: float, window_sec: float, scene_cuts: list[float] = (),
+                    silences: list[float] = ()) -> list[tuple[float, float | None]]:
+    """[start, end) windows of about window_sec whose seams fall on cuts or pauses.
+
+    The last window is open-ended (end=None) and runs to the end of the video.
+    """
+    bounds = []
+    start = 0.0
+    tolerance = window_sec * BOUNDARY_TOLERANCE
+    while duration - start > window_sec * 1.5:
+        end = choose_boundary(start + window_sec, scene_cuts, silences, tolerance)
+        if end <= start:
+            end = snap_to_frame(start + window_sec)
+        bounds.append((start, end))
+        start = end
+    bounds.append((start, None))
+    return bounds
+
+
+# ── Per-window media ─────────────────────────────────────────────
+
+def cut_window(source_path: str, output_path: str, start: float, end: float | None = None):
+    """Frame-accurate, 25 fps, video-only cut of [start, end) for engines that take a whole clip.
+
+    Seeking on the input only decodes from the keyframe before start, which
+    on the mezzanine is at most a second of video.
+    """
+    duration = ["-t", f"{end - start:.3f}"] if end is not None else []
+    subprocess.run(
+        ["ffmpeg", "-y", "-ss", f"{start:.3f}", "-i", source_path, *duration, "-an",
+         "-vf", f"fps={VIDEO_FPS}",
+         "-c:v", "libx264", "-preset", "fast", "-crf", "18",
+         output_path],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def cut_audio(audio_path: str, output_path: str, start: float, end: float | None = None,
+              min_duration: float = 0.0):
+    """Slice [start, end) of the dubbed audio, padded with silence to min_duration."""
+    length = None if end is None else max(end - start, min_duration)
+    args = ["-ss", f"{start:.6f}"] + (["-t", f"{length:.6f}"] if length is not None else [])
+    pad = ["-af", f"apad=whole_dur={min_duration:.6f}"] if min_duration > 0 else []
+    subprocess.run(
+        ["ffmpeg", "-y", "-i", audio_path, *args, *pad, "-acodec", "pcm_s16le", output_path],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def normalize_window(input_path: str, output_path: str, frames: int = None) -> int:
+    """Re-encode one engine's window output to the shared stitchable format.
+
+    With frames set, the last frame is cloned or extra frames dropped so the
+    window is exactly that long. Returns the window's frame count.
+    """
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    video_filter = f"fps={VIDEO_FPS},format=yuv420p"
+    exact = []
+    if frames is not None:
+        video_filter += ",tpad=stop_mode=clone:stop=-1"
+        exact = ["-frames:v", str(frames)]
+    subprocess.run(
+        ["ffmpeg", "-y", "-i", input_path, "-an",
+         "-vf", video_filter, *exact,
+         "-c:v", "libx264", "-preset", "fast", "-crf", "18",
+         "-video_track_timescale", str(VIDEO_TIMESCALE),
+         output_path],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return count_frames(output_path)
+
+
+def sync_window(run_engine, job_id: str, index: int, start: float, end: float | None = None,
+                source_job_id: str = None) -> dict:
+    """Body of every engine's sync_window Modal function.
+
+    run_engine(video_path, audio_path, start, duration) lip-syncs the
+    [start, start + duration) slice of the video (the preprocessed
+    mezzanine where there is one) and returns its output path. The
+    window's audio is read from windows/audio_{index}.wav and the
+    normalized result written to windows/video_{index}.mp4; the caller
+    reloads and commits the pipeline volume around this.
+    """
+    window_dir = f"/pipeline/{job_id}/windows"
+    source_video_path = source_video(f"/pipeline/{source_job_id or job_id}")
+    audio_path = f"{window_dir}/audio_{index:04d}.wav"
+    output_path = f"{window_dir}/video_{index:04d}.mp4"
+
+    duration = None if end is None else end - start
+    expected = None if end is None else frames_between(start, end)
+    print(f"Window {index}: {start:.2f}s-{'end' if end is None else f'{end:.2f}s'}")
+    raw_output = run_engine(source_video_path, audio_path, start, duration)
+    frames = normalize_window(raw_output, output_path, frames=expected)
+    print(f"Window {index} complete ({frames} frames).")
+    return {"index": index, "path": output_path, "frames": frames, "start": start, "end": end}
+
+
+def passthrough_window(job_id: str, index: int, start: float, end: float | None = None,
+                       source_job_id: str = None) -> dict:
+    """sync_window for a window without speech: its source frames, unchanged, on CPU."""
+    def run_engine(video_path: str, audio_path: str, start: float, duration: float | None) -> str:
+        output_path = f"{tempfile.mkdtemp()}/passthrough.mp4"
+        cut_window(video_path, output_path, start, None if duration is None else start + duration)
+        return output_path
+
+    return sync_window(run_engine, job_id, index, start, end, source_job_id)
+
+
+def stitch(window_paths: list[str], audio_path: str, output_path: str):
+    """Join window videos without re-encoding and mux the full dubbed audio over them."""
+    fd, list_file = tempfile.mkstemp(suffix=".txt")
+    with os.fdopen(fd, "w") as f:
+        for p in window_paths:
+            f.write(f"file '{p}'\n")
+    try:
+        subprocess.run(
+            ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", list_file, "-i", audio_path,
+             "-map", "0:v:0", "-map", "1:a:0",
+             "-c:v", "copy", "-c:a", "aac", "-b:a", "192k",
+             "-movflags", "+faststart",
+             output_path],
+            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+    finally:
+        os.remove(list_file)
@@ -1,7 +1,12 @@
 import modal
 import os
 import json
+import math
 import subprocess
+import tempfile
+import threading
+import time
+import uuid
 
 # 1. Define the Modal App
 app = modal.App("redub-orchestrator")
@@ -9,123 +14,1240 @@ app = modal.App("redub-orchestrator")
 # 2. Persistent volumes shared across all pipeline apps
 pipeline_vol = modal.Volume.from_name("redub-pipeline", create_if_missing=True)
 
+# Shared with the backend: "cancel:{job_id}" flags set by POST /api/dub/{id}/cancel
+# and "calls:{job_id}" lists of the child FunctionCall ids spawned for a job.
+# "active:{work_id}:{run}" flags mark /pipeline/ directories in use for the volume GC.
+job_control = modal.Dict.from_name("redub-job-control", create_if_missing=True)
+
 # 3. Define the Environment
 orchestrator_image = (
     modal.Image.debian_slim(python_version="3.11")
     .apt_install("ffmpeg")
-    .pip_install("boto3", "requests")
+    .pip_install("boto3", "requests", "numpy", "webrtcvad-wheels")
+    .add_local_python_source("timeline", "lipsync_windows", "job_manifest", "ranged_download", "preprocess", "r2_upload", "telemetry", "dag", "warmup", "speech_map")
 )
 
-# 4. The Main Pipeline Function
-@app.function(
-    image=orchestrator_image,
-    secrets=[
-        modal.Secret.from_name("redub-r2-secret"),       # R2 credentials
-        modal.Secret.from_name("backend-webhook-secret")  # Webhook API key
-    ],
-    timeout=1800,  # 30 minutes to account for the entire pipeline
-    volumes={"/pipeline": pipeline_vol}
-)
-def process_video(
-    job_id: str,
-    video_url: str,
-    target_language: str,
-    voice_preset_id: str = None,
-    checkpoint_volume_path: str = None,
-):
-    import boto3
-    import requests
+# ── Helpers ───────────────────────────────────────────────────────
 
-    print(f"--- Starting Pipeline for Job: {job_id} ---")
+# 1=Preparing, 2=Transcribing, 3=Translating, 4=Cloning Voice, 5=Lip Syncing
+STEP_PREPARING, STEP_TRANSCRIBING, STEP_TRANSLATING, STEP_CLONING, STEP_LIP_SYNC = range(1, 6)
+
+
+class JobCancelled(Exception):
+    """Raised between stages once the backend has flagged the job as cancelled."""
+
+
+def _is_cancelled(job_id: str) -> bool:
+    try:
+        return bool(job_control.get(f"cancel:{job_id}", False))
+    except Exception as e:
+        print(f"[warn] Could not read cancel flag for {job_id}: {e}")
+        return False
+
+
+def _check_cancelled(job_id: str):
+    if _is_cancelled(job_id):
+        raise JobCancelled(job_id)
+
+
+_register_lock = threading.Lock()  # Streaming runs spawn stages from several threads
+_spawned_at = {}  # FunctionCall id -> spawn time, to measure queue time in stage metrics
 
-    webhook_url = os.environ["WEBHOOK_URL"]
-    webhook_headers = {"Authorization": f"Bearer {os.environ['WEBHOOK_SECRET']}"}
 
-    def notify_step(step: int):
-        """Tell the backend which pipeline step is now active. Fire-and-forget."""
+def _register_call(job_id: str, call_id: str):
+    """Record a child FunctionCall so the backend can cancel it with the job."""
+    key = f"calls:{job_id}"
+    _spawned_at[call_id] = time.time()
+    try:
+        with _register_lock:
+            job_control[key] = [*job_control.get(key, []), call_id]
+    except Exception as e:
+        print(f"[warn] Could not register call {call_id} for {job_id}: {e}")
+
+
+def _cancel_calls(job_id: str):
+    """Cancel every child FunctionCall registered for a job, as the backend's cancel does."""
+    try:
+        call_ids = list(job_control.get(f"calls:{job_id}", []))
+    except Exception as e:
+        print(f"[warn] Could not read calls for {job_id}: {e}")
+        return
+    for call_id in call_ids:
         try:
-            step_url = webhook_url.replace("/job-complete", "/job-step")
-            requests.post(step_url, json={"job_id": job_id, "step": step}, headers=webhook_headers, timeout=5)
+            modal.FunctionCall.from_id(call_id).cancel()
         except Exception as e:
-            print(f"[warn] Step webhook failed (step={step}): {e}")
+            print(f"[warn] Could not cancel call {call_id} for {job_id}: {e}")
 
-    # Step 1: Preparing — download video + extract speaker reference
-    notify_step(1)
-    print("1. Preparing — downloading source video and extracting voice sample...")
-    job_dir = f"/pipeline/{job_id}"
+
+def _mark_running(*work_ids: str) -> list[str]:
+    """Flag /pipeline/ directories as in use so the volume GC skips them. Returns the flag keys."""
+    run = uuid.uuid4().hex[:8]
+    keys = [f"active:{work_id}:{run}" for work_id in dict.fromkeys(work_ids)]
+    for key in keys:
+        try:
+            job_control[key] = time.time()
+        except Exception as e:
+            print(f"[warn] Could not set {key}: {e}")
+    return keys
+
+
+def _clear_running(keys: list[str]):
+    for key in keys:
+        try:
+            job_control.pop(key)
+        except Exception as e:
+            print(f"[warn] Could not clear {key}: {e}")
+
+
+def _run_stage(job_id: str, func, *args, **kwargs):
+    """Check the cancel flag, then run a child Modal function as a cancellable call."""
+    _check_cancelled(job_id)
+    call = func.spawn(*args, **kwargs)
+    _register_call(job_id, call.object_id)
+    result = _wait_call(call)
+    _check_cancelled(job_id)
+    return result
+
+
+def _wait_call(call):
+    """call.get(), bounded by the timeout of the DAG node waiting on it; a call that outlives it is cancelled."""
+    import dag
+
+    try:
+        return call.get(timeout=dag.remaining())
+    except modal.exception.TimeoutError:
+        call.cancel()
+        raise dag.NodeTimeout(f"Call {call.object_id} outlived its node's timeout")
+
+
+def _step_tracker(job_ids: list[str], on_step=None):
+    """advance(step, metrics=None) reports step to the backend the first time any node reaches it.
+
+    Overlapping nodes can reach steps out of order; the backend only sees
+    them increase. on_step(step) is called for each step reported, e.g. to
+    warm the stages after it.
+    """
+    lock = threading.Lock()
+    current = [0]
+
+    def advance(step: int, metrics: dict = None):
+        with lock:
+            if step <= current[0]:
+                return
+            current[0] = step
+        for job_id in job_ids:
+            _notify_step(job_id, step, metrics)
+        if on_step is not None:
+            on_step(step)
+    return advance
+
+
+def _webhook_headers() -> dict:
+    return {"Authorization": f"Bearer {os.environ['WEBHOOK_SECRET']}"}
+
+
+def _notify_step(job_id: str, step: int, metrics: dict = None):
+    """Tell the backend which pipeline step is now active. Fire-and-forget.
+
+    metrics are measurements from the step that just ended, e.g. download throughput.
+    """
+    import requests
+
+    payload = {"job_id": job_id, "step": step}
+    if metrics:
+        payload["metrics"] = metrics
+    try:
+        step_url = os.environ["WEBHOOK_URL"].replace("/job-complete", "/job-step")
+        requests.post(step_url, json=payload, headers=_webhook_headers(), timeout=5)
+    except Exception as e:
+        print(f"[warn] Step webhook failed (job={job_id}, step={step}): {e}")
+
+
+def _notify_transcript(job_id: str, translated_segments: list):
+    """Hand the segment transcript + translation to the backend's search index. Fire-and-forget."""
+    import requests
+
+    try:
+        transcript_url = os.environ["WEBHOOK_URL"].replace("/job-complete", "/job-transcript")
+        requests.post(
+            transcript_url,
+            json={"job_id": job_id, "segments": translated_segments},
+            headers=_webhook_headers(),
+            timeout=15,
+        )
+    except Exception as e:
+        print(f"[warn] Transcript webhook failed (job={job_id}): {e}")
+
+
+def _notify_failed(job_id: str, error: str):
+    """Report a failed job to the backend. Fire-and-forget."""
+    import requests
+
+    try:
+        requests.post(
+            os.environ["WEBHOOK_URL"],
+            json={"job_id": job_id, "status": "FAILED", "error": error},
+            headers=_webhook_headers(),
+            timeout=5,
+        )
+    except Exception as e:
+        print(f"[warn] Failure webhook failed (job={job_id}): {e}")
+
+
+def _report_stage_metrics(job_id: str, *work_ids: str, warmer=None):
+    """Send the stage records kept under each work directory to the backend. Fire-and-forget.
+
+    Records of calls spawned from this container gain queue_sec (spawn to
+    start, container boot included) and wall_sec; the backend keeps values
+    already reported when a later report lacks them. Warm calls of a stage
+    the warmer warmed up gain warm_saved_sec, the cold start they avoided.
+    """
+    import requests
+    import telemetry
+
+    try:
+        pipeline_vol.reload()
+        stages = []
+        for work_id in dict.fromkeys(work_ids):
+            for record in telemetry.load(work_id):
+                spawned = _spawned_at.get(record.get("call_id"))
+                if spawned is not None:
+                    record["queue_sec"] = round(max(record["started_at"] - spawned, 0.0), 3)
+                    record["wall_sec"] = round(record["queue_sec"] + record["exec_sec"], 3)
+                saved = warmer.saved_sec(record["stage"], record["started_at"]) if warmer is not None else None
+                if saved is not None and not record.get("cold_start"):
+                    record["warm_saved_sec"] = round(saved, 3)
+                stages.append(record)
+        if not stages:
+            return
+        metrics_url = os.environ["WEBHOOK_URL"].replace("/job-complete", "/job-stage-metrics")
+        requests.post(
+            metrics_url,
+            json={"job_id": job_id, "stages": stages},
+            headers=_webhook_headers(),
+            timeout=15,
+        )
+    except Exception as e:
+        print(f"[warn] Stage metrics webhook failed (job={job_id}): {e}")
+
+
+def _download_metrics(timing: dict) -> dict:
+    return {"download_mb_per_sec": timing["mb_per_sec"], "download_sec": timing["seconds"]}
+
+
+def _checkpoint(work_id: str, stage: str, resume: bool) -> dict | None:
+    """The manifest entry for a stage a resumed run can skip, else None."""
+    import job_manifest
+
+    if not resume:
+        return None
+    entry = job_manifest.valid_stage(work_id, stage)
+    if entry is not None:
+        print(f"   [{work_id}] Reusing {stage} checkpoint from {entry['completed_at']}")
+    return entry
+
+
+def _record_stage(work_id: str, stage: str, artifacts: list[str] = (), data=None):
+    """Checkpoint a completed stage in the job's manifest and persist it on the volume."""
+    import job_manifest
+
+    job_manifest.record(work_id, stage, artifacts, data)
+    pipeline_vol.commit()
+
+
+def _record_windows(job_id: str, bounds: list, results: dict):
+    """Checkpoint a lip-sync window plan and the windows finished so far.
+
+    The entry is tied to the tts checkpoint it was cut from, so a retry
+    that re-renders the dubbed audio starts the windows over.
+    """
+    import job_manifest
+
+    pipeline_vol.reload()  # The windows were committed by their own containers
+    tts = job_manifest.load(job_id)["stages"]["tts"]
+    _record_stage(
+        job_id, "windows", [result["path"] for result in results.values()],
+        data={"tts": tts["completed_at"], "bounds": bounds, "results": list(results.values())},
+    )
+
+
+def _finished_windows(job_id: str, resume: bool) -> tuple[list, dict] | None:
+    """(bounds, {index: result}) of a checkpointed window plan for the current dubbed audio, else None."""
+    import job_manifest
+
+    checkpoint = _checkpoint(job_id, "windows", resume)
+    tts = job_manifest.load(job_id)["stages"].get("tts")
+    if checkpoint is None or tts is None or checkpoint["data"]["tts"] != tts["completed_at"]:
+        return None
+    bounds = [tuple(b) for b in checkpoint["data"]["bounds"]]
+    return bounds, {result["index"]: result for result in checkpoint["data"]["results"]}
+
+
+def _prepare_source(work_id: str, video_url: str, rec=None) -> dict:
+    """Download the source video and extract its audio artifacts into /pipeline/{work_id}/.
+
+    Besides source.mp4 this writes preprocess.run()'s audio artifacts (ASR
+    audio, voice track, speaker reference) from a single decode; the video
+    half is _encode_video's. Returns the download timing ({"bytes",
+    "seconds", "mb_per_sec", ...}); sizes go on the telemetry record rec
+    when given.
+    """
+    import shutil
+    import time
+    import preprocess
+    import ranged_download
+
+    job_dir = f"/pipeline/{work_id}"
     os.makedirs(job_dir, exist_ok=True)
     source_video_path = f"{job_dir}/source.mp4"
-    speaker_ref_path  = f"{job_dir}/speaker_ref.wav"
 
-    with requests.get(video_url, stream=True) as r:
-        r.raise_for_status()
-        with open(source_video_path, "wb") as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                f.write(chunk)
+    # Download and decode on local disk, then copy each file to the network
+    # volume in one sequential pass
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        local_path = f"{tmp_dir}/source.mp4"
+        timing = ranged_download.download(video_url, local_path)
+        print(f"   [{work_id}] Downloaded {timing['bytes'] / (1024 * 1024):.1f} MB in {timing['seconds']:.1f}s "
+              f"({timing['mb_per_sec']} MB/s, {timing['parts']} parts, checksum "
+              f"{'verified' if timing['verified'] else 'not available'})")
 
-    subprocess.run([
-        "ffmpeg", "-y", "-i", source_video_path,
-        "-t", "6", "-vn", "-acodec", "pcm_s16le", "-ar", "22050", "-ac", "1",
-        speaker_ref_path
-    ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-    pipeline_vol.commit()  # Makes source.mp4 + speaker_ref.wav visible to downstream containers
-
-    # Step 2: Transcription
-    notify_step(2)
-    print("2. Transcribing audio with Whisper...")
-    whisper_func = modal.Function.from_name("redub-whisper", "transcribe_video")
-    transcription_data = whisper_func.remote(job_id)
-
-    # Step 3: Translation
-    notify_step(3)
-    print("3. Translating text with Llama 3.3-70B...")
-    translate_func = modal.Function.from_name("redub-translate", "translate_text")
-    translated_segments = translate_func.remote(
-        segments=transcription_data["segments"],
-        target_language=target_language,
-        glossary={"Redub": "Redub"}
-    )
+        started = time.monotonic()
+        out_dir = f"{tmp_dir}/derived"
+        os.makedirs(out_dir)
+        derived = preprocess.run(local_path, out_dir, video=False)
+        print(f"   [{work_id}] Extracted audio in {time.monotonic() - started:.1f}s")
+
+        artifacts = [source_video_path]
+        shutil.copyfile(local_path, source_video_path)
+        for path in derived:
+            artifacts.append(f"{job_dir}/{os.path.basename(path)}")
+            shutil.copyfile(path, artifacts[-1])
+
+    if rec is not None:
+        rec.record(output_bytes=sum(os.path.getsize(path) for path in artifacts))
+    # Also makes the source and its derived files visible to downstream containers
+    _record_stage(work_id, "prepare", artifacts, data={"download": timing})
+    return timing
+
+
+def _encode_video(work_id: str, rec=None):
+    """Encode the lip-sync mezzanine and scene index from /pipeline/{work_id}/source.mp4.
+
+    A DAG node of its own, so the encode overlaps transcription, translation
+    and TTS; only lip-sync needs it. Sizes go on the telemetry record rec
+    when given.
+    """
+    import shutil
+    import time
+    import preprocess
+
+    job_dir = f"/pipeline/{work_id}"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        local_path = f"{tmp_dir}/source.mp4"
+        shutil.copyfile(f"{job_dir}/source.mp4", local_path)
+
+        started = time.monotonic()
+        out_dir = f"{tmp_dir}/derived"
+        os.makedirs(out_dir)
+        derived = preprocess.run(local_path, out_dir, audio=False)
+        print(f"   [{work_id}] Encoded mezzanine in {time.monotonic() - started:.1f}s")
+
+        artifacts = []
+        for path in derived:
+            artifacts.append(f"{job_dir}/{os.path.basename(path)}")
+            shutil.copyfile(path, artifacts[-1])
+
+    if rec is not None:
+        rec.record(
+            video_sec=preprocess.scene_index(job_dir)["duration"],
+            output_bytes=sum(os.path.getsize(path) for path in artifacts),
+        )
+    _record_stage(work_id, "mezzanine", artifacts)
+
+
+def _map_speech(work_id: str, rec=None) -> dict:
+    """Write the speech map of /pipeline/{work_id}/ and recut speaker_ref.wav from its densest speech.
+
+    A CPU stage between prepare and the GPU stages: Whisper, XTTS's
+    reference and lip-sync all read the same map. Duration goes on the
+    telemetry record rec when given.
+    """
+    import preprocess
+    import speech_map
+
+    job_dir = f"/pipeline/{work_id}"
+    speech = speech_map.build(job_dir, preprocess.SPEAKER_REF_SEC)
+    reference = speech.get("speaker_ref")
+    print(f"   [{work_id}] {speech['speech_sec']:.1f}s of speech in {speech['duration']:.1f}s "
+          f"({len(speech['intervals'])} intervals); speaker reference "
+          f"{f'at {reference[0]:.1f}s' if reference else 'unchanged'}")
+
+    if rec is not None:
+        rec.record(video_sec=speech["duration"])
+    summary = {"duration": speech["duration"], "speech_sec": speech["speech_sec"]}
+    _record_stage(work_id, "speech", [f"{job_dir}/{speech_map.SPEECH_MAP}"], data=summary)
+    return summary
+
+
+def _speech(work_id: str) -> dict | None:
+    """The speech map of /pipeline/{work_id}/, None for jobs prepared before it existed."""
+    import speech_map
+
+    return speech_map.load(f"/pipeline/{work_id}")
+
+
+def _scene_cuts(work_id: str) -> list[float]:
+    """Scene cuts from the preprocessing index, detected afresh for older jobs."""
+    import lipsync_windows
+    import preprocess
+
+    index = preprocess.scene_index(f"/pipeline/{work_id}")
+    if index is not None:
+        return index["scene_cuts"]
+    return lipsync_windows.detect_scene_cuts(f"/pipeline/{work_id}/source.mp4")
+
+
+# Lip-sync runs on time windows spread over this many seconds each, one GPU
+# container per window. REDUB_LIPSYNC_ENGINE picks the Modal app doing it.
+LIPSYNC_APPS = {
+    "musetalk": "redub-musetalk",
+    "latentsync": "redub-latentsync",
+    "wav2lip": "redub-wav2lip",
+}
+LIPSYNC_ENGINE = os.getenv("REDUB_LIPSYNC_ENGINE", "musetalk")
+LIPSYNC_WINDOW_SEC = 60.0
+
+# Transcripts longer than this many segments render their TTS clips in shards
+XTTS_SHARD_MIN_SEGMENTS = 40
+
+
+def _whisper():
+    """The Whisper service; its containers keep the model loaded between calls."""
+    return modal.Cls.from_name("redub-whisper", "Whisper")()
+
+
+def _xtts():
+    """The XTTS service; its containers keep the model loaded between calls."""
+    return modal.Cls.from_name("redub-xtts", "XTTS")()
+
+
+def _lipsync_function():
+    return modal.Function.from_name(LIPSYNC_APPS[LIPSYNC_ENGINE], "sync_window")
+
+
+def _lipsync_windowed(job_id: str, source_job_id: str, master_path: str, rec=None, resume: bool = False):
+    """Lip-sync dubbed_audio.wav onto the source video window by window, in parallel.
+
+    Windows are cut at scene changes or pauses in the dubbed audio near
+    every LIPSYNC_WINDOW_SEC, each is synced on its own container, and the
+    results are stitched with a stream copy under the full dubbed audio.
+    With a speech map, windows are also split around long stretches without
+    speech, which pass through on CPU instead of a lip-sync GPU. Sizes go on
+    the telemetry record rec when given.
+
+    Finished windows are checkpointed as they return; with resume, a window
+    plan checkpointed for the same dubbed audio (by either path) is reused
+    and only its missing windows run.
+    """
+    import lipsync_windows
+    import speech_map
+
+    job_dir = f"/pipeline/{job_id}"
+    window_dir = f"{job_dir}/windows"
+    source_video_path = lipsync_windows.source_video(f"/pipeline/{source_job_id}")
+    dubbed_audio_path = f"{job_dir}/dubbed_audio.wav"
+
+    pipeline_vol.reload()  # dubbed_audio.wav was committed by the XTTS container
+    os.makedirs(window_dir, exist_ok=True)
+    video_duration = lipsync_windows.media_duration(source_video_path)
+    speech = _speech(source_job_id)
+    finished = _finished_windows(job_id, resume)
+    if finished is not None:
+        bounds, done = finished
+        windows = [
+            (start, end, speech is None or speech_map.speech_in(speech["intervals"], start, end) > 0)
+            for start, end in bounds
+        ]
+        print(f"   [{job_id}] Reusing {len(done)} of {len(bounds)} lip-sync windows")
+    else:
+        bounds = lipsync_windows.aligned_windows(
+            video_duration, LIPSYNC_WINDOW_SEC,
+            scene_cuts=_scene_cuts(source_job_id),
+            silences=lipsync_windows.detect_silences(dubbed_audio_path),
+        )
+        if speech is not None:
+            windows = speech_map.split_silent(bounds, speech["intervals"], video_duration)
+        else:
+            windows = [(start, end, True) for start, end in bounds]
+        bounds = [(start, end) for start, end, _ in windows]
+        done = {}
+    _record_windows(job_id, bounds, done)
+    for index, (start, end, has_speech) in enumerate(windows):
+        if not has_speech or index in done:
+            continue
+        lipsync_windows.cut_audio(
+            dubbed_audio_path, f"{window_dir}/audio_{index:04d}.wav", start, end,
+            min_duration=(video_duration if end is None else end) - start,
+        )
+    pipeline_vol.commit()
+
+    # Spawn every window before waiting on any, registering each call so a
+    # cancel stops the whole fan-out
+    _check_cancelled(job_id)
+    pending = [(index, *window) for index, window in enumerate(windows) if index not in done]
+    skipped = sum(1 for *_, has_speech in pending if not has_speech)
+    print(f"   [{job_id}] Lip-syncing {len(pending) - skipped} windows with {LIPSYNC_ENGINE}, "
+          f"passing {skipped} without speech through...")
+    lipsync_func = _lipsync_function()
+    calls = []
+    for index, start, end, has_speech in pending:
+        call = (lipsync_func if has_speech else passthrough_window).spawn(
+            job_id=job_id, index=index, start=start, end=end, source_job_id=source_job_id,
+        )
+        _register_call(job_id, call.object_id)
+        calls.append((index, call))
+    for position, (index, call) in enumerate(calls):
+        try:
+            done[index] = _wait_call(call)
+        except BaseException:
+            # Don't leave the other windows running on their GPUs
+            for _, other in calls[position + 1:]:
+                try:
+                    other.cancel()
+                except Exception as e:
+                    print(f"[warn] [{job_id}] Could not cancel call {other.object_id}: {e}")
+            raise
+        _record_windows(job_id, bounds, done)
+    _check_cancelled(job_id)
+    results = [done[index] for index in range(len(windows))]
+
+    for result, (start, end) in zip(results, bounds):
+        if end is not None and result["frames"] != lipsync_windows.frames_between(start, end):
+            print(f"[warn] [{job_id}] Window {result['index']} has {result['frames']} frames, "
+                  f"expected {lipsync_windows.frames_between(start, end)}")
+
+    pipeline_vol.reload()
+    lipsync_windows.stitch([r["path"] for r in results], dubbed_audio_path, master_path)
+    if rec is not None:
+        rec.record(video_sec=video_duration, output_bytes=os.path.getsize(master_path))
+
+
+# ── Warm-up ───────────────────────────────────────────────────────
+#
+# GPU stages cold-start on first use: image pull, boot and weight load. A
+# warmup.Warmer raises the min_containers of each stage's Modal function
+# ahead of time, timed from the backend's stage history, and drops the
+# demand once the job has moved past the stage.
+
+# Stage each reported step starts, in the order a job reaches them
+STEP_STAGES = {
+    STEP_PREPARING: "prepare",
+    STEP_TRANSCRIBING: "transcribe",
+    STEP_TRANSLATING: "translate",
+    STEP_CLONING: "tts",
+    STEP_LIP_SYNC: "lipsync",
+}
+TYPICAL_SEGMENT_SEC = 4.0  # Guesses the TTS shard count before the transcript exists
+
+
+def _stage_estimates() -> dict:
+    """Historical per-stage durations and cold starts from the backend; {} when unavailable."""
+    import requests
+
+    try:
+        estimates_url = os.environ["WEBHOOK_URL"].replace("/job-complete", "/stage-estimates")
+        response = requests.get(estimates_url, headers=_webhook_headers(), timeout=5)
+        response.raise_for_status()
+        return response.json()["stages"]
+    except Exception as e:
+        print(f"[warn] Could not fetch stage estimates: {e}")
+        return {}
+
+
+def _warmer(job_id: str, source_job_id: str, stages: list[str] = None, streaming: bool = False):
+    """A warmup.Warmer for one job's GPU stages and the on_step callback that drives it.
+
+    stages defaults to every stage from prepare to lip-sync. Streaming runs
+    overlap TTS and lip-sync with transcription, so both are warmed as soon
+    as transcription starts.
+    """
+    import job_manifest
+    import lipsync_windows
+    import warmup
+
+    def segment_count() -> int:
+        try:
+            return len(job_manifest.load(source_job_id)["stages"]["transcribe"]["data"]["segments"])
+        except Exception:
+            return math.ceil((warmer.video_sec or 0.0) / TYPICAL_SEGMENT_SEC)
+
+    def windows(window_sec: float) -> int:
+        return max(1, math.ceil((warmer.video_sec or 0.0) / window_sec))
+
+    def target(stage: str) -> dict | None:
+        if stage == "transcribe":
+            return {"target": "redub-whisper/Whisper", "containers": 1, "cold_stage": "transcribe"}
+        if stage == "tts" and streaming:
+            # One render_clips call per transcript window
+            return {"target": "redub-xtts/XTTS", "containers": windows(STREAM_LIPSYNC_WINDOW_SEC),
+                    "cold_stage": "tts_clips"}
+        if stage == "tts":
+            segments = segment_count()
+            if segments > XTTS_SHARD_MIN_SEGMENTS:
+                return {"target": "redub-xtts/XTTS", "containers": math.ceil(segments / XTTS_SHARD_MIN_SEGMENTS),
+                        "cold_stage": "tts_clips"}
+            return {"target": "redub-xtts/XTTS", "containers": 1, "cold_stage": "tts"}
+        if stage == "lipsync":
+            window_sec = STREAM_LIPSYNC_WINDOW_SEC if streaming else LIPSYNC_WINDOW_SEC
+            return {"target": f"{LIPSYNC_APPS[LIPSYNC_ENGINE]}/sync_window", "containers": windows(window_sec),
+                    "cold_stage": "lipsync_window"}
+        return None
+
+    def on_step(step: int):
+        # Warming is best effort; it must never fail the job
+        try:
+            if warmer.video_sec is None and step > STEP_PREPARING:
+                warmer.video_sec = lipsync_windows.media_duration(
+                    lipsync_windows.source_video(f"/pipeline/{source_job_id}")
+                )
+            warmer.reached(STEP_STAGES[step])
+            if streaming and step == STEP_TRANSCRIBING:
+                warmer.warm_now("tts", "lipsync")
+        except Exception as e:
+            print(f"[warn] [{job_id}] Warm-up failed at step {step}: {e}")
+
+    if stages is None:
+        stages = ["prepare", "transcribe"] if streaming else list(STEP_STAGES.values())
+    warmer = warmup.Warmer(job_id, stages, target)
+
+    # Stage history only sharpens the timing; fetch it without holding up the job
+    def load_estimates():
+        warmer.estimates = _stage_estimates()
+
+    threading.Thread(target=load_estimates, daemon=True).start()
+    return warmer, on_step
+
+
+# ── Pipeline DAG ──────────────────────────────────────────────────
+#
+# The stages are dag.Nodes; values flowing between them:
+#   download       prepare's download timing (None when restored)
+#   prepared       source.mp4 and its audio artifacts are on the volume
+#   speech         speech.json is on the volume and speaker_ref.wav holds
+#                  its densest speech (False for jobs from before the map)
+#   video          mezzanine.mp4 and scenes.json are on the volume
+#   transcription  Whisper's transcript
+#   translated     translated segments
+#   dubbed_audio   path of dubbed_audio.wav
+#   master         path of the lip-synced master
+#   output_key     R2 key of the published master
+# Nodes mostly wait on Modal calls, so the limits cap concurrent calls per class.
+DAG_LIMITS = {"gpu": 4, "cpu": 4, "io": 2}
+
+# Modal function budgets. Every graph runs against the deadline of the function
+# running it, so node timeouts are caps within it rather than budgets of their own.
+PIPELINE_TIMEOUT_SEC = 3 * 3600  # One language: process_video, resume_video, dub_language
+GROUP_TIMEOUT_SEC = 2 * PIPELINE_TIMEOUT_SEC  # process_video_group: shared stages, then waiting on the children
+PREPARE_TIMEOUT_SEC = 1800       # prepare_source: multi-GB ranged downloads plus the audio pass
+DEADLINE_MARGIN_SEC = 60         # Left to report a failure before Modal stops the function
+
+
+def _deadline(budget_sec: float) -> float:
+    """The time.monotonic() deadline for a graph run by a function with this timeout, started now."""
+    return time.monotonic() + budget_sec - DEADLINE_MARGIN_SEC
+
+
+def _source_nodes(control_id: str, work_id: str, video_url: str, resume: bool, advance) -> list:
+    """Download/prep, speech map, mezzanine encode and transcription of the source in /pipeline/{work_id}/.
+
+    control_id is the job (or group) whose cancel flag and call list the
+    stages use. The mezzanine encode runs beside transcription and
+    everything after it.
+    """
+    import dag
+
+    def prepare():
+        advance(STEP_PREPARING)
+        print("1. Preparing — downloading source video and extracting voice sample...")
+        timing = _run_stage(control_id, prepare_source, work_id, video_url)
+        pipeline_vol.reload()  # Pick up the prepared files and their checkpoint
+        return {"download": timing, "prepared": True}
+
+    def encode(prepared):
+        _run_stage(control_id, encode_video, work_id)
+        pipeline_vol.reload()
+        return {"video": True}
+
+    def speech(prepared):
+        _run_stage(control_id, map_speech, work_id)
+        pipeline_vol.reload()
+        return {"speech": True}
+
+    def transcribe(prepared, download, speech):
+        advance(STEP_TRANSCRIBING, _download_metrics(download) if download else None)
+        print("2. Transcribing audio with Whisper...")
+        whisper_func = _whisper().transcribe_video
+        transcription_data = _run_stage(control_id, whisper_func, work_id)
+        _record_stage(work_id, "transcribe", data=transcription_data)
+        return {"transcription": transcription_data}
+
+    def restore_video(prepared):
+        # Jobs prepared before the encode was split off got the mezzanine from prepare
+        import preprocess
+
+        legacy = resume and all(
+            preprocess.artifact(f"/pipeline/{work_id}", name) for name in preprocess.VIDEO_ARTIFACTS
+        )
+        return {"video": True} if legacy or _checkpoint(work_id, "mezzanine", resume) else None
+
+    def restore_speech(prepared):
+        if _checkpoint(work_id, "speech", resume):
+            return {"speech": True}
+        # Jobs transcribed before the speech map existed carry on without one
+        return {"speech": False} if _checkpoint(work_id, "transcribe", resume) else None
+
+    def restore_transcription(prepared, download, speech):
+        checkpoint = _checkpoint(work_id, "transcribe", resume)
+        return {"transcription": checkpoint["data"]} if checkpoint else None
+
+    return [
+        dag.Node("prepare", prepare, outputs=("download", "prepared"), resource="io", retries=1,
+                 timeout=PREPARE_TIMEOUT_SEC, cancellable=True,
+                 restore=lambda: {"download": None, "prepared": True} if _checkpoint(work_id, "prepare", resume) else None),
+        dag.Node("mezzanine", encode, inputs=("prepared",), outputs=("video",), resource="cpu", retries=1, timeout=900,
+                 cancellable=True, restore=restore_video),
+        dag.Node("speech", speech, inputs=("prepared",), outputs=("speech",), resource="cpu", retries=1, timeout=600,
+                 cancellable=True, restore=restore_speech),
+        dag.Node("transcribe", transcribe, inputs=("prepared", "download", "speech"), outputs=("transcription",),
+                 resource="gpu", retries=1, timeout=900, cancellable=True, restore=restore_transcription),
+    ]
+
+
+def _language_nodes(
+    job_id: str,
+    source_job_id: str,
+    target_language: str,
+    advance,
+    voice_preset_id: str = None,
+    checkpoint_volume_path: str = None,
+    resume: bool = False,
+) -> list:
+    """Translate, clone voice, lip-sync and publish one language.
+
+    source_job_id names the /pipeline/ directory holding source.mp4 and
+    speaker_ref.wav; it equals job_id for single-language runs and the
+    group_id for fan-out children. With resume, nodes restore from the
+    job's manifest up to the first one that has to rerun.
+    """
+    import dag
+    import telemetry
+
+    job_dir = f"/pipeline/{job_id}"
+    master_path = f"{job_dir}/dubbed_output.mp4"
+    dubbed_audio_path = f"{job_dir}/dubbed_audio.wav"
 
-    # Step 4: Voice Cloning (XTTS) — per-segment with duration matching
-    notify_step(4)
+    def restored(stage: str, value):
+        checkpoint = _checkpoint(job_id, stage, resume)
+        return None if checkpoint is None else value(checkpoint)
+
+    def translate(transcription):
+        advance(STEP_TRANSLATING)
+        print(f"3. [{job_id}] Translating text with Llama 3.3-70B...")
+        translate_func = modal.Function.from_name("redub-translate", "translate_text")
+        translated_segments = _run_stage(
+            job_id, translate_func,
+            segments=transcription["segments"],
+            target_language=target_language,
+            glossary=GLOSSARY,
+            job_id=job_id,
+        )
+        _record_stage(job_id, "translate", data=translated_segments)
+        _notify_transcript(job_id, translated_segments)
+        return {"translated": translated_segments}
+
+    def tts(translated, prepared, speech):
+        advance(STEP_CLONING)
+        _generate_audio(job_id, source_job_id, translated, target_language, voice_preset_id, checkpoint_volume_path)
+        return {"dubbed_audio": dubbed_audio_path}
+
+    def lipsync(dubbed_audio, video):
+        advance(STEP_LIP_SYNC)
+        print(f"5. [{job_id}] Syncing lip movements with {LIPSYNC_ENGINE}...")
+        with telemetry.stage(job_id, "lipsync", pipeline_vol) as rec:
+            _lipsync_windowed(job_id, source_job_id, master_path, rec, resume)
+        _record_stage(job_id, "lipsync", [master_path])
+        return {"master": master_path}
+
+    def publish(master):
+        output_key = _publish_output(job_id, master)
+        _record_stage(job_id, "publish", data=output_key)
+        return {"output_key": output_key}
+
+    return [
+        dag.Node("translate", translate, inputs=("transcription",), outputs=("translated",),
+                 resource="cpu", retries=2, timeout=600, cancellable=True,
+                 restore=lambda transcription: restored("translate", lambda c: {"translated": c["data"]})),
+        dag.Node("tts", tts, inputs=("translated", "prepared", "speech"), outputs=("dubbed_audio",),
+                 resource="gpu", retries=1, timeout=1200, cancellable=True,
+                 restore=lambda translated, prepared, speech: restored(
+                     "tts", lambda c: {"dubbed_audio": dubbed_audio_path})),
+        dag.Node("lipsync", lipsync, inputs=("dubbed_audio", "video"), outputs=("master",),
+                 resource="gpu", timeout=1500,
+                 restore=lambda dubbed_audio, video: restored("lipsync", lambda c: {"master": master_path})),
+        dag.Node("publish", publish, inputs=("master",), outputs=("output_key",),
+                 resource="io", retries=2, timeout=600,
+                 restore=lambda master: restored("publish", lambda c: {"output_key": c["data"]})),
+    ]
+
+
+def _run_graph(nodes: list, values: dict = None, should_stop=None, deadline: float = None) -> dict:
+    import dag
+
+    return dag.run(dag.Graph(nodes), values, dag.ThreadExecutor(DAG_LIMITS), should_stop, deadline)
+
+
+def _dub_language(
+    job_id: str,
+    source_job_id: str,
+    transcription_data: dict,
+    target_language: str,
+    voice_preset_id: str = None,
+    checkpoint_volume_path: str = None,
+) -> str:
+    """Translate, clone voice, lip-sync and upload one language of a prepared group. Returns the R2 output key."""
+    deadline = _deadline(PIPELINE_TIMEOUT_SEC)  # Called as dub_language starts
+    warmer, on_step = _warmer(job_id, source_job_id)
+    try:
+        nodes = _language_nodes(
+            job_id, source_job_id, target_language, _step_tracker([job_id], on_step),
+            voice_preset_id, checkpoint_volume_path,
+        )
+        values = _run_graph(
+            nodes, {"transcription": transcription_data, "prepared": True, "speech": True, "video": True},
+            should_stop=lambda: _check_cancelled(job_id), deadline=deadline,
+        )
+    finally:
+        warmer.close()
+        _report_stage_metrics(job_id, job_id, warmer=warmer)
+    return values["output_key"]
+
+
+def _generate_audio(
+    job_id: str,
+    source_job_id: str,
+    translated_segments: list,
+    target_language: str,
+    voice_preset_id: str = None,
+    checkpoint_volume_path: str = None,
+):
+    """Render /pipeline/{job_id}/dubbed_audio.wav with XTTS and checkpoint it."""
     preset_label = f" (preset={voice_preset_id})" if voice_preset_id else ""
-    print(f"4. Cloning voice and generating per-segment dubbed audio with XTTS v2{preset_label}...")
+    print(f"4. [{job_id}] Cloning voice and generating per-segment dubbed audio with XTTS v2{preset_label}...")
 
-    xtts_func = modal.Function.from_name("redub-xtts", "generate_dubbed_audio")
-    xtts_result = xtts_func.remote(
+    # Long transcripts are synthesized in shards across several GPU containers
+    xtts_func = (
+        modal.Function.from_name("redub-xtts", "generate_dubbed_audio_sharded")
+        if len(translated_segments) > XTTS_SHARD_MIN_SEGMENTS else _xtts().generate_dubbed_audio
+    )
+    xtts_result = _run_stage(
+        job_id, xtts_func,
         job_id=job_id,
         segments=translated_segments,
         target_language=target_language,
         checkpoint_volume_path=checkpoint_volume_path,
+        source_job_id=source_job_id,
     )
     print(f"   XTTS result: {xtts_result}")
+    pipeline_vol.reload()  # dubbed_audio.wav was committed by the XTTS container
+    _record_stage(job_id, "tts", [f"/pipeline/{job_id}/dubbed_audio.wav"])
 
-    # Step 5: Visual Lip Sync (MuseTalk)
-    notify_step(5)
-    print("5. Syncing lip movements with MuseTalk...")
-    musetalk_func = modal.Function.from_name("redub-musetalk", "sync_lip_movements")
-    final_video_bytes = musetalk_func.remote(job_id)
-
-    # Upload to Cloudflare R2
-    print("6. Uploading to R2...")
-    s3_client = boto3.client(
-        's3',
-        endpoint_url=f"https://{os.environ['ACCOUNT_ID']}.r2.cloudflarestorage.com",
-        aws_access_key_id=os.environ["R2_ACCESS_KEY_ID"],
-        aws_secret_access_key=os.environ["R2_SECRET_ACCESS_KEY"],
-        region_name="auto",
-    )
 
-    bucket_name = os.environ["R2_BUCKET_NAME"]
+def _publish_output(job_id: str, master_path: str) -> str:
+    """Upload preview renditions and then the dubbed master to R2. Returns the output key."""
+    import r2_upload
+    import telemetry
+
+    # Upload to Cloudflare R2 (multipart, streamed from disk)
+    print(f"6. [{job_id}] Uploading to R2...")
+    s3_client = r2_upload.client()
     output_key = f"projects/{job_id}/dubbed_output.mp4"
 
-    s3_client.put_object(
-        Bucket=bucket_name,
-        Key=output_key,
-        Body=final_video_bytes,
-        ContentType='video/mp4',
+    with telemetry.stage(job_id, "publish", pipeline_vol) as rec:
+        # Renditions go up before the master: once dubbed_output.mp4 exists in R2
+        # the backend treats the job as complete and expects its previews to exist.
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            try:
+                for path, content_type in _make_renditions(master_path, tmp_dir).values():
+                    r2_upload.upload(
+                        path, f"projects/{job_id}/{os.path.basename(path)}", content_type, s3_client,
+                    )
+            except Exception as e:
+                # Previews are a nicety; the dub itself still succeeded
+                print(f"[warn] [{job_id}] Could not render previews: {e}")
+
+        uploaded = r2_upload.upload(master_path, output_key, "video/mp4", s3_client)
+        rec.record(output_bytes=uploaded["size"])
+    print(f"   [{job_id}] Uploaded {uploaded['size'] / (1024 * 1024):.1f} MB (sha256 {uploaded['sha256'][:12]}…)")
+    return output_key
+
+
+# Lightweight renditions for the dashboard so cards never stream the master file
+POSTER_WIDTH = 640
+THUMB_WIDTH = 320
+THUMB_FRAMES = 10
+PROXY_HEIGHT = 360
+
+
+def _make_renditions(video_path: str, out_dir: str) -> dict:
+    """Render poster.jpg, an animated thumbs.webp strip and a 360p proxy from the final video.
+
+    Returns {name: (path, content_type)}.
+    """
+    probe = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", video_path],
+        capture_output=True, text=True, check=True,
     )
+    duration = max(float(probe.stdout.strip() or 0), 0.1)
+
+    poster_path = f"{out_dir}/poster.jpg"
+    thumbs_path = f"{out_dir}/thumbs.webp"
+    proxy_path = f"{out_dir}/proxy_360p.mp4"
+    quiet = {"check": True, "stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL}
+
+    # Poster: a frame 10% in, past any fade-in
+    subprocess.run([
+        "ffmpeg", "-y", "-ss", f"{duration * 0.1:.3f}", "-i", video_path,
+        "-frames:v", "1", "-vf", f"scale={POSTER_WIDTH}:-2", "-q:v", "3", poster_path,
+    ], **quiet)
+
+    # Thumbnail strip: THUMB_FRAMES evenly spaced frames played back at 2 fps
+    subprocess.run([
+        "ffmpeg", "-y", "-i", video_path, "-an",
+        "-vf", f"fps={THUMB_FRAMES}/{duration:.3f},scale={THUMB_WIDTH}:-2,setpts=N/2/TB",
+        "-frames:v", str(THUMB_FRAMES), "-c:v", "libwebp", "-quality", "60", "-loop", "0",
+        thumbs_path,
+    ], **quiet)
+
+    # Proxy: low-bitrate 360p with the moov atom up front so playback starts immediately
+    subprocess.run([
+        "ffmpeg", "-y", "-i", video_path,
+        "-vf", f"scale=-2:{PROXY_HEIGHT}", "-c:v", "libx264", "-preset", "veryfast",
+        "-crf", "30", "-maxrate", "600k", "-bufsize", "1200k",
+        "-c:a", "aac", "-b:a", "64k", "-movflags", "+faststart", proxy_path,
+    ], **quiet)
+
+    return {
+        "poster": (poster_path, "image/jpeg"),
+        "thumbs": (thumbs_path, "image/webp"),
+        "proxy": (proxy_path, "video/mp4"),
+    }
+
+
+# Streaming mode: transcript windows flow straight into translation and TTS,
+# and lip-sync starts on any stretch of video whose dubbed audio is final.
+# Set REDUB_STREAMING=0 in the orchestrator's environment to run stages back to back.
+STREAMING = os.getenv("REDUB_STREAMING", "1") != "0"
+STREAM_LIPSYNC_WINDOW_SEC = 60.0
+STREAM_MAX_WORKERS = 32  # Threads waiting on in-flight window calls
+STREAM_POLL_SEC = 5.0    # Cancel-flag check interval while waiting on windows
+GLOSSARY = {"Redub": "Redub"}
+
+
+def _dub_streaming(
+    job_id: str,
+    target_language: str,
+    voice_preset_id: str = None,
+    checkpoint_volume_path: str = None,
+    video_ready: threading.Event = None,
+) -> str:
+    """Transcribe, translate, clone voice and lip-sync with the stages overlapped.
+
+    Whisper yields transcript windows; each is translated and rendered to
+    per-segment clips on its own containers as soon as it arrives. Once a
+    contiguous prefix of windows is rendered, the dubbed-audio timeline up
+    to its end is final (see timeline.plan), so every lip-sync window ending
+    inside it starts right away. Wall-clock time approaches the slowest
+    stage instead of the sum of all of them. Returns the R2 output key.
+
+    video_ready, when given, is set once the mezzanine encode has finished;
+    it runs beside all of this, and only lip-sync waits for it.
+
+    Worker threads wait on their calls under the DAG node's deadline. If
+    the run fails, every call spawned for the job is cancelled, so nothing
+    is left running on a GPU.
+    """
+    import queue
+    from concurrent.futures import ThreadPoolExecutor
+
+    import dag
+    import lipsync_windows
+    import speech_map
+    import timeline
+
+    job_dir = f"/pipeline/{job_id}"
+    window_dir = f"{job_dir}/windows"
+    os.makedirs(window_dir, exist_ok=True)
+    speech = _speech(job_id)
+
+    whisper_func = _whisper().transcribe_windows
+    translate_func = modal.Function.from_name("redub-translate", "translate_text")
+    render_func = _xtts().render_clips
+    lipsync_func = _lipsync_function()
+
+    video_duration = lipsync_windows.media_duration(lipsync_windows.source_video(job_dir))
+    boundary_tolerance = STREAM_LIPSYNC_WINDOW_SEC * lipsync_windows.BOUNDARY_TOLERANCE
+    events = queue.Queue()
+    deadline = dag.attempt_deadline()  # Pool threads don't inherit the node's
+    step_lock = threading.Lock()
+    current_step = [STEP_TRANSCRIBING]
+
+    def advance_step(step: int):
+        # Stages overlap, so report each one the first time any window reaches it
+        with step_lock:
+            if step <= current_step[0]:
+                return
+            current_step[0] = step
+        _notify_step(job_id, step)
+
+    def run(kind: str, fn, *args):
+        try:
+            with dag.within(deadline):
+                events.put((kind, fn(*args)))
+        except Exception as e:
+            events.put(("error", e))
+
+    def transcribe():
+        for window in whisper_func.remote_gen(job_id):
+            _check_cancelled(job_id)
+            events.put(("window", window))
+
+    def render_window(window_index: int, window_segments: list):
+        if not window_segments:
+            return window_index, [], {}
+        advance_step(STEP_TRANSLATING)
+        translated = _run_stage(
+            job_id, translate_func,
+            segments=window_segments,
+            target_language=target_language,
+            glossary=GLOSSARY,
+            job_id=job_id,
+        )
+        for seg, source in zip(translated, window_segments):
+            seg["index"] = source["index"]
+        advance_step(STEP_CLONING)
+        durations = _run_stage(
+            job_id, render_func,
+            job_id=job_id,
+            segments=translated,
+            target_language=target_language,
+            checkpoint_volume_path=checkpoint_volume_path,
+            source_job_id=job_id,
+        )
+        return window_index, translated, durations
+
+    def load_scene_cuts():
+        # Lip-sync windows cut on the mezzanine's scene index, so they wait for the encode
+        if video_ready is not None:
+            while not video_ready.wait(STREAM_POLL_SEC):
+                _check_cancelled(job_id)
+            pipeline_vol.reload()
+        return _scene_cuts(job_id)
+
+    def lipsync(index: int, start: float, end: float | None):
+        advance_step(STEP_LIP_SYNC)
+        # Windows without speech keep their source frames
+        silent = speech is not None and not speech_map.speech_in(speech["intervals"], start, end)
+        return _run_stage(
+            job_id, passthrough_window if silent else lipsync_func,
+            job_id=job_id, index=index, start=start, end=end, source_job_id=job_id,
+        )
+
+    segments = []        # Transcript so far; each segment carries its global "index"
+    window_ranges = {}   # transcript window -> (first, last + 1) segment index
+    rendered = set()     # transcript windows whose clips exist
+    translated_by_index = {}
+    durations = {}       # segment index -> clip duration (None for empty text)
+    contiguous = 0       # transcript windows rendered without gaps from the start
+    windows_total = None
+    lipsync_results = {}
+    lipsync_bounds = []  # (start, end) per spawned lip-sync window
+    lipsync_next = 0.0
+    final_spawned = False
+    audio_done = False   # dubbed_audio.wav rendered and checkpointed
+    scene_cuts = None    # Known once the mezzanine encode is done
+    dubbed_audio_path = f"{job_dir}/dubbed_audio.wav"
+
+    def spawn_lipsync(pieces: list, start: float, end: float | None):
+        index = len(lipsync_bounds)
+        lipsync_bounds.append((start, end))
+        pipeline_vol.reload()  # Clips were committed by the XTTS containers
+        timeline.render_range(
+            pieces, job_dir, f"{window_dir}/audio_{index:04d}.wav",
+            start, end, min_duration=(video_duration if end is None else end) - start,
+        )
+        pipeline_vol.commit()
+        pool.submit(run, "lipsync", lipsync, index, start, end)
+
+    pool = ThreadPoolExecutor(max_workers=STREAM_MAX_WORKERS)
+    try:
+        print(f"2-5. [{job_id}] Streaming transcription → translation → XTTS → lip-sync...")
+        pool.submit(run, "transcribed", transcribe)
+        pool.submit(run, "scenes", load_scene_cuts)
+        while not (final_spawned and len(lipsync_results) == len(lipsync_bounds)):
+            try:
+                kind, payload = events.get(timeout=STREAM_POLL_SEC)
+            except queue.Empty:
+                _check_cancelled(job_id)
+                if dag.remaining() == 0:
+                    raise dag.NodeTimeout(f"Streaming run of {job_id} outlived its node's timeout")
+                continue
+
+            if kind == "error":
+                raise payload
+            if kind == "window":
+                first = len(segments)
+                for seg in payload["segments"]:
+                    segments.append({**seg, "index": len(segments)})
+                window_ranges[payload["index"]] = (first, len(segments))
+                pool.submit(run, "audio", render_window, payload["index"], segments[first:])
+                continue
+            if kind == "lipsync":
+                lipsync_results[payload["index"]] = payload
+                if final_spawned:
+                    _record_windows(job_id, lipsync_bounds, lipsync_results)
+                continue
+            if kind == "transcribed":
+                windows_total = len(window_ranges)
+                _record_stage(job_id, "transcribe", data={"segments": segments})
+            elif kind == "scenes":
+                scene_cuts = payload
+            elif kind == "audio":
+                window_index, translated, clip_durations = payload
+                rendered.add(window_index)
+                translated_by_index.update((seg["index"], seg) for seg in translated)
+                durations.update(clip_durations)
+                while contiguous in rendered:
+                    contiguous += 1
+
+            # Audio is final up to the end of the rendered prefix
+            n = window_ranges[contiguous - 1][1] if contiguous else 0
+            pieces = timeline.plan(segments[:n], [durations.get(i) for i in range(n)])
+            final_until = timeline.total_duration(pieces)
+            if windows_total is not None and contiguous == windows_total and not audio_done:
+                # Checkpoint the same stages as the sequential path now, so a lip-sync
+                # failure leaves a retry only the windows still missing
+                translated_segments = [translated_by_index[i] for i in sorted(translated_by_index)]
+                _record_stage(job_id, "translate", data=translated_segments)
+                _notify_transcript(job_id, translated_segments)
+                pipeline_vol.reload()  # Clips were committed by the XTTS containers
+                timeline.render(pieces, job_dir, dubbed_audio_path)
+                _record_stage(job_id, "tts", [dubbed_audio_path])
+                audio_done = True
+            if scene_cuts is None:
+                continue
+            # Seams go on a scene cut or in the middle of a pause between clips
+            silences = [p["offset"] + p["duration"] / 2 for p in pieces if p["kind"] == "silence"]
+            while True:
+                end = lipsync_windows.choose_boundary(
+                    lipsync_next + STREAM_LIPSYNC_WINDOW_SEC, scene_cuts, silences, boundary_tolerance,
+                )
+                if end <= lipsync_next or end > final_until or video_duration - end < STREAM_LIPSYNC_WINDOW_SEC / 2:
+                    break
+                spawn_lipsync(pieces, lipsync_next, end)
+                lipsync_next = end
+            if windows_total is not None and contiguous == windows_total and not final_spawned:
+                spawn_lipsync(pieces, lipsync_next, None)
+                final_spawned = True
+                _record_windows(job_id, lipsync_bounds, lipsync_results)
+                print(f"   [{job_id}] Audio complete; {len(lipsync_bounds)} lip-sync windows in flight")
+    except BaseException:
+        _cancel_calls(job_id)
+        raise
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    pipeline_vol.reload()  # Lip-synced windows were committed by their containers
+    print(f"   [{job_id}] Stitching {len(lipsync_bounds)} lip-sync windows...")
+    window_paths = [lipsync_results[i]["path"] for i in range(len(lipsync_bounds))]
+    master_path = f"{job_dir}/dubbed_output.mp4"
+    lipsync_windows.stitch(window_paths, dubbed_audio_path, master_path)
+    _record_stage(job_id, "lipsync", [master_path])
+
+    output_key = _publish_output(job_id, master_path)
+    _record_stage(job_id, "publish", data=output_key)
+    return output_key
+
+
+_PIPELINE_SECRETS = [
+    modal.Secret.from_name("redub-r2-secret"),       # R2 credentials
+    modal.Secret.from_name("backend-webhook-secret")  # Webhook API key
+]
+
+
+def _run_pipeline(
+    job_id: str,
+    video_url: str,
+    target_language: str,
+    voice_preset_id: str = None,
+    checkpoint_volume_path: str = None,
+    streaming: bool = False,
+    resume: bool = False,
+    source_job_id: str = None,
+):
+    """Run (or, with resume, continue) every stage of one job and report the outcome."""
+    import dag
+    import job_manifest
+
+    deadline = _deadline(PIPELINE_TIMEOUT_SEC)  # Called as the function starts
+    source_job_id = source_job_id or job_id
+    streaming = streaming and not resume
+    warmer, on_step = _warmer(job_id, source_job_id, streaming=streaming)
+    try:
+        job_manifest.start(
+            job_id, target_language=target_language, voice_preset_id=voice_preset_id,
+            checkpoint_volume_path=checkpoint_volume_path, source_job_id=source_job_id,
+        )
+        pipeline_vol.commit()  # The prepare container records into this manifest next
+
+        advance = _step_tracker([job_id], on_step)
+        nodes = _source_nodes(job_id, source_job_id, video_url, resume, advance)
+        if streaming:
+            # Streaming overlaps transcription with everything after it on its own; the
+            # mezzanine encode runs beside it and only holds back its lip-sync windows
+            video_ready = threading.Event()
+
+            def dub_streaming(prepared, download, speech):
+                advance(STEP_TRANSCRIBING, _download_metrics(download) if download else None)
+                return {"output_key": _dub_streaming(
+                    job_id, target_language, voice_preset_id, checkpoint_volume_path, video_ready,
+                )}
+
+            def mezzanine_ready(video):
+                video_ready.set()
+
+            nodes = [n for n in nodes if n.name != "transcribe"] + [
+                dag.Node("dub_streaming", dub_streaming, inputs=("prepared", "download", "speech"),
+                         outputs=("output_key",), resource="gpu"),
+                dag.Node("mezzanine_ready", mezzanine_ready, inputs=("video",), resource="io"),
+            ]
+        else:
+            nodes += _language_nodes(
+                job_id, source_job_id, target_language, advance, voice_preset_id, checkpoint_volume_path, resume,
+            )
+        output_key = _run_graph(nodes, should_stop=lambda: _check_cancelled(job_id), deadline=deadline)["output_key"]
+    except JobCancelled:
+        print(f"--- Job {job_id} cancelled — stopping ---")
+        return {"status": "cancelled"}
+    except Exception as e:
+        # A cancelled child call surfaces as an error from .get(); that is not a failure
+        if _is_cancelled(job_id):
+            print(f"--- Job {job_id} cancelled — stopping ---")
+            return {"status": "cancelled"}
+        # Nothing else marks the job FAILED, and retry only picks up failed jobs
+        _notify_failed(job_id, str(e))
+        raise
+    finally:
+        warmer.close()
+        _report_stage_metrics(job_id, source_job_id, job_id, warmer=warmer)
 
     # Fire completion webhook to FastAPI
     # print("7. Notifying FastAPI backend — pipeline complete...")
@@ -136,6 +1258,280 @@ def process_video(
     print("--- Pipeline Complete ---")
     return {"status": "success", "output_key": output_key}
 
+
+# 3b. Download + audio extraction
+@app.function(
+    image=orchestrator_image,
+    cpu=2.0,
+    memory=4096,
+    timeout=PREPARE_TIMEOUT_SEC,
+    volumes={"/pipeline": pipeline_vol}
+)
+def prepare_source(work_id: str, video_url: str) -> dict:
+    import telemetry
+
+    with telemetry.stage(work_id, "prepare", pipeline_vol) as rec:
+        return _prepare_source(work_id, video_url, rec)
+
+
+# 3c. Mezzanine encode + scene index, on a container with enough CPU to encode
+@app.function(
+    image=orchestrator_image,
+    cpu=8.0,
+    memory=8192,
+    timeout=1800,
+    volumes={"/pipeline": pipeline_vol}
+)
+def encode_video(work_id: str):
+    import telemetry
+
+    pipeline_vol.reload()  # source.mp4 was committed by the prepare container
+    with telemetry.stage(work_id, "mezzanine", pipeline_vol) as rec:
+        _encode_video(work_id, rec)
+
+
+# 3d. Speech map (VAD) and speaker reference, on CPU
+@app.function(
+    image=orchestrator_image,
+    cpu=2.0,
+    memory=2048,
+    timeout=900,
+    volumes={"/pipeline": pipeline_vol}
+)
+def map_speech(work_id: str) -> dict:
+    import telemetry
+
+    pipeline_vol.reload()  # The audio artifacts were committed by the prepare container
+    with telemetry.stage(work_id, "speech", pipeline_vol) as rec:
+        return _map_speech(work_id, rec)
+
+
+# 3e. A lip-sync window without speech: the source frames re-encoded to the window format
+@app.function(
+    image=orchestrator_image,
+    cpu=4.0,
+    memory=4096,
+    timeout=900,
+    volumes={"/pipeline": pipeline_vol}
+)
+def passthrough_window(job_id: str, index: int, start: float, end: float = None, source_job_id: str = None) -> dict:
+    import lipsync_windows
+    import telemetry
+
+    pipeline_vol.reload()
+    with telemetry.stage(job_id, "lipsync_passthrough", pipeline_vol):
+        return lipsync_windows.passthrough_window(job_id, index, start, end, source_job_id)
+
+
+# 3f. Business-hours warm pools (REDUB_WARM_POOL); also lapses demands left by crashed runs
+@app.function(
+    image=orchestrator_image,
+    secrets=_PIPELINE_SECRETS,
+    schedule=modal.Period(minutes=10),
+    timeout=300,
+)
+def refresh_warm_pools() -> dict:
+    import warmup
+
+    return warmup.refresh()
+
+
+# 4. The Main Pipeline Function
+@app.function(
+    image=orchestrator_image,
+    secrets=_PIPELINE_SECRETS,
+    timeout=PIPELINE_TIMEOUT_SEC,
+    volumes={"/pipeline": pipeline_vol}
+)
+def process_video(
+    job_id: str,
+    video_url: str,
+    target_language: str,
+    voice_preset_id: str = None,
+    checkpoint_volume_path: str = None,
+    streaming: bool = None,
+):
+    print(f"--- Starting Pipeline for Job: {job_id} ---")
+    streaming = STREAMING if streaming is None else streaming
+    running = _mark_running(job_id)
+    try:
+        return _run_pipeline(job_id, video_url, target_language, voice_preset_id, checkpoint_volume_path, streaming)
+    finally:
+        _clear_running(running)
+
+
+# 4a. Retry entry point: continue a failed or cancelled job from its manifest
+@app.function(
+    image=orchestrator_image,
+    secrets=_PIPELINE_SECRETS,
+    timeout=PIPELINE_TIMEOUT_SEC,
+    volumes={"/pipeline": pipeline_vol}
+)
+def resume_video(job_id: str, video_url: str, target_language: str):
+    """Rerun a job, skipping every leading stage checkpointed in /pipeline/{job_id}/manifest.json.
+
+    The voice preset and the source directory (a group's, for fan-out
+    children) come from the manifest; video_url is only fetched again if
+    the prepare checkpoint is gone. Resumed runs use the sequential path.
+    """
+    import job_manifest
+
+    print(f"--- Resuming Pipeline for Job: {job_id} ---")
+    params = job_manifest.load(job_id)["params"]
+    running = _mark_running(job_id, params.get("source_job_id") or job_id)
+    try:
+        return _run_pipeline(
+            job_id, video_url,
+            target_language=params.get("target_language", target_language),
+            voice_preset_id=params.get("voice_preset_id"),
+            checkpoint_volume_path=params.get("checkpoint_volume_path"),
+            resume=True,
+            source_job_id=params.get("source_job_id"),
+        )
+    finally:
+        _clear_running(running)
+
+
+# 4b. Per-language child of a job group (translation → XTTS → lip-sync)
+@app.function(
+    image=orchestrator_image,
+    secrets=_PIPELINE_SECRETS,
+    timeout=PIPELINE_TIMEOUT_SEC,
+    volumes={"/pipeline": pipeline_vol}
+)
+def dub_language(
+    job_id: str,
+    group_id: str,
+    transcription_data: dict,
+    target_language: str,
+    voice_preset_id: str = None,
+    checkpoint_volume_path: str = None,
+):
+    import job_manifest
+
+    running = _mark_running(job_id, group_id)
+    try:
+        job_manifest.start(
+            job_id, target_language=target_language, voice_preset_id=voice_preset_id,
+            checkpoint_volume_path=checkpoint_volume_path, source_job_id=group_id,
+        )
+        output_key = _dub_language(
+            job_id=job_id,
+            source_job_id=group_id,
+            transcription_data=transcription_data,
+            target_language=target_language,
+            voice_preset_id=voice_preset_id,
+            checkpoint_volume_path=checkpoint_volume_path,
+        )
+    except Exception as e:
+        if isinstance(e, JobCancelled) or _is_cancelled(job_id):
+            print(f"--- Job {job_id} cancelled — stopping ---")
+            return {"job_id": job_id, "status": "cancelled"}
+        # Siblings keep running, so this child has to report its own failure
+        _notify_failed(job_id, str(e))
+        raise
+    finally:
+        _clear_running(running)
+    return {"job_id": job_id, "status": "success", "output_key": output_key}
+
+
+# 4c. Multi-language fan-out: download, prep and transcription run once
+@app.function(
+    image=orchestrator_image,
+    secrets=_PIPELINE_SECRETS,
+    timeout=GROUP_TIMEOUT_SEC,
+    volumes={"/pipeline": pipeline_vol}
+)
+def process_video_group(
+    group_id: str,
+    video_url: str,
+    jobs: list[dict],
+    voice_preset_id: str = None,
+    checkpoint_volume_path: str = None,
+):
+    """Run the shared stages for a job group, then dub each language in parallel.
+
+    jobs is a list of {"job_id", "target_language"} dicts, one per child job.
+    Shared artifacts live under /pipeline/{group_id}/; each child writes its
+    dubbed audio under its own /pipeline/{job_id}/.
+    """
+    running = _mark_running(group_id)
+    try:
+        return _run_group(group_id, video_url, jobs, voice_preset_id, checkpoint_volume_path)
+    finally:
+        _clear_running(running)
+
+
+def _run_group(
+    group_id: str,
+    video_url: str,
+    jobs: list[dict],
+    voice_preset_id: str = None,
+    checkpoint_volume_path: str = None,
+):
+    deadline = _deadline(GROUP_TIMEOUT_SEC)  # Called as process_video_group starts
+    job_ids = [child["job_id"] for child in jobs]
+    print(f"--- Starting Pipeline for Group: {group_id} ({len(jobs)} languages) ---")
+
+    def stop_if_all_cancelled():
+        if all(_is_cancelled(job_id) for job_id in job_ids):
+            raise JobCancelled(group_id)
+
+    # Each child warms its own TTS and lip-sync containers
+    warmer, on_step = _warmer(group_id, group_id, stages=["prepare", "transcribe"])
+    try:
+        # Shared stages are registered under the group so cancelling one child leaves them
+        # running; the mezzanine encode overlaps transcription and is done before any child lip-syncs
+        values = _run_graph(
+            _source_nodes(group_id, group_id, video_url, False, _step_tracker(job_ids, on_step)),
+            should_stop=stop_if_all_cancelled,
+            deadline=deadline,
+        )
+        transcription_data = values["transcription"]
+        stop_if_all_cancelled()
+    except JobCancelled:
+        print(f"--- Every job in group {group_id} was cancelled — stopping ---")
+        return {"group_id": group_id, "jobs": [{"job_id": j, "status": "cancelled"} for j in job_ids]}
+    except Exception as e:
+        for job_id in job_ids:
+            _notify_failed(job_id, str(e))
+        raise
+    finally:
+        # The shared stages' records live under the group; each child reports them
+        warmer.close()
+        for job_id in job_ids:
+            _report_stage_metrics(job_id, group_id, warmer=warmer)
+
+    active = [child for child in jobs if not _is_cancelled(child["job_id"])]
+    print(f"3-5. Fanning out {len(active)} languages...")
+    calls = []
+    for child in active:
+        call = dub_language.spawn(
+            job_id=child["job_id"],
+            group_id=group_id,
+            transcription_data=transcription_data,
+            target_language=child["target_language"],
+            voice_preset_id=voice_preset_id,
+            checkpoint_volume_path=checkpoint_volume_path,
+        )
+        _register_call(child["job_id"], call.object_id)
+        calls.append(call)
+
+    # Children run on their own budget; one still going at the group's deadline is left to finish
+    results = []
+    for child, call in zip(active, calls):
+        try:
+            results.append(call.get(timeout=max(deadline - time.monotonic(), 0)))
+        except modal.exception.TimeoutError:
+            print(f"[warn] Child job {child['job_id']} ({child['target_language']}) still running at the group deadline")
+            results.append({"job_id": child["job_id"], "status": "running"})
+        except Exception as e:
+            print(f"[warn] Child job {child['job_id']} ({child['target_language']}) failed: {e}")
+            results.append({"job_id": child["job_id"], "status": "failed", "error": str(e)})
+
+    print("--- Group Pipeline Complete ---")
+    return {"group_id": group_id, "jobs": results}
+
 # 5. Local Testing Entrypoint
 @app.local_entrypoint()
 def main(job_id: str = "test-123"):
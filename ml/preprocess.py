@@ -0,0 +1,104 @@
+"""Single-pass preprocessing of a job's source video.
+
+run() decodes the source once and fans the decoded streams out to every
+derived artifact the pipeline needs, written next to source.mp4:
+
+  asr_16k.f32      16 kHz mono float32 PCM (raw) for Whisper
+  voice_22k.wav    22.05 kHz mono PCM, the full track, for voice work
+  speaker_ref.wav  the first SPEAKER_REF_SEC of it, XTTS's zero-shot reference
+                   (speech_map.build() later recuts it from the densest speech)
+  mezzanine.mp4    25 fps H.264 with a keyframe every second, for lip-sync
+  scenes.json      scene-cut timestamps plus the mezzanine's frame/keyframe grid
+
+Downstream apps read these instead of decoding source.mp4 again and fall
+back to the source for jobs prepared before they existed. The audio and
+video halves can also run as separate passes (audio=False / video=False),
+so the slow mezzanine encode overlaps transcription. Stdlib + ffmpeg.
+"""
+import json
+import os
+import re
+import subprocess
+
+ASR_SAMPLE_RATE = 16000
+VOICE_SAMPLE_RATE = 22050
+SPEAKER_REF_SEC = 6
+KEYFRAME_INTERVAL_SEC = 1
+
+ASR_AUDIO = "asr_16k.f32"
+VOICE_AUDIO = "voice_22k.wav"
+SPEAKER_REF = "speaker_ref.wav"
+MEZZANINE = "mezzanine.mp4"
+SCENE_INDEX = "scenes.json"
+
+
+AUDIO_ARTIFACTS = (ASR_AUDIO, VOICE_AUDIO, SPEAKER_REF)
+VIDEO_ARTIFACTS = (MEZZANINE, SCENE_INDEX)
+
+
+def run(source_path: str, out_dir: str, audio: bool = True, video: bool = True) -> list[str]:
+    """Decode source_path once and write the audio and/or video artifacts into out_dir. Returns their paths."""
+    import lipsync_windows
+
+    fps = lipsync_windows.VIDEO_FPS
+    graph = []
+    outputs = []
+    names = []
+    if audio:
+        names += AUDIO_ARTIFACTS
+        graph += [
+            "[0:a:0]asplit=3[a_asr][a_voice][a_ref]",
+            f"[a_asr]aresample={ASR_SAMPLE_RATE},aformat=sample_fmts=flt:channel_layouts=mono[asr]",
+            f"[a_voice]aresample={VOICE_SAMPLE_RATE},aformat=sample_fmts=s16:channel_layouts=mono[voice]",
+            f"[a_ref]atrim=duration={SPEAKER_REF_SEC},aresample={VOICE_SAMPLE_RATE},"
+            "aformat=sample_fmts=s16:channel_layouts=mono[ref]",
+        ]
+    if video:
+        names += VIDEO_ARTIFACTS
+        graph += [
+            f"[0:v:0]fps={fps},format=yuv420p,split=2[mez][v_scene]",
+            f"[v_scene]scale=160:-2,select='gt(scene,{lipsync_windows.SCENE_THRESHOLD})',showinfo[scenes]",
+        ]
+    paths = {name: f"{out_dir}/{name}" for name in names}
+    if audio:
+        outputs += [
+            "-map", "[asr]", "-f", "f32le", paths[ASR_AUDIO],
+            "-map", "[voice]", "-acodec", "pcm_s16le", paths[VOICE_AUDIO],
+            "-map", "[ref]", "-acodec", "pcm_s16le", paths[SPEAKER_REF],
+        ]
+    if video:
+        outputs += [
+            "-map", "[mez]", "-c:v", "libx264", "-preset", "fast", "-crf", "18",
+            "-g", str(fps * KEYFRAME_INTERVAL_SEC),
+            "-video_track_timescale", str(lipsync_windows.VIDEO_TIMESCALE), paths[MEZZANINE],
+            "-map", "[scenes]", "-f", "null", "-",
+        ]
+    result = subprocess.run(
+        ["ffmpeg", "-y", "-hide_banner", "-i", source_path, "-filter_complex", ";".join(graph), *outputs],
+        capture_output=True, text=True, check=True,
+    )
+
+    if video:
+        cuts = [float(t) for t in re.findall(r"pts_time:([0-9.]+)", result.stderr)]
+        with open(paths[SCENE_INDEX], "w") as f:
+            json.dump({
+                "fps": fps,
+                "keyframe_interval_sec": KEYFRAME_INTERVAL_SEC,
+                "duration": lipsync_windows.media_duration(paths[MEZZANINE]),
+                "scene_cuts": cuts,
+            }, f)
+    return list(paths.values())
+
+
+def artifact(work_dir: str, name: str) -> str | None:
+    """Path of a preprocessed artifact, or None if the job predates it."""
+    path = f"{work_dir}/{name}"
+    return path if os.path.exists(path) else None
+
+
+def scene_index(work_dir: str) -> dict | None:
+    path = artifact(work_dir, SCENE_INDEX)
+    if path is None:
+        return None
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,52 @@
+"""Streaming multipart upload of pipeline outputs to Cloudflare R2.
+
+Files go up straight from disk in PART_BYTES parts, MAX_CONCURRENCY at a
+time, so no container ever holds a whole video in memory or ships it over
+Modal RPC. upload() returns the key with the file's size and SHA-256 (also
+stored as object metadata) for the caller to record. Needs boto3 and the
+redub-r2-secret environment.
+"""
+import hashlib
+import os
+
+PART_BYTES = 64 * 1024 * 1024
+MAX_CONCURRENCY = 16
+READ_BYTES = 8 * 1024 * 1024
+
+
+def client():
+    import boto3
+
+    return boto3.client(
+        "s3",
+        endpoint_url=f"https://{os.environ['ACCOUNT_ID']}.r2.cloudflarestorage.com",
+        aws_access_key_id=os.environ["R2_ACCESS_KEY_ID"],
+        aws_secret_access_key=os.environ["R2_SECRET_ACCESS_KEY"],
+        region_name="auto",
+    )
+
+
+def sha256_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(READ_BYTES), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def upload(path: str, key: str, content_type: str = "video/mp4", s3_client=None) -> dict:
+    """Upload a local file to R2; returns {"key", "size", "sha256"}."""
+    from boto3.s3.transfer import TransferConfig
+
+    digest = sha256_digest(path)
+    (s3_client or client()).upload_file(
+        path, os.environ["R2_BUCKET_NAME"], key,
+        ExtraArgs={"ContentType": content_type, "Metadata": {"sha256": digest}},
+        Config=TransferConfig(
+            multipart_threshold=PART_BYTES,
+            multipart_chunksize=PART_BYTES,
+            max_concurrency=MAX_CONCURRENCY,
+            use_threads=True,
+        ),
+    )
+    return {"key": key, "size": os.path.getsize(path), "sha256": digest}
@@ -0,0 +1,207 @@
+"""Speech-interval map of a job's source audio.
+
+build() runs WebRTC VAD over asr_16k.f32 on CPU and writes speech.json
+next to it: the [start, end) seconds that contain speech, after dropping
+blips, bridging short pauses and padding each interval. Stages that spend
+GPU time read the same map:
+
+  Whisper          transcribes only the speech spans, joined by short
+                   silences (compact), and maps timestamps back (to_source)
+  speaker_ref.wav  is cut from the densest SPEAKER_REF window of speech
+                   instead of the first seconds of the track
+  lip-sync         windows split around long non-speech stretches
+                   (split_silent); those pass the source frames through
+
+Jobs prepared before the map existed have no speech.json; load() returns
+None and every stage behaves as before. numpy and webrtcvad are imported
+by the functions that use them, so load() and the interval helpers work
+in any image.
+"""
+import json
+import os
+import subprocess
+
+SPEECH_MAP = "speech.json"
+
+SAMPLE_RATE = 16000    # asr_16k.f32
+FRAME_MS = 30          # WebRTC VAD accepts 10, 20 or 30 ms frames
+AGGRESSIVENESS = 3     # 0-3; 3 only keeps frames it is confident are speech
+MIN_SPEECH_SEC = 0.25  # Shorter bursts are clicks and noise
+MERGE_GAP_SEC = 0.5    # Pauses shorter than this stay inside one interval
+PAD_SEC = 0.2          # Around each interval, so onsets and tails are kept
+JOIN_GAP_SEC = 0.3     # Silence between spans in compacted audio
+MIN_SKIP_SEC = 5.0     # Non-speech stretches shorter than this are lip-synced anyway
+
+PARAMS = {
+    "frame_ms": FRAME_MS, "aggressiveness": AGGRESSIVENESS, "min_speech_sec": MIN_SPEECH_SEC,
+    "merge_gap_sec": MERGE_GAP_SEC, "pad_sec": PAD_SEC,
+}
+
+
+def detect(audio, sample_rate: int = SAMPLE_RATE) -> list[list[float]]:
+    """Speech intervals of float32 mono audio, in seconds."""
+    import numpy as np
+    import webrtcvad
+
+    vad = webrtcvad.Vad(AGGRESSIVENESS)
+    frame = sample_rate * FRAME_MS // 1000
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2")
+    duration = len(audio) / sample_rate
+
+    raw = []
+    start = None
+    for i in range(len(pcm) // frame):
+        t = i * frame / sample_rate
+        if vad.is_speech(pcm[i * frame:(i + 1) * frame].tobytes(), sample_rate):
+            if start is None:
+                start = t
+        elif start is not None:
+            raw.append([start, t])
+            start = None
+    if start is not None:
+        raw.append([start, duration])
+
+    merged = []
+    for start, end in raw:
+        if merged and start - merged[-1][1] < MERGE_GAP_SEC:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+
+    intervals = []
+    for start, end in merged:
+        if end - start < MIN_SPEECH_SEC:
+            continue
+        start, end = max(start - PAD_SEC, 0.0), min(end + PAD_SEC, duration)
+        if intervals and start <= intervals[-1][1]:
+            intervals[-1][1] = end
+        else:
+            intervals.append([round(start, 3), round(end, 3)])
+    return intervals
+
+
+def densest_window(intervals: list[list[float]], duration: float, length: float) -> float:
+    """Start of the length-second window holding the most speech (earliest on ties).
+
+    The best window always starts at an interval's start or ends at an
+    interval's end, so only those candidates are scored.
+    """
+    if duration <= length:
+        return 0.0
+    candidates = {0.0}
+    for start, end in intervals:
+        candidates.add(min(start, duration - length))
+        candidates.add(max(end - length, 0.0))
+    return max(sorted(candidates), key=lambda s: speech_in(intervals, s, s + length))
+
+
+def build(work_dir: str, speaker_ref_sec: float) -> dict:
+    """Write work_dir's speech.json and recut speaker_ref.wav from its densest speech window."""
+    import numpy as np
+    import preprocess
+
+    audio = np.fromfile(f"{work_dir}/{preprocess.ASR_AUDIO}", dtype=np.float32)
+    duration = len(audio) / SAMPLE_RATE
+    intervals = detect(audio)
+    speech = {
+        "duration": round(duration, 3),
+        "speech_sec": round(sum(end - start for start, end in intervals), 3),
+        "intervals": intervals,
+        "params": PARAMS,
+    }
+
+    voice_path = preprocess.artifact(work_dir, preprocess.VOICE_AUDIO)
+    if voice_path is not None and intervals:
+        start = densest_window(intervals, duration, speaker_ref_sec)
+        speech["speaker_ref"] = [round(start, 3), round(min(start + speaker_ref_sec, duration), 3)]
+        # Exactly as many samples as preprocess cut, so the prepare checkpoint stays valid
+        samples = int(min(speaker_ref_sec, duration) * preprocess.VOICE_SAMPLE_RATE)
+        subprocess.run(
+            ["ffmpeg", "-y", "-ss", f"{start:.3f}", "-i", voice_path,
+             "-af", f"apad,atrim=end_sample={samples}", "-acodec", "pcm_s16le",
+             f"{work_dir}/{preprocess.SPEAKER_REF}"],
+            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+
+    with open(f"{work_dir}/{SPEECH_MAP}", "w") as f:
+        json.dump(speech, f)
+    return speech
+
+
+def load(work_dir: str) -> dict | None:
+    path = f"{work_dir}/{SPEECH_MAP}"
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def speech_in(intervals: list[list[float]], start: float, end: float | None) -> float:
+    """Seconds of speech inside [start, end); end=None runs to the end."""
+    end = float("inf") if end is None else end
+    return sum(max(min(e, end) - max(s, start), 0.0) for s, e in intervals)
+
+
+def clip(intervals: list[list[float]], start: float, end: float) -> list[list[float]]:
+    """The intervals inside [start, end), relative to start."""
+    return [[max(s, start) - start, min(e, end) - start] for s, e in intervals if s < end and e > start]
+
+
+def compact(audio, intervals: list[list[float]], sample_rate: int = SAMPLE_RATE):
+    """Only the speech of audio, spans joined by JOIN_GAP_SEC of silence.
+
+    Returns (compacted audio, spans) where spans are (compact_start,
+    source_start, source_end) for to_source().
+    """
+    import numpy as np
+
+    gap = np.zeros(int(JOIN_GAP_SEC * sample_rate), dtype=audio.dtype)
+    pieces, spans = [], []
+    position = 0.0
+    for start, end in intervals:
+        piece = audio[int(start * sample_rate):int(end * sample_rate)]
+        if not len(piece):
+            continue
+        if pieces:
+            pieces.append(gap)
+            position += JOIN_GAP_SEC
+        spans.append((position, start, start + len(piece) / sample_rate))
+        pieces.append(piece)
+        position += len(piece) / sample_rate
+    compacted = np.concatenate(pieces) if pieces else audio[:0]
+    return compacted, spans
+
+
+def to_source(t: float, spans: list[tuple[float, float, float]]) -> float:
+    """Map a time in compacted audio back to the source; times in a join clamp to the span before it."""
+    for compact_start, source_start, source_end in reversed(spans):
+        if t >= compact_start:
+            return min(source_start + (t - compact_start), source_end)
+    return spans[0][1] if spans else t
+
+
+def split_silent(bounds: list[tuple[float, float | None]], intervals: list[list[float]], duration: float,
+                 min_sec: float = MIN_SKIP_SEC) -> list[tuple[float, float | None, bool]]:
+    """Split [start, end) windows around non-speech stretches of at least min_sec.
+
+    Returns (start, end, has_speech) pieces in order, cut on the frame grid;
+    the last piece keeps end=None. Speech-free pieces need no lip-sync.
+    """
+    import lipsync_windows
+
+    pieces = []
+    for start, end in bounds:
+        stop = duration if end is None else end
+        cuts = []
+        previous = start
+        for s, e in clip(intervals, start, stop) + [[stop - start, stop - start]]:
+            s, e = s + start, e + start
+            if s - previous >= min_sec:
+                cuts += [lipsync_windows.snap_to_frame(previous), lipsync_windows.snap_to_frame(s)]
+            previous = max(previous, e)
+        edges = [start] + [c for c in cuts if start < c < stop] + [end]
+        for a, b in zip(edges, edges[1:]):
+            if b is not None and b <= a:
+                continue
+            pieces.append((a, b, speech_in(intervals, a, b) > 0))
+    return pieces
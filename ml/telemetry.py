@@ -0,0 +1,141 @@
+"""Per-stage telemetry written by every pipeline function.
+
+Each Modal function wraps its work in stage(); on exit a record lands in
+/pipeline/{job_id}/metrics/ with the stage's execution time, model load
+time, GPU type, whether the container was cold, and the input/output
+sizes the function reported. The orchestrator joins these records with
+the time it spawned each call (the gap before the record starts is queue
+and container start time) and posts them to the backend's
+job_stage_metrics table. Stdlib only.
+"""
+import json
+import os
+import subprocess
+import time
+import uuid
+from contextlib import contextmanager
+
+METRICS_DIR = "metrics"
+
+_CONTAINER_STARTED = time.time()  # Module import ≈ container start
+_invocations = 0
+_gpu_type = None
+
+
+def _current_call_id() -> str | None:
+    try:
+        import modal
+
+        return modal.current_function_call_id()
+    except Exception:
+        return None
+
+
+def gpu_type() -> str | None:
+    """Name of the container's GPU, or None on CPU containers."""
+    global _gpu_type
+    if _gpu_type is None:
+        try:
+            result = subprocess.run(
+                ["nvidia-smi", "--query-gpu=name", "--format=csv,noheader"],
+                capture_output=True, text=True, check=True, timeout=10,
+            )
+            _gpu_type = result.stdout.strip().splitlines()[0]
+        except Exception:
+            _gpu_type = ""
+    return _gpu_type or None
+
+
+def container_started():
+    """Restart the boot clock; call first in the enter hook that runs after a memory snapshot.
+
+    A container restored from a snapshot never ran the module import, so
+    its boot is measured from here. Models loaded in enter hooks count as
+    boot (boot_sec), not as a stage's model_load_sec.
+    """
+    global _CONTAINER_STARTED
+    _CONTAINER_STARTED = time.time()
+
+
+class StageRecord:
+    def __init__(self, job_id: str, stage: str):
+        global _invocations
+        self.id = uuid.uuid4().hex[:12]
+        self.job_id = job_id
+        self.stage = stage
+        self.started = time.time()
+        self.cold_start = _invocations == 0
+        _invocations += 1
+        self.model_load_sec = 0.0
+        self.sizes = {}
+
+    @contextmanager
+    def model_load(self):
+        """Time a block that loads model weights; repeated blocks add up."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.model_load_sec += time.monotonic() - started
+
+    def record(self, video_sec: float = None, segment_count: int = None, output_bytes: int = None):
+        """Note the stage's input and output sizes; later calls override earlier ones."""
+        for name, value in (("video_sec", video_sec), ("segment_count", segment_count),
+                            ("output_bytes", output_bytes)):
+            if value is not None:
+                self.sizes[name] = value
+
+    def to_dict(self, status: str) -> dict:
+        return {
+            "id": self.id,
+            "stage": self.stage,
+            "call_id": _current_call_id(),
+            "started_at": self.started,
+            "exec_sec": round(time.time() - self.started, 3),
+            "model_load_sec": round(self.model_load_sec, 3),
+            "gpu_type": gpu_type(),
+            "cold_start": self.cold_start,
+            "boot_sec": round(self.started - _CONTAINER_STARTED, 3) if self.cold_start else 0.0,
+            "status": status,
+            **self.sizes,
+        }
+
+
+@contextmanager
+def stage(job_id: str, name: str, volume=None):
+    """Measure one stage invocation and write its record under /pipeline/{job_id}/metrics/.
+
+    Pass the pipeline volume to have the record committed on exit.
+    """
+    rec = StageRecord(job_id, name)
+    status = "ok"
+    try:
+        yield rec
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        try:
+            metrics_dir = f"/pipeline/{job_id}/{METRICS_DIR}"
+            os.makedirs(metrics_dir, exist_ok=True)
+            with open(f"{metrics_dir}/{name}-{rec.id}.json", "w") as f:
+                json.dump(rec.to_dict(status), f)
+            if volume is not None:
+                volume.commit()
+        except Exception as e:
+            print(f"[warn] Could not write {name} metrics for {job_id}: {e}")
+
+
+def load(job_id: str) -> list[dict]:
+    """Every stage record written for a job so far."""
+    metrics_dir = f"/pipeline/{job_id}/{METRICS_DIR}"
+    if not os.path.isdir(metrics_dir):
+        return []
+    records = []
+    for name in sorted(os.listdir(metrics_dir)):
+        try:
+            with open(f"{metrics_dir}/{name}") as f:
+                records.append(json.load(f))
+        except (OSError, json.JSONDecodeError):
+            continue
+    return records
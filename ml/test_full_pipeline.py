@@ -112,7 +112,7 @@ def main(
     # ── Step 1: Transcription (Whisper) ────────────────────────────
     print("\n▶ Step 1/4 — Transcribing audio (Whisper large-v3)...")
     t = time.time()
-    whisper_func = modal.Function.from_name("redub-whisper", "transcribe_video")
+    whisper_func = modal.Cls.from_name("redub-whisper", "Whisper")().transcribe_video
     transcription = whisper_func.remote(job_id)
     elapsed = time.time() - t
     print(f"  ✓ Transcription complete ({elapsed:.1f}s)")
@@ -138,7 +138,7 @@ def main(
     # ── Step 3: Voice Cloning (XTTS) — per-segment with duration matching ──
     print(f"\n▶ Step 3/4 — Per-segment voice cloning via XTTS (lang={target_language})...")
     t = time.time()
-    xtts_func = modal.Function.from_name("redub-xtts", "generate_dubbed_audio")
+    xtts_func = modal.Cls.from_name("redub-xtts", "XTTS")().generate_dubbed_audio
     xtts_result = xtts_func.remote(
         job_id=job_id,
         segments=translated_segments,
@@ -154,22 +154,16 @@ def main(
     print(f"\n▶ Step 4/4 — Lip-syncing video (MuseTalk / H100)...")
     t = time.time()
     musetalk_func = modal.Function.from_name("redub-musetalk", "sync_lip_movements")
-    final_video_bytes = musetalk_func.remote(job_id)
+    uploaded = musetalk_func.remote(job_id, output_key=f"projects/{job_id}/dubbed_output_{target_language}.mp4")
     elapsed = time.time() - t
     print(f"  ✓ Lip sync complete ({elapsed:.1f}s)")
-    print(f"    Output size: {len(final_video_bytes) / (1024 * 1024):.2f} MB")
-
-    # ── Save output locally ────────────────────────────────────────
-    output_dir = os.path.join(os.path.dirname(__file__), "tmp")
-    os.makedirs(output_dir, exist_ok=True)
-    output_path = os.path.join(output_dir, f"{job_id}_dubbed_output_{target_language}.mp4")
-    with open(output_path, "wb") as f:
-        f.write(final_video_bytes)
+    print(f"    Output size: {uploaded['size'] / (1024 * 1024):.2f} MB")
 
     total_elapsed = time.time() - overall_start
     print("\n" + "=" * 60)
     print("  ✅ PIPELINE COMPLETE")
     print(f"  Total time:   {total_elapsed:.1f}s ({total_elapsed / 60:.1f} min)")
-    print(f"  Output saved:  {output_path}")
-    print(f"  Output size:   {len(final_video_bytes) / (1024 * 1024):.2f} MB")
+    print(f"  Output in R2:  {uploaded['key']}")
+    print(f"  Output size:   {uploaded['size'] / (1024 * 1024):.2f} MB")
+    print(f"  SHA-256:       {uploaded['sha256']}")
     print("=" * 60)
@@ -15,7 +15,7 @@ app = modal.App("redub-test-whisper-translate")
 
 @app.local_entrypoint()
 def main(job_id: str = "test-123", target_language: str = "Spanish"):
-    whisper_func = modal.Function.from_name("redub-whisper", "transcribe_video")
+    whisper_func = modal.Cls.from_name("redub-whisper", "Whisper")().transcribe_video
     translate_func = modal.Function.from_name("redub-translate", "translate_text")
 
     print(f"=== Step 1: Transcribing (job_id={job_id}) ===")
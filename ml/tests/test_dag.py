@@ -0,0 +1,185 @@
+"""Unit tests for dag.py on LocalExecutor: python -m pytest ml/tests"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dag  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fast_poll(monkeypatch):
+    monkeypatch.setattr(dag, "POLL_SEC", 0.02)
+    monkeypatch.setattr(dag, "CANCEL_GRACE_SEC", 1.0)
+
+
+def run(nodes, values=None, **kwargs):
+    return dag.run(dag.Graph(nodes), values, dag.LocalExecutor(), **kwargs)
+
+
+def test_nodes_run_after_their_inputs():
+    order = []
+
+    def node(name, inputs=(), outputs=()):
+        def fn(**kwargs):
+            order.append(name)
+            return {v: f"{name}:{v}" for v in outputs}
+        return dag.Node(name, fn, inputs=inputs, outputs=outputs)
+
+    values = run([
+        node("publish", inputs=("master",), outputs=("key",)),
+        node("lipsync", inputs=("audio", "video"), outputs=("master",)),
+        node("encode", inputs=("source",), outputs=("video",)),
+        node("tts", inputs=("source",), outputs=("audio",)),
+        node("prepare", outputs=("source",)),
+    ])
+
+    assert order.index("prepare") < order.index("encode") < order.index("lipsync")
+    assert order.index("tts") < order.index("lipsync") < order.index("publish")
+    assert values["key"] == "publish:key"
+
+
+def test_given_values_feed_nodes():
+    values = run([dag.Node("double", lambda x: {"y": 2 * x}, inputs=("x",), outputs=("y",))], {"x": 21})
+    assert values == {"x": 21, "y": 42}
+
+
+def test_restore_skips_node_until_an_upstream_node_runs():
+    calls = []
+
+    def fn(name, output):
+        def body(**kwargs):
+            calls.append(name)
+            return {output: f"fresh {name}"}
+        return body
+
+    nodes = [
+        dag.Node("a", fn("a", "x"), outputs=("x",), restore=lambda: {"x": "restored a"}),
+        dag.Node("b", fn("b", "y"), inputs=("x",), outputs=("y",), restore=lambda x: None),
+        dag.Node("c", fn("c", "z"), inputs=("y",), outputs=("z",), restore=lambda y: {"z": "restored c"}),
+    ]
+    values = run(nodes)
+
+    # a restores; b has no checkpoint and runs; c's checkpoint is stale because b reran
+    assert calls == ["b", "c"]
+    assert values["x"] == "restored a"
+    assert values["z"] == "fresh c"
+
+
+def test_failed_node_is_retried():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("transient")
+        return {"x": "ok"}
+
+    values = run([dag.Node("flaky", flaky, outputs=("x",), retries=1)])
+    assert values["x"] == "ok"
+    assert len(attempts) == 2
+
+
+def test_node_fails_after_its_retries():
+    def broken():
+        raise RuntimeError("broken")
+
+    with pytest.raises(RuntimeError, match="broken"):
+        run([dag.Node("broken", broken, outputs=("x",), retries=2)])
+
+
+def test_timed_out_node_is_not_retried_unless_cancellable():
+    attempts = []
+
+    def slow():
+        attempts.append(1)
+        time.sleep(0.5)
+        return {"x": "late"}
+
+    with pytest.raises(dag.NodeTimeout):
+        run([dag.Node("slow", slow, outputs=("x",), retries=2, timeout=0.1)])
+    assert len(attempts) == 1
+
+
+def test_timed_out_cancellable_node_is_retried_once_stopped():
+    attempts = []
+
+    def bounded():
+        attempts.append(1)
+        if len(attempts) == 1:
+            # A Modal call waited on with get(timeout=remaining())
+            time.sleep(dag.remaining())
+            raise dag.NodeTimeout("call outlived its node")
+        return {"x": "ok"}
+
+    values = run([dag.Node("bounded", bounded, outputs=("x",), retries=1, timeout=0.1, cancellable=True)])
+    assert values["x"] == "ok"
+    assert len(attempts) == 2
+
+
+def test_deadline_caps_node_timeouts():
+    seen = []
+
+    def body():
+        seen.append(dag.remaining())
+        return {"x": 1}
+
+    run([dag.Node("n", body, outputs=("x",), timeout=3600)], deadline=time.monotonic() + 5)
+    assert seen[0] <= 5
+    assert dag.remaining() is None
+
+
+def test_threads_started_by_a_node_can_share_its_deadline():
+    seen = {}
+
+    def body():
+        deadline = dag.attempt_deadline()
+
+        def worker():
+            seen["bare"] = dag.remaining()
+            with dag.within(deadline):
+                seen["within"] = dag.remaining()
+            seen["after"] = dag.remaining()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        return {"x": 1}
+
+    run([dag.Node("n", body, outputs=("x",), timeout=60)])
+    assert seen["bare"] is None
+    assert 0 < seen["within"] <= 60
+    assert seen["after"] is None
+
+
+def test_should_stop_aborts_the_run():
+    ran = []
+
+    class Cancelled(Exception):
+        pass
+
+    def should_stop():
+        if ran:
+            raise Cancelled()
+
+    nodes = [
+        dag.Node("first", lambda: ran.append("first") or {"x": 1}, outputs=("x",)),
+        dag.Node("second", lambda x: ran.append("second") or {"y": 2}, inputs=("x",), outputs=("y",)),
+    ]
+    with pytest.raises(Cancelled):
+        run(nodes, should_stop=should_stop)
+    assert ran == ["first"]
+
+
+def test_graph_rejects_cycles_and_missing_inputs():
+    with pytest.raises(dag.GraphError, match="Cycle"):
+        dag.Graph([
+            dag.Node("a", lambda y: {"x": y}, inputs=("y",), outputs=("x",)),
+            dag.Node("b", lambda x: {"y": x}, inputs=("x",), outputs=("y",)),
+        ])
+    with pytest.raises(dag.GraphError, match="No node produces"):
+        run([dag.Node("a", lambda missing: {}, inputs=("missing",))])
@@ -0,0 +1,71 @@
+"""Unit tests for the orchestrator's failure reporting: python -m pytest ml/tests"""
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("modal")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import job_manifest  # noqa: E402
+import orchestrator  # noqa: E402
+
+
+class FakeWarmer:
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """_run_pipeline with Modal, the volume and the webhooks replaced; returns the failures reported."""
+    failed = []
+    monkeypatch.setattr(orchestrator, "_warmer", lambda *args, **kwargs: (FakeWarmer(), None))
+    monkeypatch.setattr(orchestrator, "_report_stage_metrics", lambda *args, **kwargs: None)
+    monkeypatch.setattr(orchestrator, "_notify_failed", lambda job_id, error: failed.append((job_id, error)))
+    monkeypatch.setattr(orchestrator, "_source_nodes", lambda *args: [])
+    monkeypatch.setattr(orchestrator, "_language_nodes", lambda *args: [])
+    monkeypatch.setattr(orchestrator.pipeline_vol, "commit", lambda: None)
+    monkeypatch.setattr(job_manifest, "start", lambda *args, **kwargs: None)
+    return failed
+
+
+def fail_graph(error):
+    def run_graph(*args, **kwargs):
+        raise error
+    return run_graph
+
+
+def test_failed_job_is_reported(monkeypatch, pipeline):
+    monkeypatch.setattr(orchestrator, "_is_cancelled", lambda job_id: False)
+    monkeypatch.setattr(orchestrator, "_run_graph", fail_graph(RuntimeError("lip-sync window 3 failed")))
+
+    with pytest.raises(RuntimeError):
+        orchestrator._run_pipeline("job-1", "uploads/u/video.mp4", "es")
+    assert pipeline == [("job-1", "lip-sync window 3 failed")]
+
+
+def test_failed_resume_is_reported(monkeypatch, pipeline):
+    monkeypatch.setattr(orchestrator, "_is_cancelled", lambda job_id: False)
+    monkeypatch.setattr(orchestrator, "_run_graph", fail_graph(RuntimeError("boom")))
+
+    with pytest.raises(RuntimeError):
+        orchestrator._run_pipeline("job-1", "uploads/u/video.mp4", "es", resume=True)
+    assert pipeline == [("job-1", "boom")]
+
+
+def test_cancelled_job_is_not_reported_as_failed(monkeypatch, pipeline):
+    monkeypatch.setattr(orchestrator, "_is_cancelled", lambda job_id: True)
+    monkeypatch.setattr(orchestrator, "_run_graph", fail_graph(RuntimeError("call was cancelled")))
+
+    assert orchestrator._run_pipeline("job-1", "uploads/u/video.mp4", "es") == {"status": "cancelled"}
+    assert pipeline == []
+
+
+def test_job_cancelled_between_stages_is_not_reported(monkeypatch, pipeline):
+    monkeypatch.setattr(orchestrator, "_is_cancelled", lambda job_id: False)
+    monkeypatch.setattr(orchestrator, "_run_graph", fail_graph(orchestrator.JobCancelled("job-1")))
+
+    assert orchestrator._run_pipeline("job-1", "uploads/u/video.mp4", "es") == {"status": "cancelled"}
+    assert pipeline == []
@@ -0,0 +1,141 @@
+"""Dubbed-audio timeline shared by the XTTS app and the orchestrator.
+
+XTTS renders one time-stretched clip per translated segment into
+/pipeline/{job_id}/clips/. plan() lays those clips out exactly the way the
+original serial renderer did, so dubbed_audio.wav comes out the same
+whether the clips were rendered in one container, in shards, or window by
+window while transcription is still running. Stdlib + ffmpeg only, so it
+can be mounted into any image with .add_local_python_source("timeline").
+"""
+import os
+import struct
+import subprocess
+import tempfile
+
+SAMPLE_RATE = 22050  # XTTS v2 output sample rate
+NUM_CHANNELS = 1     # mono
+
+MIN_GAP_SEC = 0.01   # Gaps shorter than this are not worth a silence piece
+
+
+def clip_path(job_dir: str, index: int) -> str:
+    return f"{job_dir}/clips/clip_{index:05d}.wav"
+
+
+def generate_silence_wav(path: str, duration_sec: float):
+    """Write a silent WAV file of the given duration (16-bit PCM, mono, 22050 Hz)."""
+    num_samples = int(SAMPLE_RATE * duration_sec)
+    data_size = num_samples * NUM_CHANNELS * 2  # 16-bit = 2 bytes per sample
+
+    with open(path, "wb") as f:
+        # RIFF header
+        f.write(b"RIFF")
+        f.write(struct.pack("<I", 36 + data_size))
+        f.write(b"WAVE")
+        # fmt chunk
+        f.write(b"fmt ")
+        f.write(struct.pack("<I", 16))                    # chunk size
+        f.write(struct.pack("<H", 1))                     # PCM format
+        f.write(struct.pack("<H", NUM_CHANNELS))
+        f.write(struct.pack("<I", SAMPLE_RATE))
+        f.write(struct.pack("<I", SAMPLE_RATE * NUM_CHANNELS * 2))  # byte rate
+        f.write(struct.pack("<H", NUM_CHANNELS * 2))      # block align
+        f.write(struct.pack("<H", 16))                    # bits per sample
+        # data chunk
+        f.write(b"data")
+        f.write(struct.pack("<I", data_size))
+        f.write(b"\x00" * data_size)
+
+
+def concat_wavs(wav_paths: list[str], output_path: str, extra_args: list[str] = ()):
+    """Concatenate WAV files using ffmpeg's concat demuxer."""
+    fd, list_file = tempfile.mkstemp(suffix=".txt")
+    with os.fdopen(fd, "w") as f:
+        for p in wav_paths:
+            f.write(f"file '{p}'\n")
+
+    try:
+        subprocess.run(
+            ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", list_file,
+             *extra_args,
+             "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE), "-ac", str(NUM_CHANNELS),
+             output_path],
+            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+    finally:
+        os.remove(list_file)
+
+
+def plan(segments: list[dict], durations: list[float | None]) -> list[dict]:
+    """Ordered timeline pieces for segments whose clips have the given durations.
+
+    durations[i] is None for segments with no text (no clip). Each clip is
+    preceded by the gap between its segment's start and the previous
+    segment's end, and a lead-in silence is added when the first segment
+    does not start at zero. Pieces carry their "offset" on the timeline.
+
+    The plan for a prefix of segments is a prefix of the plan for all of
+    them, which is what lets the orchestrator treat audio as final before
+    every window has been rendered.
+    """
+    pieces = []
+    for i, seg in enumerate(segments):
+        if durations[i] is None:
+            continue
+        prev_end = float(segments[i - 1]["end"]) if pieces and i > 0 else 0.0
+        gap = float(seg["start"]) - prev_end
+        if gap > MIN_GAP_SEC:
+            pieces.append({"kind": "silence", "name": f"silence_{i:04d}", "duration": gap})
+        pieces.append({"kind": "clip", "index": i, "duration": durations[i]})
+
+    if segments and float(segments[0]["start"]) > MIN_GAP_SEC and pieces:
+        pieces.insert(0, {"kind": "silence", "name": "silence_lead", "duration": float(segments[0]["start"])})
+
+    offset = 0.0
+    for piece in pieces:
+        piece["offset"] = offset
+        offset += piece["duration"]
+    return pieces
+
+
+def total_duration(pieces: list[dict]) -> float:
+    return pieces[-1]["offset"] + pieces[-1]["duration"] if pieces else 0.0
+
+
+def _piece_paths(pieces: list[dict], job_dir: str, scratch_dir: str) -> list[str]:
+    paths = []
+    for piece in pieces:
+        if piece["kind"] == "clip":
+            paths.append(clip_path(job_dir, piece["index"]))
+        else:
+            path = f"{scratch_dir}/{piece['name']}.wav"
+            if not os.path.exists(path):
+                generate_silence_wav(path, piece["duration"])
+            paths.append(path)
+    return paths
+
+
+def render(pieces: list[dict], job_dir: str, output_path: str):
+    """Concatenate every piece into one WAV (the final dubbed_audio.wav)."""
+    if not pieces:
+        raise RuntimeError("No audio segments were generated — nothing to concatenate.")
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        concat_wavs(_piece_paths(pieces, job_dir, scratch_dir), output_path)
+
+
+def render_range(pieces: list[dict], job_dir: str, output_path: str, start: float,
+                 end: float | None = None, min_duration: float = 0.0):
+    """Write the slice [start, end) of the timeline, padded with silence to min_duration.
+
+    Only the pieces overlapping the slice are read. end=None runs to the end
+    of the timeline.
+    """
+    end = total_duration(pieces) if end is None else end
+    selected = [p for p in pieces if p["offset"] < end and p["offset"] + p["duration"] > start]
+    if not selected:
+        generate_silence_wav(output_path, max(end - start, min_duration))
+        return
+    trim = ["-ss", f"{start - selected[0]['offset']:.6f}", "-t", f"{max(end - start, min_duration):.6f}"]
+    pad = ["-af", f"apad=whole_dur={min_duration:.6f}"] if min_duration > 0 else []
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        concat_wavs(_piece_paths(selected, job_dir, scratch_dir), output_path, [*trim, *pad])
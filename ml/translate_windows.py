@@ -0,0 +1,77 @@
+"""Token-budgeted windows over a transcript for chunked translation.
+
+plan() splits the segment texts into consecutive windows whose estimated
+prompt size stays under a token budget. Each window also carries a few
+segments on either side as read-only context, so pronouns, tense and
+terminology carry across window edges; only the window's own segments
+are translated, and stitching the windows in order rebuilds the
+transcript. RateLimiter paces the concurrent calls against the
+provider's per-minute request and token limits. Stdlib only.
+"""
+import threading
+import time
+from collections import deque
+
+CHARS_PER_TOKEN = 4     # Rough for Latin scripts; overestimates never hurt
+SEGMENT_OVERHEAD = 8    # JSON quoting and separators per segment
+CONTEXT_BEFORE = 3      # Segments of context ahead of each window
+CONTEXT_AFTER = 2       # and after it
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + SEGMENT_OVERHEAD
+
+
+def plan(texts: list[str], max_tokens: int, context_before: int = CONTEXT_BEFORE,
+         context_after: int = CONTEXT_AFTER) -> list[dict]:
+    """Windows {"index", "start", "end", "context_before", "context_after"} tiling texts.
+
+    [start, end) are the segments a window translates; a segment larger
+    than the budget gets a window of its own. Context lists are texts of
+    the neighbouring segments and are not counted against the budget.
+    """
+    windows = []
+    start = 0
+    while start < len(texts):
+        end = start + 1
+        used = estimate_tokens(texts[start])
+        while end < len(texts) and used + estimate_tokens(texts[end]) <= max_tokens:
+            used += estimate_tokens(texts[end])
+            end += 1
+        windows.append({
+            "index": len(windows),
+            "start": start,
+            "end": end,
+            "context_before": texts[max(start - context_before, 0):start],
+            "context_after": texts[end:end + context_after],
+        })
+        start = end
+    return windows
+
+
+class RateLimiter:
+    """Blocks callers so at most requests_per_min calls and tokens_per_min tokens start per minute.
+
+    Limits are per process: every container enforces them on its own.
+    """
+
+    def __init__(self, requests_per_min: int, tokens_per_min: int):
+        self.requests_per_min = requests_per_min
+        self.tokens_per_min = tokens_per_min
+        self._sent = deque()  # (monotonic time, tokens) of calls in the last minute
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int):
+        # A call bigger than the whole budget still goes out, alone
+        tokens = min(tokens, self.tokens_per_min)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._sent and now - self._sent[0][0] >= 60.0:
+                    self._sent.popleft()
+                used = sum(t for _, t in self._sent)
+                if len(self._sent) < self.requests_per_min and used + tokens <= self.tokens_per_min:
+                    self._sent.append((now, tokens))
+                    return
+                wait = 60.0 - (now - self._sent[0][0])
+            time.sleep(max(wait, 0.05))
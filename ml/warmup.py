@@ -0,0 +1,239 @@
+"""Warm GPU containers ahead of the stages that need them.
+
+Two kinds of demand set each Modal function's min_containers:
+
+  pools     a business-hours pool per function, from REDUB_WARM_POOL
+            ("redub-xtts/XTTS=1,redub-musetalk/sync_window=2"),
+            REDUB_WARM_HOURS ("8-20", weekdays) and REDUB_WARM_TZ ("UTC");
+            the orchestrator's refresh_warm_pools schedule applies them
+  jobs      a Warmer asks for containers ahead of a job's stages, timed
+            from historical stage durations so they finish their cold start
+            (image pull, boot, model load) as the stage is due to begin
+
+Demands live in the redub-warm-pool Dict as "demand:{app}/{function}:{job_id}"
+-> {"containers", "expires"}. A function's min_containers is its pool plus
+every live demand, so concurrent jobs add up rather than overwrite each other.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+WARM_DICT = "redub-warm-pool"
+DEMAND_TTL_SEC = 1800     # Demands a crashed run never released lapse after this
+MAX_WARM_CONTAINERS = 8   # Per job and function
+
+# Used until the backend has history for a stage
+DEFAULT_SEC_PER_VIDEO_SEC = {
+    "prepare": 0.1,
+    "mezzanine": 0.5,
+    "transcribe": 0.15,
+    "translate": 0.05,
+    "tts": 0.6,
+    "lipsync": 2.0,
+}
+DEFAULT_COLD_START_SEC = 60.0
+
+
+def _dict():
+    import modal
+
+    return modal.Dict.from_name(WARM_DICT, create_if_missing=True)
+
+
+def pool_config() -> dict[str, int]:
+    """{"app/function": containers} from REDUB_WARM_POOL."""
+    pools = {}
+    for item in os.getenv("REDUB_WARM_POOL", "").split(","):
+        name, _, count = item.strip().partition("=")
+        if name and count.strip().isdigit():
+            pools[name] = int(count)
+    return pools
+
+
+def in_business_hours(now: datetime = None) -> bool:
+    start, _, end = os.getenv("REDUB_WARM_HOURS", "8-20").partition("-")
+    now = now or datetime.now(ZoneInfo(os.getenv("REDUB_WARM_TZ", "UTC")))
+    return now.weekday() < 5 and int(start) <= now.hour < int(end or 24)
+
+
+def _autoscaled(target: str):
+    """The deployed function, or class ("app/ClassName") whose methods share containers, behind target."""
+    import modal
+
+    app_name, _, name = target.partition("/")
+    if name[:1].isupper():
+        return modal.Cls.from_name(app_name, name)()
+    return modal.Function.from_name(app_name, name)
+
+
+def _floor(target: str, demands: dict) -> int:
+    """min_containers target should have: its pool in business hours plus its live demands."""
+    now = time.time()
+    wanted = pool_config().get(target, 0) if in_business_hours() else 0
+    return wanted + sum(
+        d["containers"] for key, d in demands.items()
+        if key.startswith(f"demand:{target}:") and d["expires"] > now
+    )
+
+
+def apply(target: str, demands: dict = None):
+    """Set target's ("app/function" or "app/Class") min_containers to its pool plus its live demands."""
+    if demands is None:
+        demands = dict(_dict().items())
+    wanted = _floor(target, demands)
+    try:
+        _autoscaled(target).update_autoscaler(min_containers=wanted)
+    except Exception as e:
+        print(f"[warn] Could not set {target} min_containers={wanted}: {e}")
+
+
+def request(target: str, job_id: str, containers: int) -> int:
+    """Add job_id's demand for target. Returns the floor target had without it."""
+    d = _dict()
+    key = f"demand:{target}:{job_id}"
+    demands = {k: v for k, v in d.items() if k != key}
+    previous = _floor(target, demands)
+    demands[key] = d[key] = {
+        "containers": min(containers, MAX_WARM_CONTAINERS),
+        "expires": time.time() + DEMAND_TTL_SEC,
+    }
+    apply(target, demands)
+    return previous
+
+
+def release(target: str, job_id: str):
+    d = _dict()
+    d.pop(f"demand:{target}:{job_id}", None)
+    apply(target)
+
+
+def refresh():
+    """Drop lapsed demands and re-apply every pooled or demanded function."""
+    d = _dict()
+    now = time.time()
+    demands = {}
+    for key, value in d.items():
+        if value["expires"] <= now:
+            d.pop(key, None)
+        else:
+            demands[key] = value
+    targets = set(pool_config()) | {key.split(":")[1] for key in demands}
+    for target in sorted(targets):
+        apply(target, demands)
+    return {"targets": sorted(targets), "demands": len(demands), "business_hours": in_business_hours()}
+
+
+class Warmer:
+    """Schedules warm-up demands for one job's downstream stages.
+
+    path lists the job's stages in the order they run. target(stage)
+    returns {"target": "app/function", "containers", "cold_stage"} for a
+    stage worth warming, else None; it is evaluated when the warm-up fires,
+    so it can use what earlier stages learned (video length, segment
+    count). estimates come from the backend's stage history:
+    {stage: {"sec_per_video_sec", "cold_start_sec"}}; they may be set
+    after construction and defaults apply until then.
+
+    A warm-up only counts towards saved_sec() when it raised the target
+    from no kept-warm containers at all; if a pool or another job's demand
+    already held some, the calls would have been warm anyway.
+    """
+
+    def __init__(self, job_id: str, path: list[str], target, estimates: dict = None):
+        self.job_id = job_id
+        self.path = path
+        self.target = target
+        self.estimates = estimates or {}
+        self.video_sec = None
+        self.warmed = {}  # stage -> the target dict it was warmed with
+        self._held = set()  # Warmed stages whose demand is still in place
+        self._timers = {}
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def _duration(self, stage: str) -> float:
+        ratio = (self.estimates.get(stage) or {}).get("sec_per_video_sec") or DEFAULT_SEC_PER_VIDEO_SEC.get(stage, 0.0)
+        return ratio * self.video_sec
+
+    def cold_start_sec(self, cold_stage: str) -> float:
+        return (self.estimates.get(cold_stage) or {}).get("cold_start_sec") or DEFAULT_COLD_START_SEC
+
+    def reached(self, stage: str):
+        """A stage started: release demands of earlier stages and (re)schedule later ones."""
+        if stage not in self.path:
+            return
+        i = self.path.index(stage)
+        with self._lock:
+            for earlier in self.path[:i]:
+                self._cancel(earlier)
+                if earlier in self._held:
+                    self._release(earlier)
+            offset = 0.0
+            for j in range(i + 1, len(self.path)):
+                later = self.path[j]
+                if self.video_sec is None and j > i + 1:
+                    break  # Without the video length only the next stage can be timed: now
+                if self.video_sec is not None:
+                    offset += self._duration(self.path[j - 1])
+                spec = self.target(later)
+                if spec is None or later in self.warmed:
+                    continue
+                delay = max(offset - self.cold_start_sec(spec["cold_stage"]), 0.0)
+                self._cancel(later)
+                timer = threading.Timer(delay, self._warm, [later])
+                timer.daemon = True
+                self._timers[later] = timer
+                timer.start()
+
+    def warm_now(self, *stages: str):
+        """Warm stages off the path right away, e.g. the overlapped stages of a streaming run."""
+        for stage in stages:
+            if stage not in self.warmed:
+                self._warm(stage)
+
+    def _warm(self, stage: str):
+        # Under the lock, so close() either stops this or releases what it requested
+        with self._lock:
+            spec = None if self._closed else self.target(stage)
+            if spec is None:
+                return
+            try:
+                previous = request(spec["target"], self.job_id, spec["containers"])
+                print(f"   [{self.job_id}] Warming {spec['containers']}× {spec['target']} ahead of {stage}"
+                      f"{'' if previous == 0 else f' (already {previous} kept warm)'}")
+                self.warmed[stage] = {**spec, "at": time.time(), "from_cold": previous == 0}
+                self._held.add(stage)
+            except Exception as e:
+                print(f"[warn] [{self.job_id}] Could not warm {spec['target']}: {e}")
+
+    def _cancel(self, stage: str):
+        timer = self._timers.pop(stage, None)
+        if timer is not None:
+            timer.cancel()
+
+    def saved_sec(self, cold_stage: str, started_at: float) -> float | None:
+        """Estimated cold start avoided by a warm call of cold_stage started at started_at, if this run warmed it."""
+        if any(
+            spec["cold_stage"] == cold_stage and spec["at"] <= started_at and spec["from_cold"]
+            for spec in self.warmed.values()
+        ):
+            return self.cold_start_sec(cold_stage)
+        return None
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            for stage in list(self._timers):
+                self._cancel(stage)
+            for stage in list(self._held):
+                self._release(stage)
+
+    def _release(self, stage: str):
+        self._held.discard(stage)
+        target = self.warmed[stage]["target"]
+        try:
+            release(target, self.job_id)
+        except Exception as e:
+            print(f"[warn] [{self.job_id}] Could not release {target}: {e}")